@@ -20,8 +20,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-# Obtener usuario desde el token
-def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+# Obtener usuario desde el token (síncrono: sólo decodifica el JWT y busca en memoria)
+def get_user_from_token(token: str) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token inválido",
@@ -40,9 +40,13 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
         raise credentials_exception
     return user
 
+# Dependencia async: al no bloquear, corre en el event loop en vez de ocupar un hilo del threadpool por solicitud
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+    return get_user_from_token(token)
+
 # Verificar si el rol del usuario es válido para el endpoint
 def require_roles(allowed_roles: List[str]):
-    def role_checker(user: UserInDB = Depends(get_current_user)):
+    async def role_checker(user: UserInDB = Depends(get_current_user)):
         if user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
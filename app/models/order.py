@@ -6,7 +6,8 @@ from typing import List, Optional
 class OrderItem(BaseModel):
     product_id: int
     quantity: int = Field(..., gt=0, description="La cantidad del producto debe ser mayor a 0")
-    # Podrías añadir precio_unitario: float aquí si quieres guardar el precio en el momento de la compra
+    # Precio unitario cobrado, en centavos: lo fija el servidor al crear el pedido (se ignora si el cliente lo envía)
+    unit_price_cents: Optional[int] = None
 
 # Modelo para crear un nuevo pedido (lo que el cliente enviará)
 class OrderCreate(BaseModel):
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+from app.models.order import OrderItem
+
+# Regla de descuento de promoción para un producto
+class PromoRule(BaseModel):
+    percent_off: float = Field(..., gt=0, le=100, description="Porcentaje de descuento sobre el precio unitario")
+    min_quantity: int = Field(1, gt=0, description="Cantidad mínima en la línea para aplicar el descuento")
+
+# Solicitud de cotización de un carrito completo
+class QuoteRequest(BaseModel):
+    items: List[OrderItem]
+    currency: str = Field("CLP", min_length=3, max_length=3, description="Moneda de la cotización (ej. 'CLP', 'USD')")
+
+# Una línea cotizada. Todos los montos están en centavos (enteros) de la moneda cotizada.
+class QuoteLine(BaseModel):
+    product_id: int
+    nombre: str
+    quantity: int
+    list_unit_cents: int     # Precio unitario de lista
+    unit_price_cents: int    # Precio unitario efectivo (con promoción si aplica)
+    discount_cents: int      # Descuento total de la línea
+    line_total_cents: int    # unit_price_cents * quantity
+    promo_applied: bool = False
+
+# Cotización de un carrito completo
+class CartQuote(BaseModel):
+    currency: str
+    lines: List[QuoteLine]
+    subtotal_cents: int      # Suma a precio de lista
+    discount_cents: int      # Suma de descuentos
+    total_cents: int         # subtotal_cents - discount_cents
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+# Resumen de un perfil muestreado de una solicitud (respuesta de /profiles/)
+class ProfileSummary(BaseModel):
+    id: int
+    method: str
+    path: str
+    trigger: str # "header" (X-Profile) o "threshold" (superó el umbral de latencia)
+    started_at: datetime
+    duration_ms: float
+    status_code: int
+    sample_count: int
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+
+# Producto con stock bajo (respuesta de /products/low-stock)
+class LowStockEntry(BaseModel):
+    product_id: int
+    nombre: str
+    stock: int
+    reorder_threshold: int
+
+# Alerta emitida cuando el stock de un producto cruza su umbral de reposición
+class StockAlert(BaseModel):
+    product_id: int
+    nombre: str
+    stock: int
+    reorder_threshold: int
+    raised_at: datetime = Field(default_factory=datetime.utcnow)
+
+# Solicitud para definir el umbral de reposición de un producto
+class ReorderThresholdUpdate(BaseModel):
+    reorder_threshold: int = Field(..., ge=0, description="Se emite una alerta cuando el stock llega a este valor o menos")
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends
+from datetime import date
+
+from app.auth.auth_settings import require_roles
+from app.routes.orders import orders_db, sales_analytics
+from app.services.sales_analytics import SalesAnalytics
+from app.services.executors import cpu_executor
+
+router = APIRouter()
+
+# Roles de gestión que pueden ver los reportes de ventas
+ANALYTICS_ROLES = ["admin", "mantenedor", "service_account"]
+
+@router.get("/summary", summary="Totales de ventas (Requiere Admin/Mantenedor/Service Account)")
+async def get_sales_summary(user=Depends(require_roles(ANALYTICS_ROLES))):
+    return sales_analytics.summary()
+
+@router.get("/products/{product_id}", summary="Unidades e ingresos de un producto")
+async def get_product_sales(product_id: int, user=Depends(require_roles(ANALYTICS_ROLES))):
+    result = sales_analytics.product(product_id)
+    if result is None:
+        return {"product_id": product_id, "units": 0, "revenue_cents": 0}
+    return result
+
+@router.get("/days/{day}", summary="Pedidos, unidades e ingresos de un día")
+async def get_day_sales(day: date, user=Depends(require_roles(ANALYTICS_ROLES))):
+    result = sales_analytics.day(day.isoformat())
+    if result is None:
+        return {"day": day.isoformat(), "orders": 0, "units": 0, "revenue_cents": 0}
+    return result
+
+@router.get("/clients/{username}", summary="Valor de vida (lifetime value) de un cliente")
+async def get_client_sales(username: str, user=Depends(require_roles(ANALYTICS_ROLES))):
+    result = sales_analytics.client(username)
+    if result is None:
+        return {"client_username": username, "orders": 0, "lifetime_value_cents": 0}
+    return result
+
+@router.post("/verify", summary="Recalcular los agregados desde cero y compararlos (Requiere Admin/Service Account)")
+async def verify_sales_analytics(
+    repair: bool = False, # Si es True, reemplaza los agregados incrementales por los recalculados
+    user=Depends(require_roles(["admin", "service_account"]))
+):
+    # Los pedidos se agregan y se suman a la analítica en un mismo paso del event loop: copiando ambos aquí,
+    # sin ceder el loop entre medio, la copia de los agregados corresponde exactamente a estos pedidos
+    orders = list(orders_db)
+    incremental = sales_analytics._copy()
+    rebuilt = await cpu_executor.run(SalesAnalytics.from_orders, orders)
+    differences = sales_analytics.diff(rebuilt, mine=incremental)
+    if differences and repair:
+        # Los pedidos creados mientras se recalculaba se suman antes del reemplazo (sin ceder el loop)
+        for order in orders_db[len(orders):]:
+            rebuilt.record_order(order)
+        sales_analytics.replace_with(rebuilt)
+    return {"consistent": not differences, "repaired": bool(differences) and repair, "differences": differences}
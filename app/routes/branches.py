@@ -13,12 +13,12 @@ branches = [
 ]
 
 @router.get("/", summary="Obtener listado de sucursales") # <--- Cambié el summary a español
-def get_all_branches(user=Depends(require_roles(["admin", "service_account"]))):
+async def get_all_branches(user=Depends(require_roles(["admin", "service_account"]))):
     return branches
 
 # --- ESTE ES EL NUEVO ENDPOINT QUE DEBES AGREGAR ---
 @router.get("/{branch_id}", summary="Obtener una sucursal por ID")
-def get_branch_by_id(branch_id: int):
+async def get_branch_by_id(branch_id: int):
     for branch in branches:
         if branch.id == branch_id:
             return branch
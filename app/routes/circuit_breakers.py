@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Depends
+
+from app.auth.auth_settings import require_roles
+from app.services.circuit_breaker import all_breakers
+
+router = APIRouter()
+
+# Endpoint para monitorear el estado de los circuit breakers de las integraciones externas
+@router.get("/", summary="Estado de los circuit breakers (Requiere Admin/Mantenedor/Service Account)")
+async def get_circuit_breakers(user=Depends(require_roles(["admin", "mantenedor", "service_account"]))):
+    return [breaker.snapshot() for breaker in all_breakers()]
@@ -4,6 +4,7 @@ from app.models.contact import ContactRequest, ContactMessage # Importamos los m
 from app.models.user import UserInDB # Para el tipo del usuario autenticado
 from app.auth.auth_settings import require_roles # Para la autorización
 from app.routes.sellers import get_seller_by_id_from_db # Para verificar si el vendedor existe
+from app.services.journal import store_journal # Para persistir los mensajes entre reinicios
 
 router = APIRouter()
 
@@ -12,8 +13,29 @@ router = APIRouter()
 contact_messages_db: List[ContactMessage] = []
 next_contact_message_id = 1
 
+# --- PERSISTENCIA (JOURNAL Y SNAPSHOTS) ---
+
+def _dump_contact_messages():
+    return {"next_id": next_contact_message_id, "messages": [m.model_dump(mode="json") for m in contact_messages_db]}
+
+def _load_contact_messages(state):
+    global next_contact_message_id
+    contact_messages_db[:] = [ContactMessage(**data) for data in state["messages"]]
+    next_contact_message_id = state["next_id"]
+
+def _after_contact_messages_recovered():
+    global next_contact_message_id
+    # El snapshot puede incluir mensajes que también están en la cola del journal: se deja uno por ID
+    unique = {message.id: message for message in contact_messages_db}
+    contact_messages_db[:] = sorted(unique.values(), key=lambda message: message.id)
+    next_contact_message_id = max([next_contact_message_id] + [m.id + 1 for m in contact_messages_db[-1:]])
+
+store_journal.register_store("contact_messages", _dump_contact_messages, _load_contact_messages)
+store_journal.register_op("contact.put", lambda data: contact_messages_db.append(ContactMessage(**data)))
+store_journal.on_recovered(_after_contact_messages_recovered)
+
 @router.post("/send_message", response_model=ContactMessage, status_code=status.HTTP_201_CREATED, summary="Enviar un mensaje a un vendedor (Requiere Cliente)")
-def send_message_to_seller(
+async def send_message_to_seller(
     contact_data: ContactRequest,
     current_user: UserInDB = Depends(require_roles(["client"])) # Solo clientes pueden enviar mensajes
 ):
@@ -39,13 +61,15 @@ def send_message_to_seller(
     # 3. Añadir el mensaje a nuestra "base de datos" simulada
     contact_messages_db.append(new_message)
     next_contact_message_id += 1
+    lsn = store_journal.append("contact.put", new_message.model_dump(mode="json"), wait=False)
 
     # En un sistema real, aquí se integraría con un sistema de notificación (email, SMS, etc.)
     # para avisarle al vendedor que tiene un nuevo mensaje.
-    
+
+    await store_journal.sync_async(lsn)
     return new_message
 
 # Opcional: Endpoint para ver los mensajes enviados (solo para fines de prueba)
 @router.get("/sent_messages", response_model=List[ContactMessage], summary="Ver mensajes de contacto enviados (Requiere Admin/Service Account)")
-def get_sent_contact_messages(user=Depends(require_roles(["admin", "service_account"]))):
+async def get_sent_contact_messages(user=Depends(require_roles(["admin", "service_account"]))):
     return contact_messages_db
\ No newline at end of file
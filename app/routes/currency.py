@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime
+from typing import Optional
 from app.services.currency_converter import CurrencyConverter # Importamos nuestro servicio
 from app.auth.auth_settings import require_roles # Para autorización, si quieres proteger este endpoint
+from app.services.executors import http_executor
 
 router = APIRouter()
 
@@ -15,10 +18,11 @@ except ValueError as e:
     currency_converter = None # Para evitar errores si la clave no está presente
 
 @router.get("/convert", summary="Convertir monto entre divisas (Requiere Cliente/Público)")
-def convert_currency(
+async def convert_currency(
     amount: float = Query(..., gt=0, description="Monto a convertir"),
     from_currency: str = Query(..., min_length=3, max_length=3, description="Moneda de origen (ej. 'USD', 'CLP')"),
     to_currency: str = Query(..., min_length=3, max_length=3, description="Moneda de destino (ej. 'CLP', 'USD')"),
+    as_of: Optional[datetime] = Query(None, description="Convertir con las tasas vigentes en esta fecha (ISO 8601)"),
     # Puedes elegir si este endpoint requiere autenticación o es público
     # user=Depends(require_roles(["client"])) # Descomentar para proteger
 ):
@@ -29,7 +33,8 @@ def convert_currency(
         )
 
     try:
-        converted_amount = currency_converter.convert(amount, from_currency, to_currency)
+        # Puede llamar a la API de tasas: se ejecuta en el executor HTTP
+        converted_amount = await http_executor.run(currency_converter.convert, amount, from_currency, to_currency, as_of=as_of)
         
         if converted_amount is None:
             raise HTTPException(
@@ -41,7 +46,8 @@ def convert_currency(
             "amount": amount,
             "from_currency": from_currency.upper(),
             "to_currency": to_currency.upper(),
-            "converted_amount": converted_amount
+            "converted_amount": converted_amount,
+            "as_of": as_of
         }
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Depends
+
+from app.auth.auth_settings import require_roles
+from app.services.executors import all_executors
+
+router = APIRouter()
+
+# Endpoint para monitorear la espera en cola y la saturación de los executors de trabajo bloqueante
+@router.get("/", summary="Estado de los executors (bcrypt, http, disk) (Requiere Admin/Mantenedor/Service Account)")
+async def get_executors(user=Depends(require_roles(["admin", "mantenedor", "service_account"]))):
+    return [executor.snapshot() for executor in all_executors()]
@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import Optional
+
+from app.auth.auth_settings import require_roles
+from app.routes.orders import orders_db
+from app.routes.payments import stripe_service
+from app.services.executors import disk_executor
+from app.services.exporter import (
+    ORDER_COLUMNS, PAYMENT_COLUMNS, InvalidCursorError, chunked, decode_cursor, limited, order_rows,
+    payment_rows, stream_chunks, to_csv, to_ndjson, validate_order_cursor, validate_payment_cursor,
+)
+
+router = APIRouter()
+
+# Roles de finanzas/integraciones que pueden descargar las exportaciones completas
+EXPORT_ROLES = ["mantenedor", "service_account"]
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def _export_response(rows, columns, fmt: str, name: str, executor=None) -> StreamingResponse:
+    lines = to_csv(rows, columns) if fmt == "csv" else to_ndjson(rows)
+    return StreamingResponse(
+        stream_chunks(chunked(lines), executor),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"', "X-Accel-Buffering": "no"}
+    )
+
+# Cada fila incluye un cursor: si la descarga se corta, se reanuda con ?cursor=<último cursor recibido>
+@router.get("/orders", summary="Exportar pedidos en streaming, CSV o NDJSON (Requiere Mantenedor/Service Account)")
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$", description="Formato de salida"),
+    since: Optional[datetime] = Query(None, description="Sólo pedidos desde esta fecha, inclusive (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Sólo pedidos antes de esta fecha (ISO 8601)"),
+    cursor: Optional[str] = Query(None, description="Reanudar después de la fila con este cursor"),
+    limit: Optional[int] = Query(None, gt=0, description="Máximo de filas (sin límite por defecto)"),
+    user=Depends(require_roles(EXPORT_ROLES))
+):
+    try:
+        state = decode_cursor(cursor, ["id"])
+        validate_order_cursor(state)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Los pedidos están en memoria: la exportación se produce en el event loop
+    return _export_response(limited(order_rows(orders_db, since, until, state), limit), ORDER_COLUMNS, format, "orders")
+
+@router.get("/payments", summary="Exportar pagos (archivados y en memoria) en streaming, CSV o NDJSON (Requiere Mantenedor/Service Account)")
+async def export_payments(
+    format: str = Query("ndjson", pattern="^(csv|ndjson)$", description="Formato de salida"),
+    since: Optional[datetime] = Query(None, description="Sólo pagos creados desde esta fecha, inclusive (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Sólo pagos creados antes de esta fecha (ISO 8601)"),
+    cursor: Optional[str] = Query(None, description="Reanudar después de la fila con este cursor"),
+    limit: Optional[int] = Query(None, gt=0, description="Máximo de filas (sin límite por defecto)"),
+    user=Depends(require_roles(EXPORT_ROLES))
+):
+    if not stripe_service:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de pago no disponible."
+        )
+    store = stripe_service.payment_records
+    try:
+        state = decode_cursor(cursor, ["store", "offset", "after_id"])
+        await disk_executor.run(validate_payment_cursor, store, state)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Los pagos archivados se leen desde disco: los trozos se producen en el executor de disco
+    rows = limited(payment_rows(store, since, until, state), limit)
+    return _export_response(rows, PAYMENT_COLUMNS, format, "payments", disk_executor)
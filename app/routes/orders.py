@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Response, Query
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
 from app.models.order import Order, OrderCreate, OrderItem # Importamos los modelos de Order
+from app.models.pricing import QuoteRequest, CartQuote
 from app.models.user import UserInDB # Para el tipo del usuario autenticado
 from app.auth.auth_settings import require_roles # Para la autorización
-from app.routes.products import get_product_by_id_from_db, update_product_stock # Para acceder a los productos y su stock
+from app.routes.products import get_product_by_id_from_db, update_products_stock, current_stock, sync_shared_catalog, pricing_engine # Para acceder a los productos, su stock y sus precios
+from app.routes.currency import currency_converter
+from app.services.pricing_engine import UnknownProductError, BASE_CURRENCY
+from app.services.idempotency import IdempotencyCache, IdempotencyConflictError
+from app.services.journal import store_journal
+from app.services.sales_analytics import SalesAnalytics
+from app.services.executors import http_executor
 
 router = APIRouter()
 
@@ -11,11 +19,123 @@ router = APIRouter()
 orders_db: List[Order] = []
 next_order_id = 1
 
+# --- PERSISTENCIA (JOURNAL Y SNAPSHOTS) ---
+# Los pedidos se guardan como filas posicionales compactas:
+# [id, user_id, [[product_id, quantity, precio unitario en centavos], ...], total, fecha epoch, status]
+
+def _order_to_row(order: Order) -> list:
+    return [
+        order.id, order.user_id, [[item.product_id, item.quantity, item.unit_price_cents] for item in order.items],
+        order.total_amount, order.order_date.replace(tzinfo=timezone.utc).timestamp(), order.status
+    ]
+
+def _order_from_row(row: list) -> Order:
+    # model_construct evita revalidar datos que ya fueron validados al crear el pedido
+    order_id, user_id, items, total_amount, order_ts, order_status = row
+    return Order.model_construct(
+        id=order_id,
+        user_id=user_id,
+        # Las filas anteriores al precio por línea traen sólo [product_id, quantity]
+        items=[
+            OrderItem.model_construct(product_id=item[0], quantity=item[1], unit_price_cents=item[2] if len(item) > 2 else None)
+            for item in items
+        ],
+        total_amount=total_amount,
+        order_date=datetime.fromtimestamp(order_ts, timezone.utc).replace(tzinfo=None), # order_date es UTC sin zona
+        status=order_status
+    )
+
+def _dump_orders():
+    return {"next_id": next_order_id, "orders": [_order_to_row(order) for order in orders_db]}
+
+def _load_orders(state):
+    global next_order_id
+    orders_db[:] = [_order_from_row(row) for row in state["orders"]]
+    next_order_id = state["next_id"]
+
+def _after_orders_recovered():
+    global next_order_id
+    # El snapshot puede incluir pedidos que también están en la cola del journal: se deja uno por ID
+    unique = {order.id: order for order in orders_db}
+    orders_db[:] = sorted(unique.values(), key=lambda order: order.id)
+    next_order_id = max([next_order_id] + [order.id + 1 for order in orders_db[-1:]])
+    _backfill_unit_prices()
+
+def _backfill_unit_prices():
+    # Pedidos guardados antes de registrar el precio por línea: se les fija una única vez el precio de la
+    # tabla actual, que queda guardado en el próximo snapshot y ya no cambia con las reglas de promoción
+    for order in orders_db:
+        if all(item.unit_price_cents is not None for item in order.items):
+            continue
+        try:
+            lines = pricing_engine.quote(order.items).lines
+        except UnknownProductError as e:
+            print(f"Advertencia: no se pudo fijar el precio de las líneas del pedido {order.id}: {e}")
+            continue
+        for item, line in zip(order.items, lines):
+            if item.unit_price_cents is None:
+                item.unit_price_cents = line.unit_price_cents
+
+# Agregados de ventas actualizados con cada pedido (ver app/routes/analytics.py)
+sales_analytics = SalesAnalytics()
+
+store_journal.register_store("orders", _dump_orders, _load_orders)
+store_journal.register_op("order.put", lambda row: orders_db.append(_order_from_row(row)))
+store_journal.on_recovered(_after_orders_recovered)
+store_journal.on_recovered(lambda: sales_analytics.rebuild(orders_db))
+
+# Respuestas ya entregadas por clave de idempotencia (reintentos de clientes móviles)
+order_idempotency = IdempotencyCache()
+
+@router.post("/quote", response_model=CartQuote, summary="Cotizar un carrito completo (montos en centavos)")
+async def quote_cart(quote_data: QuoteRequest):
+    currency = quote_data.currency.upper()
+    # Si la moneda aún no tiene variante, intentamos cargar las tasas de cambio una vez
+    if not pricing_engine.supports(currency) and currency_converter:
+        rates = await http_executor.run(currency_converter.get_exchange_rates)
+        if rates:
+            pricing_engine.set_exchange_rates(rates)
+
+    sync_shared_catalog() # Productos y reglas publicados por los otros workers
+    try:
+        return pricing_engine.quote(quote_data.items, currency).to_model()
+    except UnknownProductError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
 @router.post("/", response_model=Order, status_code=status.HTTP_201_CREATED, summary="Realizar un pedido (Requiere Cliente)")
-def create_order(
+async def create_order(
     order_data: OrderCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255, description="Clave para reintentos seguros: el mismo valor devuelve el mismo pedido"),
     current_user: UserInDB = Depends(require_roles(["client"])) # Solo clientes pueden hacer pedidos
 ):
+    if not idempotency_key:
+        new_order, lsn = _place_order(order_data, current_user)
+    else:
+        # La clave se limita al usuario para que dos clientes no compartan respuestas.
+        # _place_order no cede el event loop, así que aquí nunca hay un duplicado en curso que esperar.
+        try:
+            (new_order, lsn), replayed = order_idempotency.run(
+                f"{current_user.username}:{idempotency_key}",
+                order_data.model_dump_json(),
+                lambda: _place_order(order_data, current_user)
+            )
+        except IdempotencyConflictError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+
+    # Se responde cuando el pedido y sus descuentos de stock están en disco, sin bloquear el event loop
+    await store_journal.sync_async(lsn)
+    return new_order
+
+def _place_order(order_data: OrderCreate, current_user: UserInDB) -> Tuple[Order, int]:
+    """
+    Crea el pedido en memoria y lo registra en el journal sin esperar el fsync.
+    Devuelve el pedido y el LSN que el llamador debe esperar.
+    """
     global next_order_id
 
     # Para el requerimiento de "pedido monoproducto", asumimos que la lista 'items' solo contendrá un elemento.
@@ -23,9 +143,17 @@ def create_order(
     if not order_data.items:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El pedido debe contener al menos un producto.")
 
-    total_amount = 0.0
-    processed_items: List[OrderItem] = []
+    sync_shared_catalog() # Productos y reglas publicados por los otros workers
+
+    # Cotizamos el carrito completo de una vez con el motor de precios (incluye promociones)
+    try:
+        quote = pricing_engine.quote(order_data.items)
+    except UnknownProductError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
+    # Primero se verifican todas las líneas (un producto puede repetirse en varias) y sólo después se descuenta:
+    # una línea sin stock no deja aplicados los descuentos de las anteriores
+    quantities: Dict[int, int] = {}
     for item in order_data.items:
         product = get_product_by_id_from_db(item.product_id)
         if not product:
@@ -33,35 +161,75 @@ def create_order(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Producto con ID {item.product_id} no encontrado."
             )
-        
-        if product.stock < item.quantity:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        stock = current_stock(product)
+        if stock < quantities[item.product_id]:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Stock insuficiente para el producto '{product.nombre}'. Stock disponible: {product.stock}"
+                detail=f"Stock insuficiente para el producto '{product.nombre}'. Stock disponible: {stock}"
             )
-        
-        # Calcular el subtotal para este ítem
-        item_subtotal = product.precio * item.quantity
-        total_amount += item_subtotal
-        
-        # Reducir el stock del producto
-        if not update_product_stock(item.product_id, -item.quantity):
-            # Esto debería ser manejado por la verificación de stock anterior, pero es un fallback seguro
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al actualizar el stock del producto.")
-            
-        processed_items.append(item) # Añadimos el item procesado a la lista final
+
+    # Reducir el stock de todas las líneas de una vez (todas o ninguna)
+    if not update_products_stock({product_id: -quantity for product_id, quantity in quantities.items()}):
+        # Con varios workers otro pudo vender el mismo stock entre la verificación y el descuento
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El stock cambió mientras se procesaba el pedido. Intente nuevamente.")
+
+    # Se guarda el precio unitario cobrado: los reportes no dependen de los precios futuros
+    processed_items: List[OrderItem] = [
+        OrderItem(product_id=item.product_id, quantity=item.quantity, unit_price_cents=line.unit_price_cents)
+        for item, line in zip(order_data.items, quote.lines)
+    ]
 
     # Crear el objeto de pedido
     new_order = Order(
         id=next_order_id,
         user_id=current_user.username, # Asignamos el username del cliente que hizo el pedido
         items=processed_items,
-        total_amount=round(total_amount, 2), # Redondeamos a 2 decimales para dinero
+        total_amount=quote.total, # El motor trabaja en centavos enteros, así que ya está redondeado
         status="pending" # Estado inicial
     )
 
     # Añadir el pedido a nuestra "base de datos" simulada
     orders_db.append(new_order)
     next_order_id += 1
+    sales_analytics.record_order(new_order)
+    lsn = store_journal.append("order.put", _order_to_row(new_order), wait=False)
+
+    return new_order, lsn
+
+# Endpoint para convertir el total de un pedido con las tasas vigentes en su fecha de creación
+@router.get("/{order_id}/total", summary="Total de un pedido convertido a otra moneda según la tasa de su fecha")
+async def get_order_total(
+    order_id: int,
+    currency: str = Query(..., min_length=3, max_length=3, description="Moneda de destino (ej. 'USD')"),
+    current_user: UserInDB = Depends(require_roles(["client", "admin", "service_account"]))
+):
+    order = next((o for o in orders_db if o.id == order_id), None)
+    # Un cliente sólo puede ver sus propios pedidos
+    if not order or (current_user.role == "client" and order.user_id != current_user.username):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Pedido con ID {order_id} no encontrado.")
+
+    if not currency_converter:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de conversión de divisas no disponible debido a configuración faltante."
+        )
+
+    try:
+        converted_amount = await http_executor.run(currency_converter.convert, order.total_amount, BASE_CURRENCY, currency, as_of=order.order_date)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if converted_amount is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No hay tasas de cambio disponibles para la fecha del pedido."
+        )
 
-    return new_order
\ No newline at end of file
+    return {
+        "order_id": order.id,
+        "order_date": order.order_date,
+        "amount": order.total_amount,
+        "from_currency": BASE_CURRENCY,
+        "to_currency": currency.upper(),
+        "converted_amount": converted_amount
+    }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query # <--- ¡AQUÍ! Añadir Query
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query, Header # <--- ¡AQUÍ! Añadir Query
 from fastapi.responses import RedirectResponse, HTMLResponse
 from typing import Optional, List, Dict, Any
 import json
@@ -6,6 +6,10 @@ import json
 from app.services.stripe_service import StripeService
 from app.models.payment import CreateCheckoutSessionRequest, PaymentRecord
 from app.auth.auth_settings import require_roles
+from app.services.idempotency import IdempotencyCache, IdempotencyConflictError
+from app.services.payment_reconciler import PaymentReconciler
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.executors import http_executor, disk_executor
 
 router = APIRouter()
 
@@ -17,10 +21,18 @@ except ValueError as e:
     print(f"ERROR: No se pudo inicializar StripeService: {e}")
     stripe_service = None # Para evitar que la aplicación falle si las claves no están
 
+# Job de conciliación de pagos pendientes contra Stripe (se inicia desde main.py)
+payment_reconciler = PaymentReconciler(stripe_service) if stripe_service else None
+
+# Sesiones de checkout ya creadas por clave de idempotencia, para no duplicar pagos en reintentos
+checkout_idempotency = IdempotencyCache()
+
 # Endpoint para crear una sesión de checkout de Stripe
 @router.post("/create-checkout-session", summary="Crear una sesión de checkout de Stripe (Requiere Cliente)")
 async def create_checkout_session(
     request_data: CreateCheckoutSessionRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255, description="Clave para reintentos seguros: el mismo valor devuelve la misma sesión"),
     user=Depends(require_roles(["client"])) # Solo clientes autenticados pueden crear sesiones de pago
 ):
     if not stripe_service:
@@ -33,19 +45,44 @@ async def create_checkout_session(
     # 1. Crear la orden en tu DB con estado "pendiente_pago".
     # 2. Asignar un ID de orden real a `request_data.order_id` si aún no lo tiene.
 
-    checkout_url = stripe_service.create_checkout_session(
-        items=request_data.items,
-        client_username=request_data.client_username,
-        order_id=request_data.order_id
-    )
+    def create_session() -> Dict[str, str]:
+        try:
+            checkout_url = stripe_service.create_checkout_session(
+                items=request_data.items,
+                client_username=request_data.client_username,
+                order_id=request_data.order_id
+            )
+        except CircuitOpenError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": str(max(1, int(e.retry_after)))}
+            )
+
+        if checkout_url:
+            return {"checkout_url": checkout_url}
 
-    if checkout_url:
-        return {"checkout_url": checkout_url}
-    
-    raise HTTPException(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        detail="No se pudo crear la sesión de checkout de Stripe."
-    )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="No se pudo crear la sesión de checkout de Stripe."
+        )
+
+    # La llamada a Stripe bloquea: se ejecuta en el executor HTTP, no en el event loop
+    if not idempotency_key:
+        return await http_executor.run(create_session)
+
+    # Sólo la primera solicitud ocupa un hilo del executor HTTP; los duplicados concurrentes esperan en el event loop
+    try:
+        result, replayed = await checkout_idempotency.run_async(
+            f"{user.username}:{idempotency_key}",
+            request_data.model_dump_json(),
+            lambda: http_executor.run(create_session)
+        )
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
 # Endpoint para manejar el éxito del pago
 # Stripe redirigirá al cliente a esta URL
@@ -57,14 +94,28 @@ async def payment_success(session_id: str = Query(...)): # <--- AQUÍ se usa Que
 
     # En un sistema real, podrías consultar el estado de la sesión si no confías solo en el webhook
     # (aunque el webhook es la forma más fiable de confirmación).
-    payment_record = stripe_service.get_payment_record_by_session_id(session_id)
+    if not stripe_service:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de pago no disponible."
+        )
+
+    # Si el registro sigue pendiente (ej. el webhook aún no llega o se perdió), consultamos a Stripe directamente
+    try:
+        payment_record = await http_executor.run(payment_reconciler.reconcile_session, session_id)
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
     
-    if payment_record and payment_record.get("status") == "paid":
+    if payment_record and payment_record.status == "paid":
         return HTMLResponse(f"""
             <h1>¡Pago exitoso! 🎉</h1>
             <p>Gracias por tu compra.</p>
             <p>ID de Sesión de Stripe: {session_id}</p>
-            <p>El estado del pago es: {payment_record.get('status').upper()}</p>
+            <p>El estado del pago es: {payment_record.status.upper()}</p>
             <p>Un email de confirmación ha sido enviado.</p>
             <a href="/">Volver al inicio</a>
         """)
@@ -113,10 +164,35 @@ async def stripe_webhook(request: Request):
 
 # Endpoint opcional para ver los registros de pago simulados (solo para desarrollo/debugging)
 @router.get("/records", summary="Obtener registros de pagos simulados (Solo para desarrollo)", response_model=List[Dict[str, Any]])
-async def get_payment_records():
+async def get_payment_records(include_archived: bool = Query(False, description="Incluir también los registros archivados en disco")):
     if not stripe_service:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Servicio de pago no disponible."
         )
-    return stripe_service.payment_records
\ No newline at end of file
+    records = [record.to_dict() for record in stripe_service.payment_records]
+    if include_archived:
+        # El archivo de pagos archivados se lee desde disco
+        archived = await disk_executor.run(lambda: [record.to_dict() for record in stripe_service.payment_records.iter_archived()])
+        records = archived + records
+    return records
+
+# Endpoint para forzar una pasada de conciliación de pagos pendientes
+@router.post("/reconcile", summary="Conciliar pagos pendientes contra Stripe (Requiere Admin/Service Account)")
+async def reconcile_payments(user=Depends(require_roles(["admin", "service_account"]))):
+    if not payment_reconciler:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de pago no disponible."
+        )
+    return await http_executor.run(payment_reconciler.run_once)
+
+# Endpoint para ver las métricas (throughput y lag) del job de conciliación
+@router.get("/reconcile/stats", summary="Métricas de la conciliación de pagos (Requiere Admin/Service Account)")
+async def get_reconcile_stats(user=Depends(require_roles(["admin", "service_account"]))):
+    if not payment_reconciler:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio de pago no disponible."
+        )
+    return payment_reconciler.stats
@@ -1,7 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Header, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Literal, Dict
+import threading
 from app.models.product import Product, ProductCreate
+from app.models.pricing import PromoRule
+from app.models.stock import LowStockEntry, StockAlert, ReorderThresholdUpdate
 from app.auth.auth_settings import require_roles
+from app.services.pricing_engine import PricingEngine
+from app.services.journal import store_journal
+from app.services.stock_monitor import StockMonitor, default_alert_dispatcher
+from app.services.catalog_events import CatalogBroadcaster
+from app.services.columnar_catalog import ColumnarCatalog
+from app.services.shared_catalog import shared_catalog_from_env
 
 router = APIRouter()
 
@@ -18,6 +28,31 @@ products_db: List[Product] = [
 # Asegura que el ID sea mayor que cualquier ID existente
 next_product_id = max([p.id for p in products_db]) + 1 if products_db else 1
 
+# Motor de precios con la tabla precomputada del catálogo (usado por pedidos y pagos)
+pricing_engine = PricingEngine(products_db)
+
+# Índice de stock bajo y alertas de reposición (se actualiza en cada cambio de stock)
+stock_monitor = StockMonitor(products_db, dispatcher=default_alert_dispatcher())
+
+# Difusión de cambios del catálogo a los clientes conectados a /products/stream
+catalog_events = CatalogBroadcaster()
+
+# Copia columnar del catálogo para filtrar y ordenar GET /products/ (products_db sigue siendo la fuente de verdad).
+# Con varios workers (CATALOG_SHARED_DIR definido), es un catálogo compartido en memoria mapeada donde los cambios
+# se publican como generaciones nuevas; si no, cada proceso usa su índice local.
+# Con el catálogo compartido, los IDs se reservan entre todos los workers, el stock se lee y descuenta ahí,
+# y cada worker trae a products_db y a su motor de precios los productos y reglas que publican los demás
+# (sync_shared_catalog) antes de cotizar, vender o modificar el catálogo
+shared_catalog = shared_catalog_from_env()
+catalog_index = shared_catalog if shared_catalog is not None else ColumnarCatalog(products_db)
+
+# Serializa las actualizaciones de stock para que el orden en el journal coincida con el orden en memoria
+_stock_lock = threading.Lock()
+
+# Última generación del catálogo compartido ya traída a products_db
+_synced_generation = 0
+_sync_lock = threading.Lock()
+
 # --- FUNCIONES AUXILIARES PARA GESTIÓN DE PRODUCTOS (ACCESIBLES DESDE OTROS MÓDULOS) ---
 
 def get_product_by_id_from_db(product_id: int) -> Optional[Product]:
@@ -29,60 +64,257 @@ def get_product_by_id_from_db(product_id: int) -> Optional[Product]:
             return product
     return None
 
+def current_stock(product: Product) -> int:
+    """
+    Stock vigente de un producto: con el catálogo compartido incluye las ventas y reposiciones de los otros workers.
+    """
+    if shared_catalog is not None:
+        stock = shared_catalog.stock(product.id)
+        if stock is not None:
+            return stock
+    return product.stock
+
+def _index_product(product: Product):
+    # Con el catálogo compartido el producto se publica junto a su regla específica, para que los demás workers la coticen igual
+    if shared_catalog is not None:
+        shared_catalog.upsert(product, pricing_engine.promo_rule(product.id))
+    else:
+        catalog_index.upsert(product)
+
+_SYNCED_FIELDS = ("nombre", "descripcion", "precio", "modelo", "marca", "codigo", "isPromo", "isNew")
+
+def sync_shared_catalog():
+    """
+    Trae a products_db, al motor de precios y al monitor de stock las altas, cambios y reglas de promoción
+    que otros workers publicaron en el catálogo compartido, y los registra en el journal de este worker.
+    No hace nada si no hay catálogo compartido o si no hay generaciones nuevas.
+    """
+    global _synced_generation, next_product_id
+    if shared_catalog is None:
+        return
+    snapshot = shared_catalog.current()
+    if snapshot is None or snapshot.generation == _synced_generation:
+        return
+    with _sync_lock:
+        if snapshot.generation <= _synced_generation:
+            return
+        changed = snapshot.changed_since(_synced_generation)
+        if changed is None:
+            # Primera sincronización o registro de cambios ya recortado: se compara el catálogo completo
+            changed = snapshot.product_ids()
+            local = {p.id: p for p in products_db}
+            find = local.get
+        else:
+            find = get_product_by_id_from_db
+        for product_id in changed:
+            if shared_catalog.is_pending(product_id):
+                continue # Este worker tiene un cambio más nuevo que todavía no publica
+            published = snapshot.get(product_id)
+            rule = snapshot.promo_rule(product_id)
+            product = find(product_id)
+            if product is None:
+                product = published
+                products_db.append(product)
+            elif all(getattr(product, field) == getattr(published, field) for field in _SYNCED_FIELDS) and pricing_engine.promo_rule(product_id) == rule:
+                continue
+            else:
+                for field in _SYNCED_FIELDS:
+                    setattr(product, field, getattr(published, field))
+                product.stock = published.stock
+            pricing_engine.put_promo_rule(product_id, rule)
+            pricing_engine.upsert_product(product)
+            stock_monitor.record(product)
+            store_journal.append("product.put", product.model_dump(), wait=False)
+            store_journal.append("promo.set", [product_id, rule.model_dump() if rule is not None else None], wait=False)
+            next_product_id = max(next_product_id, product_id + 1)
+        _synced_generation = snapshot.generation
+
+def start_shared_catalog():
+    """
+    Al arrancar: publica el catálogo recuperado si este es el primer worker, o trae el que ya publicaron los demás.
+    """
+    global _synced_generation
+    if shared_catalog is None:
+        return
+    if shared_catalog.rebuild(products_db, pricing_engine.promo_rules()):
+        _synced_generation = shared_catalog.generation
+    else:
+        sync_shared_catalog()
+
+def update_products_stock(changes: Dict[int, int]) -> bool:
+    """
+    Actualiza el stock de varios productos a la vez ({product_id: cambio}): se aplican todos los cambios o ninguno.
+    Cada cambio puede ser positivo (añadir stock) o negativo (reducir stock).
+    Devuelve True si el stock se actualizó con éxito, False en caso contrario (ej. stock insuficiente en alguna línea).
+    No espera el fsync del journal (se llama desde el event loop): el llamador debe esperar un LSN
+    posterior con `await store_journal.sync_async(lsn)`, que espera en el executor de disco.
+    """
+    products = {product_id: get_product_by_id_from_db(product_id) for product_id in changes}
+    if any(product is None for product in products.values()):
+        return False
+    with _stock_lock:
+        if shared_catalog is not None:
+            # El stock vigente es el del catálogo compartido (incluye las ventas de los otros workers);
+            # la verificación y el descuento de todas las líneas son atómicos entre workers
+            new_stocks = shared_catalog.adjust_stocks(changes)
+            if new_stocks is None:
+                return False
+        else:
+            new_stocks = {product_id: products[product_id].stock + change for product_id, change in changes.items()}
+            if any(stock < 0 for stock in new_stocks.values()):
+                return False
+            for product_id, change in changes.items():
+                catalog_index.adjust_stock(product_id, change)
+        for product_id, new_stock in new_stocks.items():
+            products[product_id].stock = new_stock
+        for product_id, new_stock in new_stocks.items():
+            # Se registra el valor absoluto para que reaplicarlo sea idempotente
+            store_journal.append("stock.set", [product_id, new_stock], wait=False)
+            stock_monitor.record(products[product_id])
+            catalog_events.publish("stock", product_id, {"product_id": product_id, "stock": new_stock})
+    return True
+
 def update_product_stock(product_id: int, quantity_change: int) -> bool:
     """
-    Actualiza el stock de un producto.
-    quantity_change puede ser positivo (añadir stock) o negativo (reducir stock).
-    Devuelve True si el stock se actualizó con éxito, False en caso contrario (ej. stock insuficiente).
+    Actualiza el stock de un producto (ver update_products_stock).
     """
+    return update_products_stock({product_id: quantity_change})
+
+# --- PERSISTENCIA (JOURNAL Y SNAPSHOTS) ---
+
+def _dump_products():
+    return {
+        "next_id": next_product_id,
+        "products": [p.model_dump() for p in products_db],
+        "promo_rules": [[product_id, rule.model_dump()] for product_id, rule in pricing_engine.promo_rules().items()],
+        "reorder_thresholds": [[product_id, threshold] for product_id, threshold in stock_monitor.thresholds().items()],
+    }
+
+def _load_products(state):
+    global next_product_id
+    products_db[:] = [Product(**data) for data in state["products"]] # En su lugar: otros módulos guardan la referencia
+    next_product_id = state["next_id"]
+    # Los snapshots anteriores a las reglas de promoción no traen la clave
+    pricing_engine.load_promo_rules({product_id: PromoRule(**rule) for product_id, rule in state.get("promo_rules", [])})
+    stock_monitor.load_thresholds({product_id: threshold for product_id, threshold in state.get("reorder_thresholds", [])})
+
+def _replay_product_put(data):
+    product = Product(**data)
+    for i, existing in enumerate(products_db):
+        if existing.id == product.id:
+            products_db[i] = product
+            return
+    products_db.append(product)
+
+def _replay_stock_set(payload):
+    product_id, stock = payload
     product = get_product_by_id_from_db(product_id)
     if product:
-        new_stock = product.stock + quantity_change
-        if new_stock >= 0:
-            product.stock = new_stock
-            return True
-    return False
+        product.stock = stock
+
+def _replay_promo_set(payload):
+    product_id, rule = payload
+    pricing_engine.put_promo_rule(product_id, PromoRule(**rule) if rule is not None else None)
+
+def _replay_threshold_set(payload):
+    product_id, threshold = payload
+    stock_monitor.put_threshold(product_id, threshold)
+
+def _after_products_recovered():
+    global next_product_id
+    next_product_id = max([next_product_id] + [p.id + 1 for p in products_db])
+    pricing_engine.rebuild()
+    stock_monitor.rebuild(products_db)
+    # El catálogo compartido se publica (o se sincroniza) en start_shared_catalog()
+    if shared_catalog is None:
+        catalog_index.rebuild(products_db)
+
+store_journal.register_store("products", _dump_products, _load_products)
+store_journal.register_op("product.put", _replay_product_put)
+store_journal.register_op("stock.set", _replay_stock_set)
+store_journal.register_op("promo.set", _replay_promo_set)
+store_journal.register_op("threshold.set", _replay_threshold_set)
+store_journal.on_recovered(_after_products_recovered)
 
 # --- ENDPOINTS DE LA API ---
 
-# Endpoint para obtener el catálogo de productos con filtros de promoción y novedad
-@router.get("/", response_model=List[Product], summary="Obtener catálogo de productos (con filtros de promoción y novedad)")
-def get_products(
+# Endpoint para obtener el catálogo de productos con filtros, orden y paginación
+@router.get("/", response_model=List[Product], summary="Obtener catálogo de productos (con filtros, orden y paginación)")
+async def get_products(
+    response: Response,
     promo: Optional[bool] = Query(None, description="Filtrar sólo productos en promoción"),
-    new: Optional[bool] = Query(None, description="Filtrar sólo productos nuevos")
+    new: Optional[bool] = Query(None, description="Filtrar sólo productos nuevos"),
+    min_price: Optional[float] = Query(None, ge=0, description="Precio mínimo"),
+    max_price: Optional[float] = Query(None, ge=0, description="Precio máximo"),
+    in_stock: Optional[bool] = Query(None, description="Filtrar por disponibilidad (stock > 0)"),
+    marca: Optional[str] = Query(None, description="Filtrar por marca (sin distinguir mayúsculas)"),
+    sort_by: Optional[Literal["precio", "stock"]] = Query(None, description="Campo por el cual ordenar"),
+    order: Literal["asc", "desc"] = Query("asc", description="Dirección del orden"),
+    offset: int = Query(0, ge=0, description="Cantidad de productos a omitir"),
+    limit: Optional[int] = Query(None, gt=0, le=1000, description="Máximo de productos a devolver (sin límite por defecto)")
 ):
     """
     Obtiene el catálogo de productos.
     - Si `promo=true`, devuelve sólo los productos con isPromo=True.
     - Si `new=true`, devuelve sólo los productos con isNew=True.
-    - Si se combinan ambos, devuelve los que cumplan ambas condiciones.
+    - `min_price`, `max_price`, `in_stock` y `marca` se combinan con los filtros anteriores.
+    - `sort_by` y `order` ordenan el resultado; `offset` y `limit` lo paginan.
     - Sin parámetros, devuelve todos los productos.
+    El total de coincidencias (antes de paginar) se informa en la cabecera X-Total-Count.
     """
-    results = products_db # Ahora trabajamos directamente con la lista de objetos Product
+    total, results = catalog_index.query(
+        promo=promo, new=new, min_price=min_price, max_price=max_price, in_stock=in_stock, marca=marca,
+        sort_by=sort_by, descending=order == "desc", offset=offset, limit=limit
+    )
+    response.headers["X-Total-Count"] = str(total)
+    return results
 
-    if promo is not None:
-        results = [p for p in results if p.isPromo == promo] # Acceso a atributo .isPromo
-    if new is not None:
-        results = [p for p in results if p.isNew == new]     # Acceso a atributo .isNew
+# Endpoint para obtener los productos con menos stock (debe declararse antes de /{product_id})
+@router.get("/low-stock", response_model=List[LowStockEntry], summary="Obtener los k productos con menos stock")
+async def get_low_stock_products(k: int = Query(10, gt=0, le=1000, description="Cantidad de productos a devolver")):
+    return [
+        LowStockEntry(product_id=product_id, nombre=nombre, stock=stock, reorder_threshold=threshold)
+        for product_id, nombre, stock, threshold in stock_monitor.lowest(k)
+    ]
 
-    return results
+# Endpoint para ver las alertas de stock bajo más recientes
+@router.get("/low-stock/alerts", response_model=List[StockAlert], summary="Alertas recientes de stock bajo (Requiere Mantenedor)")
+async def get_low_stock_alerts(user=Depends(require_roles(["mantenedor"]))):
+    return list(stock_monitor.recent_alerts)
+
+# Endpoint SSE con los cambios del catálogo (stock, precio, producto nuevo), en lugar de sondear GET /products/.
+# Con varios workers el stream es por worker: sólo trae los cambios hechos en el proceso que atiende la conexión,
+# y al reconectarse en otro worker el cliente recibe un "reset" y debe recargar el catálogo
+@router.get("/stream", summary="Stream (Server-Sent Events) de cambios de stock y catálogo (por worker)")
+async def stream_catalog_changes(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID", max_length=64, description="Reanudar después de este evento")
+):
+    return StreamingResponse(
+        catalog_events.stream(last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Endpoint para obtener un producto por ID
 @router.get("/{product_id}", response_model=Product, summary="Obtener un producto por ID")
-def get_product(product_id: int):
-    product = get_product_by_id_from_db(product_id) # Usamos la nueva función auxiliar
+async def get_product(product_id: int):
+    # Con el catálogo compartido se ve el stock publicado por todos los workers
+    product = shared_catalog.get(product_id) if shared_catalog is not None else get_product_by_id_from_db(product_id)
     if product:
         return product
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
 
 # Endpoint para agregar un nuevo producto al catálogo
 @router.post("/", response_model=Product, summary="Agregar un nuevo producto al catálogo (Requiere Mantenedor)")
-def add_product(
+async def add_product(
     product_data: ProductCreate, # Espera un cuerpo de solicitud que coincida con ProductCreate
     user=Depends(require_roles(["mantenedor"])) # Solo usuarios con rol "mantenedor"
 ):
     global next_product_id # Para poder modificar la variable global
 
+    sync_shared_catalog() # Incluye los productos que dieron de alta los otros workers
+
     # Verificar si el código del producto ya existe para evitar duplicados
     for p in products_db:
         if p.codigo == product_data.codigo:
@@ -91,14 +323,67 @@ def add_product(
                 detail=f"Ya existe un producto con el código '{product_data.codigo}'."
             )
 
+    # Con varios workers el ID se reserva en el catálogo compartido para que no se repita entre ellos
+    product_id = shared_catalog.allocate_product_id(next_product_id) if shared_catalog is not None else next_product_id
+
     # Crear una nueva instancia de Product con el ID generado y los datos recibidos
-    new_product = Product(id=next_product_id, **product_data.dict())
+    new_product = Product(id=product_id, **product_data.dict())
     
     # Añadir el nuevo producto a la lista simulada
     products_db.append(new_product)
+    pricing_engine.upsert_product(new_product)
+    _index_product(new_product)
+    stock_monitor.record(new_product)
+    catalog_events.publish("product", new_product.id, new_product.model_dump())
+    lsn = store_journal.append("product.put", new_product.model_dump(), wait=False)
     
     # Incrementar el contador para el próximo producto
-    next_product_id += 1
+    next_product_id = product_id + 1
     
+    # Esperar que el alta esté en disco sin bloquear el event loop
+    await store_journal.sync_async(lsn)
+
     # Devolver el producto creado con su nuevo ID
-    return new_product
\ No newline at end of file
+    return new_product
+
+# Endpoint para definir la regla de promoción de un producto
+@router.put("/{product_id}/promo-rule", response_model=Product, summary="Definir la regla de descuento de un producto (Requiere Mantenedor)")
+async def set_product_promo_rule(
+    product_id: int,
+    rule: Optional[PromoRule] = None, # Sin cuerpo se elimina la regla específica y se vuelve al descuento por defecto
+    user=Depends(require_roles(["mantenedor"]))
+):
+    sync_shared_catalog()
+    product = get_product_by_id_from_db(product_id)
+    if not product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+    pricing_engine.set_promo_rule(product, rule)
+    if shared_catalog is not None:
+        _index_product(product)
+    lsn = store_journal.append("promo.set", [product.id, rule.model_dump() if rule is not None else None], wait=False)
+    effective_rule = pricing_engine.promo_rule_for(product)
+    catalog_events.publish("price", product.id, {
+        "product_id": product.id,
+        "precio": product.precio,
+        "promo_rule": effective_rule.model_dump() if effective_rule else None
+    })
+    await store_journal.sync_async(lsn)
+    return product
+
+
+# Endpoint para definir el umbral de reposición de un producto
+@router.put("/{product_id}/reorder-threshold", response_model=LowStockEntry, summary="Definir el umbral de reposición de un producto (Requiere Mantenedor)")
+async def set_reorder_threshold(
+    product_id: int,
+    threshold_data: ReorderThresholdUpdate,
+    user=Depends(require_roles(["mantenedor"]))
+):
+    sync_shared_catalog()
+    product = get_product_by_id_from_db(product_id)
+    if not product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+    # Si el nuevo umbral deja el stock actual por debajo, la alerta se emite ahora
+    stock_monitor.set_threshold(product_id, threshold_data.reorder_threshold)
+    lsn = store_journal.append("threshold.set", [product_id, threshold_data.reorder_threshold], wait=False)
+    await store_journal.sync_async(lsn)
+    return LowStockEntry(product_id=product.id, nombre=product.nombre, stock=current_stock(product), reorder_threshold=threshold_data.reorder_threshold)
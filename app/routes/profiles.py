@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import PlainTextResponse
+from typing import List, Literal
+
+from app.auth.auth_settings import require_roles
+from app.models.profile import ProfileSummary
+from app.services.profiler import profiler, PROFILE_ROLES
+
+router = APIRouter()
+
+# Endpoint para listar los perfiles guardados (el más reciente primero)
+@router.get("/", response_model=List[ProfileSummary], summary="Listar perfiles de solicitudes (Requiere Admin/Mantenedor)")
+async def list_profiles(user=Depends(require_roles(PROFILE_ROLES))):
+    return [profile.summary() for profile in reversed(profiler.profiles)]
+
+# Endpoint para descargar un perfil como pilas colapsadas o JSON de speedscope
+@router.get("/{profile_id}", summary="Descargar un perfil (collapsed o speedscope) (Requiere Admin/Mantenedor)")
+async def get_profile(
+    profile_id: int,
+    format: Literal["speedscope", "collapsed"] = Query("speedscope", description="speedscope (JSON para speedscope.app) o collapsed (flamegraph.pl)"),
+    user=Depends(require_roles(PROFILE_ROLES))
+):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil no encontrado (puede haber sido descartado del buffer)")
+    if format == "collapsed":
+        return PlainTextResponse(profile.to_collapsed())
+    return profile.to_speedscope()
@@ -26,14 +26,14 @@ def get_seller_by_id_from_db(seller_id: int) -> Optional[Seller]:
 # --- ENDPOINTS DE LA API ---
 
 @router.get("/branches/{branch_id}/sellers", response_model=List[Seller], summary="Lista vendedores de una sucursal dada")
-def get_sellers_by_branch(branch_id: int):
+async def get_sellers_by_branch(branch_id: int):
     """Lista vendedores de una sucursal dada."""
     # Ahora trabajamos directamente con la lista de objetos Seller
     sellers = [s for s in _sellers if s.branch_id == branch_id] # Acceso a atributo .branch_id
     return sellers
 
 @router.get("/sellers/{seller_id}", response_model=Seller, summary="Devuelve un vendedor por su ID")
-def get_seller(seller_id: int):
+async def get_seller(seller_id: int):
     """Devuelve un vendedor por su ID."""
     seller = get_seller_by_id_from_db(seller_id) # Usamos la nueva función auxiliar
     if seller:
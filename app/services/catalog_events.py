@@ -0,0 +1,172 @@
+import os
+import json
+import secrets
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+# Eventos que se conservan para reanudar con Last-Event-ID y máximo de eventos pendientes por suscriptor
+CATALOG_EVENTS_HISTORY = int(os.getenv("CATALOG_EVENTS_HISTORY", "1000"))
+CATALOG_EVENTS_MAX_PENDING = int(os.getenv("CATALOG_EVENTS_MAX_PENDING", "256"))
+CATALOG_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("CATALOG_EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# (id, tipo, product_id, datos)
+CatalogEvent = Tuple[int, str, int, Dict[str, Any]]
+
+_RESET_LAGGED = "El cliente se atrasó; vuelva a cargar el catálogo."
+_RESET_UNKNOWN = "El ID de evento es de otro worker o de antes de un reinicio; vuelva a cargar el catálogo."
+
+
+def format_sse(event_id: Optional[str], event_type: str, data: Dict[str, Any]) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class _Subscriber:
+    __slots__ = ("pending", "overflow", "wakeup")
+
+    def __init__(self):
+        # Eventos pendientes por (tipo, product_id): un evento nuevo reemplaza al anterior del mismo producto
+        self.pending: "OrderedDict[Tuple[str, int], CatalogEvent]" = OrderedDict()
+        self.overflow: Optional[str] = None # Motivo del próximo evento "reset", si hay que enviarlo
+        self.wakeup = asyncio.Event()
+
+
+class CatalogBroadcaster:
+    """
+    Difunde los cambios del catálogo (stock, precio, producto nuevo) a los suscriptores SSE.
+    Cada suscriptor tiene una cola acotada que fusiona los eventos por producto: si un cliente lento
+    no alcanza a leer, sólo ve el último estado de cada producto; si aun así se supera el límite,
+    recibe un evento "reset" para que vuelva a cargar el catálogo completo.
+    Un suscriptor inactivo sólo ocupa un diccionario vacío y un asyncio.Event.
+    publish() se puede llamar desde cualquier hilo (los endpoints síncronos corren en el threadpool).
+
+    El stream es por worker: cada proceso difunde sólo los cambios que él mismo hace, con su propio historial.
+    Los IDs de evento llevan un prefijo de la instancia ("<instancia>-<n>"); un Last-Event-ID de otro worker
+    (el balanceador reconectó al cliente en otro proceso) o de antes de un reinicio recibe un "reset".
+    """
+
+    def __init__(self, history_size: int = CATALOG_EVENTS_HISTORY, max_pending: int = CATALOG_EVENTS_MAX_PENDING):
+        self.max_pending = max_pending
+        self._history: "deque[CatalogEvent]" = deque(maxlen=history_size)
+        self._subscribers: Set[_Subscriber] = set()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.instance = secrets.token_hex(4) # Distingue este proceso (y este arranque) en los IDs de evento
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake_scheduled = False
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    # --- PUBLICACIÓN ---
+
+    def publish(self, event_type: str, product_id: int, data: Dict[str, Any]):
+        with self._lock:
+            event = (self._next_id, event_type, product_id, data)
+            self._next_id += 1
+            self._history.append(event)
+            for subscriber in self._subscribers:
+                self._enqueue(subscriber, event)
+            if not self._subscribers or self._loop is None or self._wake_scheduled:
+                return
+            self._wake_scheduled = True
+            loop = self._loop
+        try:
+            # Un solo callback despierta a todos los suscriptores, sin importar cuántos eventos lleguen mientras tanto
+            loop.call_soon_threadsafe(self._wake_all)
+        except RuntimeError:
+            # El loop ya se cerró (apagado de la aplicación)
+            with self._lock:
+                self._wake_scheduled = False
+
+    def _enqueue(self, subscriber: _Subscriber, event: CatalogEvent):
+        if subscriber.overflow:
+            return
+        key = (event[1], event[2])
+        subscriber.pending.pop(key, None)
+        subscriber.pending[key] = event
+        if len(subscriber.pending) > self.max_pending:
+            subscriber.pending.clear()
+            subscriber.overflow = _RESET_LAGGED
+
+    def _wake_all(self):
+        with self._lock:
+            self._wake_scheduled = False
+            subscribers = [s for s in self._subscribers if s.pending or s.overflow]
+        for subscriber in subscribers:
+            subscriber.wakeup.set()
+
+    # --- SUSCRIPCIÓN ---
+
+    def event_id(self, number: int) -> str:
+        return f"{self.instance}-{number}"
+
+    def _parse_event_id(self, event_id: str) -> Optional[int]:
+        # None si el ID no es de esta instancia
+        instance, _, number = event_id.partition("-")
+        if instance != self.instance or not number.isdigit():
+            return None
+        return int(number)
+
+    def _subscribe(self, last_event_id: Optional[str]) -> _Subscriber:
+        subscriber = _Subscriber()
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.get_running_loop()
+            if last_event_id is not None:
+                last_number = self._parse_event_id(last_event_id)
+                oldest = self._history[0][0] if self._history else self._next_id
+                if last_number is None or last_number >= self._next_id:
+                    subscriber.overflow = _RESET_UNKNOWN
+                elif last_number < oldest - 1:
+                    # Los eventos intermedios ya no están en el historial
+                    subscriber.overflow = _RESET_LAGGED
+                else:
+                    for event in self._history:
+                        if event[0] > last_number:
+                            self._enqueue(subscriber, event)
+            self._subscribers.add(subscriber)
+        if subscriber.pending or subscriber.overflow:
+            subscriber.wakeup.set()
+        return subscriber
+
+    def _drain(self, subscriber: _Subscriber) -> List[CatalogEvent]:
+        with self._lock:
+            events = list(subscriber.pending.values())
+            subscriber.pending.clear()
+            reason = subscriber.overflow
+            subscriber.overflow = None
+            subscriber.wakeup.clear()
+            last_id = self._next_id - 1
+        if reason is not None:
+            # Después de un reset el cliente recarga el catálogo; se reanuda desde el último ID
+            return [(last_id, "reset", 0, {"reason": reason})]
+        return sorted(events)
+
+    async def stream(self, last_event_id: Optional[str], is_disconnected) -> AsyncIterator[str]:
+        """
+        Generador de eventos SSE para un suscriptor. `is_disconnected` es Request.is_disconnected.
+        """
+        subscriber = self._subscribe(last_event_id)
+        try:
+            yield "retry: 3000\n\n" # Tiempo de reconexión sugerido al navegador
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), timeout=CATALOG_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        return
+                    yield ": ping\n\n" # Mantiene viva la conexión a través de proxies
+                    continue
+                for number, event_type, _, data in self._drain(subscriber):
+                    yield format_sse(self.event_id(number), event_type, data)
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
@@ -0,0 +1,207 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Registro de todos los breakers creados, para exponer su estado en /circuit-breakers
+_breakers: Dict[str, "CircuitBreaker"] = {}
+_registry_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """
+    Se lanza en lugar de llamar a la integración cuando el circuito está abierto.
+    `retry_after` indica en cuántos segundos se volverá a probar el servicio.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"El servicio '{name}' no está disponible temporalmente (circuito abierto). Reintente en {retry_after:.0f} s.")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker con ventana deslizante de las últimas `window_size` llamadas.
+    - closed: las llamadas pasan; si la tasa de errores o de llamadas lentas supera su umbral
+      (con al menos `min_calls` en la ventana), el circuito se abre.
+    - open: las llamadas fallan de inmediato con CircuitOpenError durante un tiempo con jitter,
+      que se duplica cada vez que el servicio sigue fallando (hasta `max_open_seconds`).
+    - half_open: se deja pasar un presupuesto de `half_open_max_calls` llamadas de prueba;
+      si todas salen bien el circuito se cierra, y si una falla se vuelve a abrir.
+    `is_failure` decide qué excepciones cuentan como falla del servicio (ej. un 4xx no debería).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 2.0,
+        slow_call_rate_threshold: float = 0.8,
+        window_size: int = 20,
+        min_calls: int = 5,
+        open_seconds: float = 30.0,
+        max_open_seconds: float = 300.0,
+        jitter: float = 0.2,
+        half_open_max_calls: int = 2,
+        is_failure: Callable[[BaseException], bool] = lambda e: True,
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.jitter = jitter
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._window: "deque[tuple]" = deque(maxlen=window_size) # (falló, fue lenta)
+        self._opened_count = 0 # Aperturas consecutivas, para el backoff del tiempo abierto
+        self._open_until = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self.stats: Dict[str, Any] = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0, "last_opened_at": None, "last_error": None}
+
+        with _registry_lock:
+            _breakers[name] = self
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == OPEN and time.monotonic() >= self._open_until:
+            self._state = HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+
+    # --- TRANSICIONES ---
+
+    def _open(self):
+        # El tiempo abierto crece con cada apertura consecutiva; el jitter evita que todos los workers prueben a la vez
+        base = min(self.open_seconds * (2 ** self._opened_count), self.max_open_seconds)
+        duration = base * (1 + random.uniform(-self.jitter, self.jitter))
+        self._state = OPEN
+        self._open_until = time.monotonic() + duration
+        self._opened_count += 1
+        self._window.clear()
+        self.stats["opened"] += 1
+        self.stats["last_opened_at"] = time.time()
+        print(f"Circuit breaker '{self.name}' abierto por {duration:.1f} s")
+
+    def _close(self):
+        self._state = CLOSED
+        self._opened_count = 0
+        self._window.clear()
+        print(f"Circuit breaker '{self.name}' cerrado: el servicio se recuperó")
+
+    def _before_call(self):
+        with self._lock:
+            self._refresh_state()
+            if self._state == OPEN:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self._open_until - time.monotonic())
+            if self._state == HALF_OPEN:
+                if self._half_open_in_flight + self._half_open_successes >= self.half_open_max_calls:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, 1.0) # Presupuesto de pruebas agotado: esperar su resultado
+                self._half_open_in_flight += 1
+
+    def _record(self, failed: bool, elapsed: float, error: Optional[BaseException] = None):
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            self.stats["calls"] += 1
+            if failed:
+                self.stats["failures"] += 1
+                self.stats["last_error"] = f"{type(error).__name__}: {error}" if error else None
+            if slow:
+                self.stats["slow_calls"] += 1
+
+            if self._state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if failed or slow:
+                    self._open()
+                else:
+                    self._half_open_successes += 1
+                    if self._half_open_successes >= self.half_open_max_calls:
+                        self._close()
+                return
+            if self._state == OPEN:
+                return # Llamada que empezó antes de abrirse el circuito
+
+            self._window.append((failed, slow))
+            calls = len(self._window)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._window if f)
+            slow_calls = sum(1 for _, s in self._window if s)
+            if failures / calls >= self.failure_rate_threshold or slow_calls / calls >= self.slow_call_rate_threshold:
+                self._open()
+
+    # --- USO ---
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Ejecuta `fn` a través del breaker. Lanza CircuitOpenError sin llamar a `fn` si el circuito está abierto.
+        """
+        self._before_call()
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._record(self.is_failure(e), time.monotonic() - started, e)
+            raise
+        self._record(False, time.monotonic() - started)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_state()
+            calls = len(self._window)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "window_calls": calls,
+                "window_failure_rate": round(sum(1 for f, _ in self._window if f) / calls, 3) if calls else 0.0,
+                "window_slow_rate": round(sum(1 for _, s in self._window if s) / calls, 3) if calls else 0.0,
+                "retry_after_seconds": round(max(0.0, self._open_until - time.monotonic()), 1) if self._state == OPEN else 0.0,
+                **self.stats,
+            }
+
+
+def breaker_from_env(prefix: str, name: str, **kwargs) -> CircuitBreaker:
+    """
+    Crea un breaker leyendo los umbrales de variables de entorno `{prefix}_...` (ej. STRIPE_BREAKER_OPEN_SECONDS).
+    """
+    def env(key: str, default: float) -> float:
+        return float(os.getenv(f"{prefix}_{key}", default))
+
+    return CircuitBreaker(
+        name,
+        failure_rate_threshold=env("FAILURE_RATE", 0.5),
+        slow_call_seconds=env("SLOW_CALL_SECONDS", 2.0),
+        slow_call_rate_threshold=env("SLOW_CALL_RATE", 0.8),
+        window_size=int(env("WINDOW_SIZE", 20)),
+        min_calls=int(env("MIN_CALLS", 5)),
+        open_seconds=env("OPEN_SECONDS", 30),
+        max_open_seconds=env("MAX_OPEN_SECONDS", 300),
+        half_open_max_calls=int(env("HALF_OPEN_CALLS", 2)),
+        **kwargs,
+    )
+
+
+def all_breakers() -> List[CircuitBreaker]:
+    with _registry_lock:
+        return list(_breakers.values())
@@ -0,0 +1,264 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.models.product import Product
+
+SORT_FIELDS = ("precio", "stock")
+
+
+class ColumnarCatalog:
+    """
+    Representación columnar del catálogo: precio, stock y las banderas viven en arreglos NumPy
+    y la marca se codifica como diccionario (un entero por fila + la lista de marcas distintas).
+    Los filtros y ordenamientos se evalúan como máscaras vectorizadas sobre las columnas,
+    y los objetos Product sólo se construyen para la página que se devuelve.
+    """
+
+    def __init__(self, products: Iterable[Product] = ()):
+        self._lock = threading.Lock()
+        self.rebuild(products)
+
+    # --- CONSTRUCCIÓN ---
+
+    def _allocate(self, capacity: int):
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._precio = np.zeros(capacity, dtype=np.float64)
+        self._stock = np.zeros(capacity, dtype=np.int64)
+        self._is_promo = np.zeros(capacity, dtype=np.bool_)
+        self._is_new = np.zeros(capacity, dtype=np.bool_)
+        self._marca = np.full(capacity, -1, dtype=np.int32) # -1 = sin marca
+
+    def _grow(self, needed: int):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 16)
+        for name in ("_ids", "_precio", "_stock", "_is_promo", "_is_new", "_marca"):
+            old = getattr(self, name)
+            new = np.full(new_capacity, -1, dtype=old.dtype) if name == "_marca" else np.zeros(new_capacity, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new) # Los lectores que ya tomaron el arreglo anterior siguen viendo datos válidos
+
+    def _encode_marca(self, marca: Optional[str]) -> int:
+        if marca is None:
+            return -1
+        code = self._marca_codes.get(marca)
+        if code is None:
+            code = self._marca_codes[marca] = len(self._marcas)
+            self._marcas.append(marca)
+            self._marca_lookup.setdefault(marca.casefold(), []).append(code)
+        return code
+
+    def rebuild(self, products: Iterable[Product]):
+        products = list(products)
+        with self._lock:
+            self._size = 0
+            self._row_of_id: Dict[int, int] = {}
+            self._marcas: List[str] = []
+            self._marca_codes: Dict[str, int] = {}
+            self._marca_lookup: Dict[str, List[int]] = {} # marca en minúsculas -> códigos
+            # Columnas de texto: sólo se leen al materializar la página
+            self._text: List[Tuple[str, Optional[str], Optional[str], str]] = [] # (nombre, descripcion, modelo, codigo)
+            self._allocate(max(len(products), 16))
+            for product in products:
+                self._append_locked(product)
+
+    def _append_locked(self, product: Product):
+        row = self._size
+        self._grow(row + 1)
+        self._ids[row] = product.id
+        self._precio[row] = product.precio
+        self._stock[row] = product.stock
+        self._is_promo[row] = product.isPromo
+        self._is_new[row] = product.isNew
+        self._marca[row] = self._encode_marca(product.marca)
+        self._text.append((product.nombre, product.descripcion, product.modelo, product.codigo))
+        self._row_of_id[product.id] = row
+        self._size = row + 1
+
+    # --- ACTUALIZACIÓN ---
+
+    def upsert(self, product: Product):
+        with self._lock:
+            row = self._row_of_id.get(product.id)
+            if row is None:
+                self._append_locked(product)
+                return
+            self._precio[row] = product.precio
+            self._stock[row] = product.stock
+            self._is_promo[row] = product.isPromo
+            self._is_new[row] = product.isNew
+            self._marca[row] = self._encode_marca(product.marca)
+            self._text[row] = (product.nombre, product.descripcion, product.modelo, product.codigo)
+
+    def adjust_stock(self, product_id: int, quantity_change: int):
+        with self._lock:
+            row = self._row_of_id.get(product_id)
+            if row is not None:
+                self._stock[row] += quantity_change
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _row_for(self, product_id: int) -> Optional[int]:
+        return self._row_of_id.get(product_id)
+
+    # --- CONSULTA ---
+
+    def _materialize(self, rows: np.ndarray, ids, precio, stock, is_promo, is_new, marca) -> List[Product]:
+        products = []
+        for row in rows.tolist():
+            nombre, descripcion, modelo, codigo = self._text[row]
+            code = int(marca[row])
+            # Los datos ya se validaron al crear el producto, así que se evita revalidarlos
+            products.append(Product.model_construct(
+                id=int(ids[row]),
+                nombre=nombre,
+                descripcion=descripcion,
+                precio=float(precio[row]),
+                modelo=modelo,
+                marca=self._marcas[code] if code >= 0 else None,
+                codigo=codigo,
+                stock=int(stock[row]),
+                isPromo=bool(is_promo[row]),
+                isNew=bool(is_new[row]),
+            ))
+        return products
+
+    def get(self, product_id: int) -> Optional[Product]:
+        row = self._row_for(product_id)
+        if row is None:
+            return None
+        return self._materialize(np.array([row]), self._ids, self._precio, self._stock, self._is_promo, self._is_new, self._marca)[0]
+
+    def query(
+        self,
+        promo: Optional[bool] = None,
+        new: Optional[bool] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        in_stock: Optional[bool] = None,
+        marca: Optional[str] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Tuple[int, List[Product]]:
+        """
+        Filtra y ordena el catálogo. Devuelve (total de coincidencias, productos de la página).
+        """
+        if sort_by is not None and sort_by not in SORT_FIELDS:
+            raise ValueError(f"Campo de orden '{sort_by}' no soportado. Opciones: {SORT_FIELDS}")
+
+        # Se toman las referencias a las columnas una sola vez: una inserción concurrente puede reemplazarlas
+        with self._lock:
+            n = self._size
+            ids, precio, stock = self._ids[:n], self._precio[:n], self._stock[:n]
+            is_promo, is_new, marca_col = self._is_promo[:n], self._is_new[:n], self._marca[:n]
+            marca_codes = self._marca_lookup.get(marca.casefold(), []) if marca is not None else None
+
+        mask = np.ones(n, dtype=np.bool_)
+        if promo is not None:
+            mask &= is_promo == promo
+        if new is not None:
+            mask &= is_new == new
+        if min_price is not None:
+            mask &= precio >= min_price
+        if max_price is not None:
+            mask &= precio <= max_price
+        if in_stock is not None:
+            mask &= (stock > 0) == in_stock
+        if marca_codes is not None:
+            mask &= np.isin(marca_col, marca_codes)
+
+        rows = np.flatnonzero(mask)
+        total = len(rows)
+        end = total if limit is None else min(total, offset + limit)
+        if offset >= end:
+            return total, []
+
+        if sort_by is not None:
+            keys = (precio if sort_by == "precio" else stock)[rows]
+            if descending:
+                keys = -keys
+            if end < total:
+                # Sólo hace falta ordenar las primeras `end` filas: selección parcial O(n) y luego orden de la parte
+                part = np.argpartition(keys, end - 1)[:end]
+                rows, keys = rows[part], keys[part]
+            # Orden estable por (clave, fila) para que la paginación sea determinista
+            rows = rows[np.lexsort((rows, keys))]
+
+        return total, self._materialize(rows[offset:end], ids, precio, stock, is_promo, is_new, marca_col)
+
+
+# Benchmark de memoria y latencia frente a la lista de objetos Product (opcional)
+# Uso: python -m app.services.columnar_catalog [productos]
+if __name__ == "__main__":
+    import sys
+    import time
+    import gc
+    import random
+    import tracemalloc
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    brands = [f"Marca{i}" for i in range(200)]
+
+    def make_products():
+        rng = random.Random(42)
+        return [
+            Product(
+                id=i, nombre=f"Producto {i}", descripcion="Herramienta de uso general.", precio=float(rng.randint(500, 200_000)),
+                modelo=f"M-{i % 1000}", marca=rng.choice(brands), codigo=f"COD{i:07d}", stock=rng.randint(0, 500),
+                isPromo=rng.random() < 0.1, isNew=rng.random() < 0.05,
+            )
+            for i in range(1, count + 1)
+        ]
+
+    tracemalloc.start()
+    products = make_products()
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    # Costo extra del índice mientras products_db sigue vivo (como en la app): comparte los str de texto con la lista
+    catalog = ColumnarCatalog(products)
+    extra_bytes = tracemalloc.get_traced_memory()[0] - list_bytes
+    tracemalloc.stop()
+
+    def list_query():
+        results = [p for p in products if p.isPromo and 10_000 <= p.precio <= 50_000 and p.stock > 0 and p.marca.casefold() == "marca7"]
+        results.sort(key=lambda p: p.precio)
+        return len(results), results[:50]
+
+    def columnar_query():
+        return catalog.query(promo=True, min_price=10_000, max_price=50_000, in_stock=True, marca="marca7", sort_by="precio", limit=50)
+
+    def timed(fn, repeat=5):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - started)
+        return best, result
+
+    list_time, (list_total, list_page) = timed(list_query)
+    columnar_time, (columnar_total, columnar_page) = timed(columnar_query)
+    sort_time, _ = timed(lambda: catalog.query(sort_by="stock", descending=True, limit=50))
+    same_page = [p.id for p in list_page] == [p.id for p in columnar_page]
+
+    # Índice por sí solo: la lista de Product se libera después de construirlo, así que el texto queda a su cargo
+    del products, catalog, list_page, columnar_page
+    gc.collect()
+    tracemalloc.start()
+    catalog = ColumnarCatalog(make_products())
+    gc.collect()
+    standalone_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{count} productos")
+    print(f"  memoria lista de Product:  {list_bytes / 2**20:8.1f} MiB")
+    print(f"  índice columnar (extra):   {extra_bytes / 2**20:8.1f} MiB (junto a la lista, con la que comparte el texto)")
+    print(f"  índice columnar (solo):    {standalone_bytes / 2**20:8.1f} MiB (sin la lista; incluye columnas de texto)")
+    print(f"  filtro+orden lista:        {list_time * 1e3:8.1f} ms ({list_total} coincidencias)")
+    print(f"  filtro+orden columnar:     {columnar_time * 1e3:8.1f} ms ({columnar_total} coincidencias)")
+    print(f"  orden por stock (top 50):  {sort_time * 1e3:8.1f} ms")
+    print(f"  misma página: {same_page}")
@@ -1,10 +1,19 @@
 import os
+import time
+import datetime
 import requests
 from dotenv import load_dotenv
+from typing import Optional
+
+from app.services.rate_store import RateStore
+from app.services.circuit_breaker import CircuitOpenError, breaker_from_env
 
 # Cargar variables de entorno del archivo .env
 load_dotenv()
 
+# Tiempo máximo de espera de la API de tasas (sin esto, una API degradada retiene el worker indefinidamente)
+EXCHANGE_RATE_TIMEOUT_SECONDS = float(os.getenv("EXCHANGE_RATE_TIMEOUT_SECONDS", "5"))
+
 class CurrencyConverter:
     def __init__(self):
         self.api_key = os.getenv("EXCHANGE_RATE_API_KEY")
@@ -12,34 +21,69 @@ class CurrencyConverter:
             raise ValueError("EXCHANGE_RATE_API_KEY no encontrada en las variables de entorno.")
         # Usamos la base de USD, ya que es común y la API lo permite
         self.base_url = f"https://v6.exchangerate-api.com/v6/{self.api_key}/latest/USD"
+        # Historial persistente de tablas de tasas (se mapea en memoria, así que abrirlo es instantáneo)
+        self.rate_store = RateStore(os.getenv("EXCHANGE_RATE_STORE_PATH", "data/exchange_rates.bin"))
+        # Si la API falla o responde lento de forma sostenida, se deja de llamarla por un tiempo
+        self.breaker = breaker_from_env("EXCHANGE_RATE_BREAKER", "exchangerate-api")
 
     def get_exchange_rates(self):
         """
         Obtiene las últimas tasas de cambio desde la API externa, con USD como base.
+        Cada tabla nueva se guarda en el historial; si la API no está disponible
+        (o su circuit breaker está abierto), se usa la tabla más reciente del historial.
         """
         try:
-            response = requests.get(self.base_url)
-            response.raise_for_status() # Lanza una excepción para errores HTTP (4xx o 5xx)
-            data = response.json()
-            
+            data = self.breaker.call(self._fetch_latest)
+
             if data and data.get("result") == "success":
-                return data["conversion_rates"]
+                rates = data["conversion_rates"]
+                # La API actualiza las tasas una vez al día; sólo se guarda si la tabla es nueva
+                self.rate_store.append(int(data.get("time_last_update_unix") or time.time()), rates)
+                return rates
             else:
                 print(f"Error al obtener tasas de cambio: {data.get('error-type', 'Error desconocido')}")
-                return None
+        except CircuitOpenError as e:
+            print(f"{e} Se usarán las tasas guardadas.")
         except requests.exceptions.RequestException as e:
             print(f"Error de conexión o HTTP al obtener tasas de cambio: {e}")
-            return None
         except ValueError as e:
             print(f"Error al parsear JSON: {e}")
+
+        return self._latest_stored_rates()
+
+    def _fetch_latest(self):
+        response = requests.get(self.base_url, timeout=EXCHANGE_RATE_TIMEOUT_SECONDS)
+        response.raise_for_status() # Lanza una excepción para errores HTTP (4xx o 5xx)
+        return response.json()
+
+    def _latest_stored_rates(self):
+        latest = self.rate_store.latest()
+        if latest is None:
             return None
+        timestamp, rates = latest
+        print(f"Usando tasas de cambio guardadas del {datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()}")
+        return rates
+
+    def get_exchange_rates_at(self, as_of: datetime.datetime):
+        """
+        Obtiene la tabla de tasas vigente en una fecha dada desde el historial.
+        Las fechas sin zona horaria se interpretan como UTC (como Order.order_date).
+        Si no hay historial, recurre a las tasas actuales.
+        """
+        if as_of.tzinfo is None:
+            as_of = as_of.replace(tzinfo=datetime.timezone.utc)
+        stored = self.rate_store.rates_at(as_of.timestamp())
+        if stored is None:
+            return self.get_exchange_rates()
+        return stored[1]
 
-    def convert(self, amount: float, from_currency: str, to_currency: str):
+    def convert(self, amount: float, from_currency: str, to_currency: str, as_of: Optional[datetime.datetime] = None):
         """
         Convierte una cantidad de una moneda a otra.
         Soporta USD, CLP y otras monedas que la API provea.
+        Si se indica `as_of`, usa las tasas vigentes en esa fecha.
         """
-        rates = self.get_exchange_rates()
+        rates = self.get_exchange_rates_at(as_of) if as_of else self.get_exchange_rates()
         if not rates:
             return None # No se pudieron obtener las tasas
 
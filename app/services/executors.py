@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+# Modelo de concurrencia:
+# - Los handlers que sólo trabajan en memoria son `async def` y corren directamente en el event loop.
+# - El trabajo bloqueante se envía a un executor con nombre según su tipo, para que un tipo saturado
+#   (ej. muchos logins con bcrypt) no deje sin hilos a los demás (ej. llamadas a Stripe).
+EXECUTOR_BCRYPT_WORKERS = int(os.getenv("EXECUTOR_BCRYPT_WORKERS", str(os.cpu_count() or 2))) # bcrypt es CPU: más hilos que núcleos no ayuda
+EXECUTOR_HTTP_WORKERS = int(os.getenv("EXECUTOR_HTTP_WORKERS", "32")) # Llamadas HTTP salientes (Stripe, exchangerate-api)
+EXECUTOR_DISK_WORKERS = int(os.getenv("EXECUTOR_DISK_WORKERS", "8")) # Esperas de fsync del journal y lecturas del archivo de pagos
+EXECUTOR_CPU_WORKERS = int(os.getenv("EXECUTOR_CPU_WORKERS", "2")) # Recálculos largos en memoria (ej. verificar la analítica de ventas)
+
+_executors: Dict[str, "NamedExecutor"] = {}
+
+
+class NamedExecutor:
+    """
+    ThreadPoolExecutor con nombre y tamaño propio que mide, para las tareas recientes, cuánto
+    esperaron en cola antes de tomar un hilo, y qué tan saturado está (hilos ocupados / total).
+    """
+
+    def __init__(self, name: str, max_workers: int, wait_samples: int = 1000):
+        self.name = name
+        self.max_workers = max_workers
+        self._pool = self._new_pool()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._waits: "deque[float]" = deque(maxlen=wait_samples) # Segundos en cola de las últimas tareas
+        self.stats: Dict[str, Any] = {"submitted": 0, "completed": 0, "failed": 0, "saturated_submissions": 0, "peak_queued": 0, "busy_seconds": 0.0}
+        self._created = time.monotonic()
+        _executors[name] = self
+
+    def _new_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-executor")
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """
+        Ejecuta `fn(*args, **kwargs)` en un hilo del executor y espera su resultado sin bloquear el event loop.
+        Las variables de contexto (contextvars) se propagan al hilo.
+        """
+        submitted = time.monotonic()
+        with self._lock:
+            self.stats["submitted"] += 1
+            if self._running + self._queued >= self.max_workers:
+                self.stats["saturated_submissions"] += 1 # Esta tarea tendrá que esperar un hilo libre
+            self._queued += 1
+            self.stats["peak_queued"] = max(self.stats["peak_queued"], self._queued)
+        context = contextvars.copy_context()
+
+        def task():
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._waits.append(started - submitted)
+            failed = True
+            try:
+                result = context.run(fn, *args, **kwargs)
+                failed = False
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.stats["completed"] += 1
+                    self.stats["failed"] += failed
+                    self.stats["busy_seconds"] += time.monotonic() - started
+
+        return await asyncio.get_running_loop().run_in_executor(self._pool, task)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            running, queued = self._running, self._queued
+            stats = dict(self.stats)
+        elapsed = time.monotonic() - self._created
+        return {
+            "name": self.name,
+            "max_workers": self.max_workers,
+            "running": running,
+            "queued": queued,
+            "saturation": round(running / self.max_workers, 3), # Instantánea
+            "utilization": round(stats["busy_seconds"] / (elapsed * self.max_workers), 4) if elapsed > 0 else 0.0, # Promedio desde el inicio
+            "queue_wait_ms": {
+                "avg": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+                "p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0.0,
+                "max": round(waits[-1] * 1000, 3) if waits else 0.0,
+            },
+            **stats,
+        }
+
+    def start(self):
+        """
+        Vuelve a crear el pool si se cerró con shutdown(): la app puede iniciarse otra vez en el mismo proceso (ej. tests).
+        """
+        with self._lock:
+            if self._closed:
+                self._pool = self._new_pool()
+                self._closed = False
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            pool = self._pool
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def all_executors() -> List[NamedExecutor]:
+    return list(_executors.values())
+
+
+bcrypt_executor = NamedExecutor("bcrypt", EXECUTOR_BCRYPT_WORKERS)
+http_executor = NamedExecutor("http", EXECUTOR_HTTP_WORKERS)
+disk_executor = NamedExecutor("disk", EXECUTOR_DISK_WORKERS)
+cpu_executor = NamedExecutor("cpu", EXECUTOR_CPU_WORKERS)
+
+
+# Benchmark del modelo de concurrencia: handlers `def` (threadpool de AnyIO) frente a `async def` (event loop)
+# Uso: python -m app.services.executors [solicitudes] [logins]
+if __name__ == "__main__":
+    import sys
+
+    os.environ.setdefault("JOURNAL_DIR", "") # El benchmark no escribe en el journal
+    import httpx
+    from fastapi import Depends
+    from fastapi.security import OAuth2PasswordRequestForm
+    from main import app
+    from app.auth.auth_settings import oauth2_scheme, get_user_from_token, create_access_token
+    from app.routes.products import get_product_by_id_from_db
+    from app.routes.orders import sales_analytics
+    from app.services import executors as live # Los executors que usa la app (este módulo corre como __main__)
+    from app.services.user_db import fake_users_db, verify_password
+
+    total_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    login_count = int(sys.argv[2]) if len(sys.argv) > 2 else 48
+    concurrency = 64
+
+    # Versiones anteriores (síncronas) de los mismos handlers, para comparar
+    def sync_current_user(token: str = Depends(oauth2_scheme)):
+        return get_user_from_token(token)
+
+    @app.get("/_bench/sync/products/{product_id}")
+    def sync_get_product(product_id: int):
+        return get_product_by_id_from_db(product_id)
+
+    @app.get("/_bench/sync/analytics/summary")
+    def sync_summary(user=Depends(sync_current_user)):
+        return sales_analytics.summary()
+
+    @app.post("/_bench/sync/login")
+    def sync_login(form_data: OAuth2PasswordRequestForm = Depends()):
+        user = fake_users_db[form_data.username]
+        return {"ok": verify_password(form_data.password, user.hashed_password)}
+
+    username = next(name for name, user in fake_users_db.items() if user.role == "mantenedor")
+    auth = {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+    async def load(client, path, count, headers=None):
+        latencies = []
+        remaining = iter(range(count))
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return count / elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+    async def logins(client, path, count):
+        # Contraseña incorrecta: el costo de bcrypt es el mismo y no depende de conocer las contraseñas de prueba
+        await asyncio.gather(*(client.post(path, data={"username": username, "password": "x"}) for _ in range(count)))
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{total_requests} solicitudes, {concurrency} concurrentes")
+            for label, sync_path, async_path, headers in (
+                ("GET producto", "/_bench/sync/products/1", "/products/1", None),
+                ("GET analytics (con JWT)", "/_bench/sync/analytics/summary", "/analytics/summary", auth),
+            ):
+                await load(client, async_path, 200, headers) # Calentamiento
+                for mode, path in (("def", sync_path), ("async def", async_path)):
+                    rps, p50, p99 = await load(client, path, total_requests, headers)
+                    print(f"  {label:<24} {mode:<9} {rps:8.0f} req/s  p50 {p50:6.2f} ms  p99 {p99:6.2f} ms")
+
+            print(f"\nLecturas de producto durante {login_count} logins simultáneos (bcrypt)")
+            for mode, login_path, read_path in (
+                ("def (threadpool compartido)", "/_bench/sync/login", "/_bench/sync/products/1"),
+                ("async + executor bcrypt", "/auth/login", "/products/1"),
+            ):
+                burst = asyncio.create_task(logins(client, login_path, login_count))
+                await asyncio.sleep(0.05)
+                rps, p50, p99 = await load(client, read_path, 1000)
+                await burst
+                print(f"  {mode:<28} {rps:8.0f} req/s  p50 {p50:7.2f} ms  p99 {p99:7.2f} ms")
+            print(f"\n  executor bcrypt: {live.bcrypt_executor.snapshot()}")
+
+    asyncio.run(main())
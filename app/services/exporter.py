@@ -0,0 +1,237 @@
+import os
+import io
+import csv
+import json
+import base64
+import asyncio
+import datetime
+from bisect import bisect_right
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.executors import NamedExecutor
+from app.services.payment_store import PaymentStore
+
+# Tamaño aproximado de cada trozo enviado al cliente
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+ORDER_COLUMNS = ["id", "user_id", "order_date", "status", "total_amount", "items"]
+PAYMENT_COLUMNS = [
+    "id", "client_username", "stripe_session_id", "stripe_payment_intent_id", "amount_total",
+    "currency", "status", "created_at", "updated_at", "items_snapshot", "order_id",
+]
+
+# Fila exportada junto al cursor que reanuda la exportación justo después de ella
+ExportRow = Tuple[Dict[str, Any], str]
+
+# Exportación en streaming: fuente (filas + cursor) -> formato (líneas CSV o NDJSON) -> trozos de bytes.
+# Cada etapa es un generador, así que en memoria sólo hay un trozo a la vez sin importar cuántas filas haya,
+# y como el servidor sólo pide el siguiente trozo después de enviar el anterior, un cliente lento frena la lectura.
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+# --- CURSORES ---
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: Optional[str], fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    Decodifica un cursor opaco. Sin cursor, devuelve un estado vacío (exportar desde el inicio).
+    """
+    if not cursor:
+        return {}
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursorError("Cursor inválido.")
+    if not isinstance(state, dict) or set(state) != set(fields):
+        raise InvalidCursorError("Cursor inválido.")
+    return state
+
+
+def _to_utc(moment: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # Las fechas sin zona horaria se interpretan como UTC (como Order.order_date)
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.astimezone(datetime.timezone.utc)
+
+
+# --- FUENTES ---
+
+def order_rows(orders: List[Any], since: Optional[datetime.datetime], until: Optional[datetime.datetime], state: Dict[str, Any]) -> Iterator[ExportRow]:
+    """
+    Pedidos en orden de ID (orders_db ya está ordenado), desde el siguiente al del cursor.
+    Se recorre por índice sin copiar la lista; los pedidos creados durante la exportación quedan para el siguiente cursor.
+    """
+    since, until = _to_utc(since), _to_utc(until)
+    end = len(orders)
+    start = bisect_right(orders, state.get("id", 0), 0, end, key=lambda order: order.id)
+    for index in range(start, end):
+        order = orders[index]
+        order_date = _to_utc(order.order_date)
+        if (since and order_date < since) or (until and order_date >= until):
+            continue
+        yield order.model_dump(mode="json"), encode_cursor({"id": order.id})
+
+
+def validate_order_cursor(state: Dict[str, Any]):
+    if state and not isinstance(state["id"], int):
+        raise InvalidCursorError("Cursor inválido.")
+
+
+def validate_payment_cursor(store: PaymentStore, state: Dict[str, Any]):
+    if not state:
+        return
+    if not isinstance(state["offset"], int) or not isinstance(state["after_id"], int) or state["offset"] < 0:
+        raise InvalidCursorError("Cursor inválido.")
+    if not store.is_archive_boundary(state["offset"]):
+        raise InvalidCursorError("Cursor inválido: no corresponde al archivo de pagos actual.")
+
+
+def payment_rows(store: PaymentStore, since: Optional[datetime.datetime], until: Optional[datetime.datetime], state: Dict[str, Any]) -> Iterator[ExportRow]:
+    """
+    Primero los pagos archivados (en orden del archivo), luego los que siguen en memoria (en orden de ID).
+    El cursor guarda el offset en el archivo y el último ID en memoria enviado. Un pago que se archivó
+    después de enviarse desde memoria aparece más allá de ese offset con un ID ya enviado, y se omite.
+    """
+    since_epoch = _to_utc(since).timestamp() if since else None
+    until_epoch = _to_utc(until).timestamp() if until else None
+    offset = state.get("offset", 0)
+    # Los IDs en memoria sólo son comparables dentro de la misma instancia del store (se reinician con el proceso)
+    after_id = state.get("after_id", 0) if state.get("store") == store.instance_id else 0
+    archive_end, live = store.export_snapshot()
+
+    def in_range(record) -> bool:
+        return (since_epoch is None or record.created_at >= since_epoch) and (until_epoch is None or record.created_at < until_epoch)
+
+    for next_offset, record in store.iter_archived_range(offset, archive_end):
+        if record.id <= after_id or not in_range(record):
+            continue
+        yield record.to_dict(), encode_cursor({"store": store.instance_id, "offset": next_offset, "after_id": after_id})
+
+    for index in range(bisect_right(live, after_id, key=lambda record: record.id), len(live)):
+        record = live[index]
+        if in_range(record):
+            yield record.to_dict(), encode_cursor({"store": store.instance_id, "offset": archive_end, "after_id": record.id})
+
+
+def limited(rows: Iterator[ExportRow], limit: Optional[int]) -> Iterator[ExportRow]:
+    for count, row in enumerate(rows):
+        if limit is not None and count >= limit:
+            return
+        yield row
+
+
+# --- FORMATOS ---
+
+def to_ndjson(rows: Iterator[ExportRow]) -> Iterator[str]:
+    for row, cursor in rows:
+        row["cursor"] = cursor
+        yield json.dumps(row, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def to_csv(rows: Iterator[ExportRow], columns: List[str]) -> Iterator[str]:
+    """
+    CSV con cabecera; los valores anidados (ítems) van como JSON en su columna y el cursor en la última.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def line(values) -> str:
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(columns + ["cursor"])
+    for row, cursor in rows:
+        yield line([
+            json.dumps(row[column], separators=(",", ":"), ensure_ascii=False) if isinstance(row[column], (list, dict)) else row[column]
+            for column in columns
+        ] + [cursor])
+
+
+def chunked(lines: Iterator[str], chunk_bytes: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    pending: List[str] = []
+    size = 0
+    for text in lines:
+        pending.append(text)
+        size += len(text)
+        if size >= chunk_bytes:
+            yield "".join(pending).encode("utf-8")
+            pending.clear()
+            size = 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+# --- STREAMING ---
+
+async def stream_chunks(chunks: Iterator[bytes], executor: Optional[NamedExecutor] = None) -> AsyncIterator[bytes]:
+    """
+    Entrega los trozos a StreamingResponse, que envía cada uno antes de pedir el siguiente.
+    Con `executor` (fuentes que leen de disco) cada trozo se produce en ese executor; sin él, en el event loop,
+    cediendo el control entre trozos para no acaparar el loop durante una exportación grande.
+    """
+    try:
+        while True:
+            if executor is not None:
+                chunk = await executor.run(next, chunks, None)
+            else:
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+            if executor is None:
+                await asyncio.sleep(0)
+    finally:
+        # Cliente desconectado o fin: cierra el archivo de pagos si quedó abierto. Si la desconexión llegó
+        # mientras un hilo del executor producía un trozo, el generador se libera al terminar ese hilo.
+        try:
+            chunks.close()
+        except ValueError:
+            pass
+
+
+# Medición de memoria de la exportación: lista JSON completa vs streaming (opcional)
+# Uso: python -m app.services.exporter [pedidos]
+if __name__ == "__main__":
+    import sys
+    import time
+    import tracemalloc
+    from app.models.order import Order, OrderItem
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    base = datetime.datetime(2024, 1, 1)
+    orders = [
+        Order(id=i, user_id="ignacio_tapia", items=[OrderItem(product_id=1, quantity=2), OrderItem(product_id=4, quantity=1)],
+              total_amount=18200.0, order_date=base + datetime.timedelta(minutes=i))
+        for i in range(1, count + 1)
+    ]
+
+    def full_json() -> int:
+        body = json.dumps([order.model_dump(mode="json") for order in orders]).encode("utf-8")
+        return len(body)
+
+    def streamed(fmt: str) -> int:
+        rows = order_rows(orders, None, None, {})
+        lines = to_csv(rows, ORDER_COLUMNS) if fmt == "csv" else to_ndjson(rows)
+        return sum(len(chunk) for chunk in chunked(lines))
+
+    print(f"{count} pedidos")
+    for label, run in (("lista JSON", full_json), ("NDJSON stream", lambda: streamed("ndjson")), ("CSV stream", lambda: streamed("csv"))):
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = run()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {label:<14} {size / 2**20:7.1f} MiB enviados  pico {peak / 2**20:7.2f} MiB  {elapsed:5.2f} s")
@@ -0,0 +1,146 @@
+import os
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+# Tiempo que se conserva la respuesta de una clave de idempotencia y tamaño máximo de la caché
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+
+
+class IdempotencyConflictError(ValueError):
+    """La misma clave de idempotencia se reutilizó con un cuerpo de solicitud distinto."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "result", "error", "expires_at", "waiters")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.expires_at = float("inf")
+        # Duplicados que esperan desde el event loop (run_async): se despiertan sin ocupar un hilo
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+def _wake(future: asyncio.Future):
+    if not future.done(): # El solicitante pudo haberse desconectado
+        future.set_result(None)
+
+
+class IdempotencyCache:
+    """
+    Caché de respuestas por clave de idempotencia, acotada en tamaño y con expiración (TTL).
+    Las solicitudes duplicadas concurrentes se colapsan: sólo la primera ejecuta el trabajo
+    y las demás esperan su resultado y lo reutilizan.
+    Los errores no se guardan, así que un reintento posterior vuelve a ejecutar el trabajo.
+    """
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # Las entradas terminadas se mueven al final, así que las más antiguas quedan al principio
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry.done.is_set() and (entry.expires_at <= now or len(entries) >= self.max_entries):
+                entries.popitem(last=False)
+            else:
+                break
+
+    def _claim(self, key: str, fingerprint: str) -> Tuple[_Entry, bool]:
+        """
+        Devuelve la entrada de la clave y si esta solicitud es la que debe ejecutar el trabajo.
+        """
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    raise IdempotencyConflictError("La clave de idempotencia ya fue usada con otra solicitud.")
+                return entry, False
+            entry = _Entry(fingerprint)
+            self._entries[key] = entry
+            return entry, True
+
+    def _finish(self, key: str, entry: _Entry, result: Any = None, error: Optional[BaseException] = None):
+        with self._lock:
+            if error is not None:
+                entry.error = error
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            else:
+                entry.result = result
+                entry.expires_at = time.monotonic() + self.ttl_seconds
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            entry.done.set()
+            waiters, entry.waiters = entry.waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    @staticmethod
+    def _replay(entry: _Entry) -> Tuple[Any, bool]:
+        if entry.error is not None:
+            raise entry.error
+        return entry.result, True
+
+    def run(self, key: str, fingerprint: str, work: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Ejecuta `work` una sola vez por clave.
+        Devuelve (resultado, replayed), donde replayed indica si el resultado se reutilizó.
+        Lanza IdempotencyConflictError si la clave ya se usó con otro `fingerprint`.
+        """
+        entry, owner = self._claim(key, fingerprint)
+        if not owner:
+            entry.done.wait()
+            return self._replay(entry)
+
+        try:
+            result = work()
+        except BaseException as e:
+            self._finish(key, entry, error=e)
+            raise
+        self._finish(key, entry, result=result)
+        return result, False
+
+    async def run_async(self, key: str, fingerprint: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Igual que run(), para trabajo asíncrono: los duplicados concurrentes esperan en el event loop
+        en lugar de ocupar un hilo cada uno. El trabajo sigue aunque el primer solicitante se desconecte,
+        para que los duplicados reciban su resultado.
+        """
+        entry, owner = self._claim(key, fingerprint)
+        if not owner:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                waiting = not entry.done.is_set()
+                if waiting:
+                    entry.waiters.append((loop, future))
+            if waiting:
+                await future
+            return self._replay(entry)
+
+        def record(task: asyncio.Task):
+            if task.cancelled():
+                self._finish(key, entry, error=asyncio.CancelledError())
+            elif task.exception() is not None:
+                self._finish(key, entry, error=task.exception())
+            else:
+                self._finish(key, entry, result=task.result())
+
+        task = asyncio.ensure_future(work())
+        task.add_done_callback(record)
+        return await asyncio.shield(task), False
+
+    def __len__(self) -> int:
+        return len(self._entries)
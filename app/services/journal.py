@@ -0,0 +1,475 @@
+import os
+import json
+import time
+import zlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.services.executors import disk_executor
+
+try:
+    import fcntl # Bloqueo exclusivo del directorio entre procesos (sólo POSIX)
+except ImportError:
+    fcntl = None
+
+# Configuración del journal (variables de entorno)
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "data/journal") # Vacío desactiva la persistencia
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "interval") # "always", "interval" u "off"
+JOURNAL_FSYNC_INTERVAL_MS = float(os.getenv("JOURNAL_FSYNC_INTERVAL_MS", "50"))
+JOURNAL_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("JOURNAL_SNAPSHOT_INTERVAL_SECONDS", "300"))
+JOURNAL_SNAPSHOT_EVERY_RECORDS = int(os.getenv("JOURNAL_SNAPSHOT_EVERY_RECORDS", "100000"))
+
+FSYNC_POLICIES = ("always", "interval", "off")
+
+_SEGMENT_PREFIX = "journal-"
+_SNAPSHOT_PREFIX = "snapshot-"
+_LOCK_NAME = "LOCK"
+
+
+class JournalLockedError(RuntimeError):
+    """Otro proceso (ej. otro worker de uvicorn) ya usa el directorio del journal."""
+
+
+class JournalCorruptError(RuntimeError):
+    """Hay un registro corrupto antes del final del journal: reaplicar lo que sigue dejaría un hueco."""
+
+
+class JournalWriteError(RuntimeError):
+    """El hilo escritor no pudo escribir en disco: las mutaciones siguientes ya no son durables (main.py responde 503)."""
+
+
+def _encode(lsn: int, op: str, payload: Any) -> bytes:
+    # Cada línea lleva su CRC32 para detectar una cola escrita a medias después de una caída
+    body = json.dumps([lsn, op, payload], separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+
+def _decode(line: bytes) -> Optional[Tuple[int, str, Any]]:
+    if not line.endswith(b"\n") or len(line) < 10:
+        return None
+    body = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(body):
+            return None
+        lsn, op, payload = json.loads(body)
+    except ValueError:
+        return None
+    return lsn, op, payload
+
+
+def _fsync_dir(path: str):
+    # Asegura que los renombres y archivos nuevos del directorio queden en disco (no disponible en Windows)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """
+    Journal de escritura anticipada (write-ahead log) para las "bases de datos" en memoria.
+    Cada mutación se agrega como una línea (LSN, operación, datos); un hilo escritor agrupa
+    las líneas pendientes y hace un solo write + fsync por lote (group commit) según la política:
+      - "always":   append() espera a que su registro esté en disco; los escritores concurrentes comparten el fsync.
+      - "interval": append() no espera; el lote se sincroniza cada JOURNAL_FSYNC_INTERVAL_MS.
+      - "off":      se escribe sin fsync (el sistema operativo decide cuándo).
+    Periódicamente se toma un snapshot compacto de todos los stores y se descartan los segmentos
+    ya cubiertos, así que la recuperación carga el último snapshot y sólo reaplica la cola.
+
+    Las operaciones deben ser idempotentes (valores absolutos, altas por ID), porque un snapshot
+    se toma sin detener las escrituras y puede incluir efectos de registros posteriores a su LSN.
+
+    Un directorio pertenece a un solo proceso: recover() toma un bloqueo exclusivo (flock) y falla con
+    JournalLockedError si otro proceso lo tiene. Con varios workers, cada uno necesita su propio JOURNAL_DIR.
+    """
+
+    def __init__(
+        self,
+        directory: str = JOURNAL_DIR,
+        fsync_policy: str = JOURNAL_FSYNC,
+        fsync_interval_ms: float = JOURNAL_FSYNC_INTERVAL_MS,
+        snapshot_interval_seconds: float = JOURNAL_SNAPSHOT_INTERVAL_SECONDS,
+        snapshot_every_records: int = JOURNAL_SNAPSHOT_EVERY_RECORDS,
+    ):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync inválida '{fsync_policy}'. Opciones: {FSYNC_POLICIES}")
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        self.snapshot_every_records = snapshot_every_records
+
+        self._stores: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+        self._ops: Dict[str, Callable[[Any], None]] = {}
+        self._recovered_hooks: List[Callable[[], None]] = []
+
+        self._cond = threading.Condition()
+        self._pending: List[bytes] = []
+        self._next_lsn = 1
+        self._durable_lsn = 0
+        self._snapshot_lsn = 0
+        self._rotate = True # El primer lote abre un segmento nuevo
+        self._segment = None
+        self._closing = False
+        self._failed: Optional[JournalWriteError] = None # Error del hilo escritor; append() y sync() lo lanzan
+        self._stopped = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._snapshotter: Optional[threading.Thread] = None
+        self._snapshot_lock = threading.Lock()
+        self._recovering = False
+        self._dir_lock = None # Archivo LOCK abierto mientras este proceso es dueño del directorio
+
+    # --- REGISTRO DE STORES ---
+
+    def register_store(self, name: str, dump: Callable[[], Any], load: Callable[[Any], None]):
+        """
+        Registra un store para los snapshots: dump() devuelve su estado serializable a JSON
+        y load(estado) lo reemplaza al recuperar.
+        """
+        self._stores[name] = (dump, load)
+
+    def register_op(self, op: str, apply: Callable[[Any], None]):
+        """
+        Registra cómo reaplicar una operación del journal durante la recuperación.
+        """
+        self._ops[op] = apply
+
+    def on_recovered(self, hook: Callable[[], None]):
+        """
+        Registra una función que se ejecuta al terminar la recuperación (ej. reconstruir índices).
+        """
+        self._recovered_hooks.append(hook)
+
+    # --- ESCRITURA ---
+
+    def append(self, op: str, payload: Any, wait: bool = True) -> int:
+        """
+        Agrega una mutación al journal y devuelve su LSN.
+        Con la política "always" y wait=True, vuelve sólo cuando el registro está en disco.
+        Con wait=False se puede esperar después (fuera de un lock) con sync(lsn).
+        Lanza JournalWriteError si el hilo escritor falló.
+        """
+        if not self.enabled or self._recovering:
+            return 0
+        with self._cond:
+            if self._failed is not None:
+                raise self._failed
+            lsn = self._next_lsn
+            self._next_lsn += 1
+            self._pending.append(_encode(lsn, op, payload))
+            self._cond.notify_all()
+        if wait:
+            self.sync(lsn)
+        return lsn
+
+    def sync(self, lsn: int):
+        """
+        Con la política "always", espera a que el registro `lsn` (y todos los anteriores) estén en disco.
+        Lanza JournalWriteError si el hilo escritor falló antes de escribirlo.
+        """
+        if self.fsync_policy != "always" or self._writer is None:
+            return
+        with self._cond:
+            while self._durable_lsn < lsn and not self._closing and self._failed is None:
+                self._cond.wait()
+            if self._durable_lsn < lsn and self._failed is not None:
+                raise self._failed
+
+    async def sync_async(self, lsn: int):
+        """
+        sync() para handlers async: si todavía hay que esperar el fsync, la espera ocurre en el executor de disco.
+        """
+        if self._failed is not None:
+            raise self._failed
+        if self.fsync_policy != "always" or self._writer is None or self._durable_lsn >= lsn:
+            return
+        await disk_executor.run(self.sync, lsn)
+
+    def _open_segment(self, first_lsn: int):
+        if self._segment is not None:
+            self._segment.close()
+        path = os.path.join(self.directory, f"{_SEGMENT_PREFIX}{first_lsn:020d}.log")
+        self._segment = open(path, "ab")
+        _fsync_dir(self.directory)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending and self._closing:
+                    return
+                batch = self._pending
+                self._pending = []
+                last_lsn = self._next_lsn - 1
+                rotate = self._rotate
+                self._rotate = False
+
+            try:
+                if rotate:
+                    self._open_segment(last_lsn - len(batch) + 1)
+                self._segment.write(b"".join(batch))
+                self._segment.flush()
+                if self.fsync_policy != "off":
+                    os.fsync(self._segment.fileno())
+            except Exception as e:
+                # Sin esto el hilo muere en silencio y quien espera en sync() queda bloqueado para siempre
+                print(f"Error del escritor del journal (LSN {last_lsn - len(batch) + 1}-{last_lsn}): {e}")
+                with self._cond:
+                    self._failed = JournalWriteError(f"No se pudo escribir el journal en '{self.directory}': {e}")
+                    self._failed.__cause__ = e
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                self._durable_lsn = last_lsn
+                self._cond.notify_all()
+
+            if self.fsync_policy == "interval" and not self._closing:
+                time.sleep(self.fsync_interval) # Acumula el siguiente lote
+
+    # --- SNAPSHOTS ---
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(".log"):
+                segments.append((int(name[len(_SEGMENT_PREFIX):-4]), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _snapshots(self) -> List[Tuple[int, str]]:
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SNAPSHOT_PREFIX) and name.endswith(".json"):
+                snapshots.append((int(name[len(_SNAPSHOT_PREFIX):-5]), os.path.join(self.directory, name)))
+        return sorted(snapshots)
+
+    def snapshot(self) -> int:
+        """
+        Escribe un snapshot de todos los stores y elimina los segmentos y snapshots que ya cubre.
+        Devuelve el LSN del snapshot.
+        """
+        if not self.enabled:
+            return 0
+        with self._snapshot_lock:
+            with self._cond:
+                # Todo registro con LSN <= lsn ya aplicó su mutación (se mutan los stores antes de append)
+                lsn = self._next_lsn - 1
+                self._rotate = True # Los registros siguientes van a un segmento nuevo
+            state = {"lsn": lsn, "stores": {name: dump() for name, (dump, _) in self._stores.items()}}
+
+            path = os.path.join(self.directory, f"{_SNAPSHOT_PREFIX}{lsn:020d}.json")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"), ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            _fsync_dir(self.directory)
+            self._snapshot_lsn = lsn
+
+            # Un segmento es prescindible si el siguiente empieza en o antes de lsn + 1
+            segments = self._segments()
+            for (start, seg_path), (next_start, _) in zip(segments, segments[1:]):
+                if next_start <= lsn + 1:
+                    os.remove(seg_path)
+            for snap_lsn, snap_path in self._snapshots():
+                if snap_lsn < lsn:
+                    os.remove(snap_path)
+            return lsn
+
+    def _snapshot_loop(self):
+        last = time.monotonic()
+        while not self._stopped.wait(1):
+            due_by_time = time.monotonic() - last >= self.snapshot_interval_seconds
+            due_by_size = self._next_lsn - 1 - self._snapshot_lsn >= self.snapshot_every_records
+            if (due_by_time or due_by_size) and self._next_lsn - 1 > self._snapshot_lsn:
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"Error al tomar snapshot del journal: {e}")
+                last = time.monotonic()
+
+    # --- RECUPERACIÓN ---
+
+    def _lock_directory(self):
+        if self._dir_lock is not None or fcntl is None:
+            return
+        lock_file = open(os.path.join(self.directory, _LOCK_NAME), "a+b")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise JournalLockedError(
+                f"El journal en '{self.directory}' está en uso por otro proceso. "
+                "Con varios workers, cada uno necesita su propio JOURNAL_DIR (o se usa un solo worker)."
+            )
+        self._dir_lock = lock_file
+
+    def _unlock_directory(self):
+        if self._dir_lock is not None:
+            self._dir_lock.close() # Cerrar el archivo libera el flock
+            self._dir_lock = None
+
+    def recover(self) -> Dict[str, Any]:
+        """
+        Carga el último snapshot válido y reaplica sólo los registros posteriores del journal.
+        Debe llamarse al iniciar, antes de start() y antes de atender solicitudes.
+        """
+        if not self.enabled:
+            return {"enabled": False}
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_directory()
+        started = time.perf_counter()
+        self._recovering = True
+        try:
+            snapshot_lsn = 0
+            for lsn, path in reversed(self._snapshots()):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        state = json.load(f)
+                except ValueError:
+                    print(f"Advertencia: snapshot corrupto ignorado: {path}")
+                    continue
+                for name, stored in state["stores"].items():
+                    if name in self._stores:
+                        self._stores[name][1](stored)
+                snapshot_lsn = state["lsn"]
+                break
+
+            last_lsn = snapshot_lsn
+            replayed = 0
+            segments = self._segments()
+            for index, (start, path) in enumerate(segments):
+                with open(path, "r+b") as f:
+                    offset = 0
+                    for line in f:
+                        record = _decode(line)
+                        if record is None:
+                            # Una cola a medias sólo puede estar al final: si después hay registros válidos, es corrupción
+                            if index < len(segments) - 1 or any(_decode(rest) is not None for rest in f):
+                                raise JournalCorruptError(
+                                    f"Registro corrupto en {path} (offset {offset}, después del LSN {last_lsn}) "
+                                    "con registros válidos después; no se reaplica una historia con huecos."
+                                )
+                            # Cola escrita a medias en el último segmento (caída): se corta para que
+                            # los segmentos que se escriban después no queden detrás de ella
+                            print(f"Advertencia: cola del journal incompleta o corrupta en {path}; se descarta desde el offset {offset}.")
+                            f.truncate(offset)
+                            os.fsync(f.fileno())
+                            break
+                        offset += len(line)
+                        lsn, op, payload = record
+                        if lsn <= snapshot_lsn:
+                            continue
+                        apply = self._ops.get(op)
+                        if apply is not None:
+                            apply(payload)
+                        last_lsn = lsn
+                        replayed += 1
+
+            for hook in self._recovered_hooks:
+                hook()
+        finally:
+            self._recovering = False
+
+        self._next_lsn = last_lsn + 1
+        self._durable_lsn = last_lsn
+        self._snapshot_lsn = snapshot_lsn
+        self._rotate = True # Nunca se escribe detrás de una cola posiblemente corrupta
+        return {
+            "snapshot_lsn": snapshot_lsn,
+            "replayed": replayed,
+            "last_lsn": last_lsn,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+
+    # --- CICLO DE VIDA ---
+
+    def start(self):
+        if not self.enabled or self._writer is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._closing = False
+        self._failed = None
+        self._rotate = True # Tras un fallo, el segmento anterior puede terminar en un lote incompleto
+        self._stopped.clear()
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+        self._snapshotter = threading.Thread(target=self._snapshot_loop, name="journal-snapshot", daemon=True)
+        self._snapshotter.start()
+
+    def close(self):
+        if self._writer is None:
+            self._unlock_directory()
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._stopped.set()
+        self._writer.join()
+        self._snapshotter.join()
+        self._writer = None
+        self._snapshotter = None
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        self._unlock_directory()
+
+
+# Journal compartido por los stores en memoria (pedidos, mensajes de contacto, productos y stock).
+# main.py lo recupera y lo inicia al arrancar la aplicación.
+store_journal = Journal()
+
+
+# Benchmark de escritura por política de fsync y de recuperación (opcional)
+# Uso: python -m app.services.journal [pedidos_para_recuperación]
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    def order_row(i: int) -> list:
+        return [i, "ignacio_tapia", [[1, 2], [4, 1]], 18200.0, 1760000000.0 + i, "pending"]
+
+    print("Escritura (8 hilos, 20.000 registros):")
+    for policy in FSYNC_POLICIES:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Journal(tmp, fsync_policy=policy, snapshot_interval_seconds=1e9, snapshot_every_records=10**12)
+            journal.recover()
+            journal.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(lambda i: journal.append("order.put", order_row(i)), range(20_000)))
+            journal.close()
+            elapsed = time.perf_counter() - started
+            print(f"  {policy:9s} {20_000 / elapsed:10.0f} registros/s")
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tail = count // 100
+    with tempfile.TemporaryDirectory() as tmp:
+        rows: List[list] = []
+        journal = Journal(tmp, fsync_policy="off", snapshot_interval_seconds=1e9, snapshot_every_records=10**12)
+        journal.register_store("orders", lambda: rows, rows.extend)
+        journal.register_op("order.put", rows.append)
+        journal.recover()
+        journal.start()
+        for i in range(count - tail):
+            rows.append(order_row(i))
+            journal.append("order.put", rows[-1])
+        journal.snapshot()
+        for i in range(count - tail, count):
+            rows.append(order_row(i))
+            journal.append("order.put", rows[-1])
+        journal.close()
+
+        rows.clear()
+        result = journal.recover()
+        print(f"Recuperación de {count} pedidos (snapshot + {tail} en la cola): {result['seconds']:.2f} s, {len(rows)} cargados")
@@ -0,0 +1,230 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import stripe
+
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.payment_store import StoredPayment, now_epoch
+from app.services.stripe_service import from_stripe_amount
+
+# Configuración del job de conciliación (variables de entorno, con valores por defecto razonables)
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("PAYMENT_RECONCILE_INTERVAL_SECONDS", "300")) # 0 desactiva el job en segundo plano
+RECONCILE_STALE_AFTER_SECONDS = float(os.getenv("PAYMENT_RECONCILE_STALE_AFTER_SECONDS", "900"))
+RECONCILE_BATCH_SIZE = int(os.getenv("PAYMENT_RECONCILE_BATCH_SIZE", "100"))
+RECONCILE_MAX_CONCURRENCY = int(os.getenv("PAYMENT_RECONCILE_MAX_CONCURRENCY", "8"))
+RECONCILE_MAX_RETRIES = int(os.getenv("PAYMENT_RECONCILE_MAX_RETRIES", "4"))
+
+# Errores de Stripe que vale la pena reintentar (transitorios)
+_RETRYABLE_ERRORS = (stripe.error.RateLimitError, stripe.error.APIConnectionError)
+
+
+def _retrieve_session(session_id: str):
+    return stripe.checkout.Session.retrieve(session_id)
+
+
+def _status_from_session(session) -> Optional[str]:
+    """
+    Traduce el estado de una sesión de Stripe al estado local del registro de pago.
+    Devuelve None si la sesión sigue abierta y no hay nada que actualizar.
+    """
+    if session["payment_status"] in ("paid", "no_payment_required"):
+        return "paid"
+    if session["status"] == "expired":
+        return "expired"
+    return None
+
+
+class PaymentReconciler:
+    """
+    Concilia los registros de pago que quedaron en 'pending' (por ejemplo, si se perdió un webhook)
+    consultando el estado real de la sesión en Stripe.
+    Las consultas se hacen en lotes concurrentes con paralelismo acotado y reintentos con backoff,
+    y los cambios se aplican en bloque al final de cada lote.
+    Cada consulta pasa por el circuit breaker "stripe" del servicio (stripe_service.breaker), el mismo del checkout.
+    `fetch_session` se puede reemplazar por un stub local de Stripe.
+    """
+
+    def __init__(
+        self,
+        stripe_service,
+        fetch_session: Callable[[str], Any] = _retrieve_session,
+        stale_after_seconds: float = RECONCILE_STALE_AFTER_SECONDS,
+        batch_size: int = RECONCILE_BATCH_SIZE,
+        max_concurrency: int = RECONCILE_MAX_CONCURRENCY,
+        max_retries: int = RECONCILE_MAX_RETRIES,
+        backoff_base_seconds: float = 0.5,
+    ):
+        self.stripe_service = stripe_service
+        self.fetch_session = fetch_session
+        self.stale_after_seconds = stale_after_seconds
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, Any] = {
+            "runs": 0,
+            "last_run_at": None,
+            "last_run_seconds": 0.0,
+            "last_checked": 0,
+            "last_updated": 0,
+            "last_failed": 0,
+            "throughput_per_second": 0.0,
+            "oldest_pending_lag_seconds": 0.0,
+            "total_updated": 0,
+            "total_archived": 0,
+        }
+
+    # --- SELECCIÓN Y CONSULTA ---
+
+    def select_stale_pending(self) -> List[StoredPayment]:
+        """
+        Registros 'pending' cuya última actualización es más antigua que stale_after_seconds.
+        """
+        cutoff = now_epoch() - self.stale_after_seconds
+        return [
+            record for record in self.stripe_service.payment_records
+            if record.status == "pending" and record.updated_at <= cutoff
+        ]
+
+    def _fetch(self, session_id: str):
+        # Con el circuito abierto falla de inmediato con CircuitOpenError (no se reintenta) en vez de esperar timeouts
+        return self.stripe_service.breaker.call(self.fetch_session, session_id)
+
+    def _fetch_with_backoff(self, session_id: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._fetch(session_id)
+            except _RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                # Backoff exponencial con jitter completo
+                time.sleep(random.uniform(0, self.backoff_base_seconds * (2 ** attempt)))
+
+    def _fetch_batch(self, executor: ThreadPoolExecutor, session_ids: List[str]) -> Dict[str, Any]:
+        futures = {session_id: executor.submit(self._fetch_with_backoff, session_id) for session_id in session_ids}
+        sessions = {}
+        for session_id, future in futures.items():
+            try:
+                sessions[session_id] = future.result()
+            except Exception as e:
+                print(f"Error al consultar la sesión {session_id} en Stripe: {e}")
+        return sessions
+
+    # --- APLICACIÓN DE CAMBIOS ---
+
+    def _apply_updates(self, sessions: Dict[str, Any]) -> int:
+        """
+        Aplica en bloque los estados obtenidos de Stripe a los registros locales.
+        """
+        updated_at = now_epoch()
+        updated = 0
+        for session_id, session in sessions.items():
+            record = self.stripe_service.payment_records.get(session_id)
+            if record is None or record.status != "pending":
+                continue # Un webhook pudo haber actualizado el registro mientras tanto
+            new_status = _status_from_session(session)
+            if new_status is None:
+                continue
+            record.status = new_status
+            record.updated_at = updated_at
+            if new_status == "paid":
+                record.stripe_payment_intent_id = session["payment_intent"]
+                if session["amount_total"] is not None:
+                    record.amount_total = from_stripe_amount(session["amount_total"], session["currency"] or record.currency)
+                if session["currency"]:
+                    record.currency = session["currency"].upper()
+            self.stripe_service.payment_records.save(record)
+            updated += 1
+        return updated
+
+    def reconcile_session(self, session_id: str) -> Optional[StoredPayment]:
+        """
+        Concilia inmediatamente un único registro (usado por /payments/success).
+        Hace un solo intento sin backoff, porque el usuario está esperando la página; si Stripe
+        falla, el registro sigue 'pending' y lo concilia el job en segundo plano.
+        Lanza CircuitOpenError sin llamar a Stripe si su circuit breaker está abierto.
+        """
+        record = self.stripe_service.get_payment_record_by_session_id(session_id)
+        if record is None or record.status != "pending":
+            return record
+        try:
+            session = self._fetch(session_id)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"Error al consultar la sesión {session_id} en Stripe: {e}")
+            return record
+        self._apply_updates({session_id: session})
+        return record
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        Ejecuta una pasada completa de conciliación y devuelve las métricas de la pasada.
+        """
+        with self._run_lock:
+            started = time.perf_counter()
+            stale = self.select_stale_pending()
+            checked = updated = failed = 0
+
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="payment-reconciler") as executor:
+                for start in range(0, len(stale), self.batch_size):
+                    batch_ids = [record.stripe_session_id for record in stale[start:start + self.batch_size]]
+                    sessions = self._fetch_batch(executor, batch_ids)
+                    checked += len(batch_ids)
+                    failed += len(batch_ids) - len(sessions)
+                    updated += self._apply_updates(sessions)
+
+            elapsed = time.perf_counter() - started
+            now = now_epoch()
+            pending_dates = [record.created_at for record in self.stripe_service.payment_records if record.status == "pending"]
+            self.stats.update({
+                "runs": self.stats["runs"] + 1,
+                "last_run_at": now,
+                "last_run_seconds": round(elapsed, 4),
+                "last_checked": checked,
+                "last_updated": updated,
+                "last_failed": failed,
+                "throughput_per_second": round(checked / elapsed, 2) if elapsed > 0 else 0.0,
+                "oldest_pending_lag_seconds": now - min(pending_dates) if pending_dates else 0.0,
+                "total_updated": self.stats["total_updated"] + updated,
+            })
+            return dict(self.stats)
+
+    # --- JOB EN SEGUNDO PLANO ---
+
+    def archive_settled(self) -> int:
+        """
+        Mueve al archivo en disco los registros ya liquidados y antiguos.
+        """
+        archived = self.stripe_service.payment_records.archive_settled()
+        self.stats["total_archived"] += archived
+        return archived
+
+    def _loop(self, interval_seconds: float):
+        while not self._stop.wait(interval_seconds):
+            try:
+                self.run_once()
+                self.archive_settled()
+            except Exception as e:
+                print(f"Error inesperado en la conciliación de pagos: {e}")
+
+    def start(self, interval_seconds: float = RECONCILE_INTERVAL_SECONDS):
+        if interval_seconds <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval_seconds,), name="payment-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
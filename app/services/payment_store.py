@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import datetime
+import itertools
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Registros liquidados más antiguos que esto se mueven al archivo en disco
+PAYMENT_ARCHIVE_PATH = os.getenv("PAYMENT_ARCHIVE_PATH", "data/payments_archive.ndjson")
+PAYMENT_ARCHIVE_AFTER_SECONDS = float(os.getenv("PAYMENT_ARCHIVE_AFTER_SECONDS", str(7 * 24 * 3600)))
+
+# Estados finales: un pago en estos estados ya no cambia y se puede archivar
+SETTLED_STATUSES = frozenset({"paid", "expired", "failed"})
+
+# (product_id, nombre, precio unitario en centavos, cantidad)
+ItemSnapshot = Tuple[int, str, int, int]
+
+
+def _iso(timestamp: int) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+def now_epoch() -> int:
+    return int(time.time())
+
+
+class StoredPayment:
+    """
+    Registro de pago compacto: atributos con __slots__, timestamps como enteros epoch,
+    cadenas repetidas (moneda, estado, usuario, nombres de producto) internadas
+    y el snapshot de ítems como tuplas en lugar de diccionarios.
+    to_dict() entrega la misma forma que los registros antiguos (PaymentRecord).
+    """
+    __slots__ = (
+        "id", "client_username", "stripe_session_id", "stripe_payment_intent_id",
+        "amount_total", "_currency", "_status", "created_at", "updated_at",
+        "items_snapshot", "order_id",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        client_username: str,
+        stripe_session_id: str,
+        amount_total: float,
+        currency: str,
+        status: str,
+        created_at: int,
+        updated_at: int,
+        items_snapshot: Tuple[ItemSnapshot, ...] = (),
+        order_id: Optional[int] = None,
+        stripe_payment_intent_id: Optional[str] = None,
+    ):
+        self.id = id
+        self.client_username = sys.intern(client_username)
+        self.stripe_session_id = stripe_session_id
+        self.stripe_payment_intent_id = stripe_payment_intent_id
+        self.amount_total = amount_total
+        self.currency = currency
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.items_snapshot = tuple(
+            (product_id, sys.intern(name), unit_cents, quantity)
+            for product_id, name, unit_cents, quantity in items_snapshot
+        )
+        self.order_id = order_id
+
+    @property
+    def currency(self) -> str:
+        return self._currency
+
+    @currency.setter
+    def currency(self, value: str):
+        self._currency = sys.intern(value)
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, value: str):
+        self._status = sys.intern(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "client_username": self.client_username,
+            "stripe_session_id": self.stripe_session_id,
+            "stripe_payment_intent_id": self.stripe_payment_intent_id,
+            "amount_total": self.amount_total,
+            "currency": self.currency,
+            "status": self.status,
+            "created_at": _iso(self.created_at),
+            "updated_at": _iso(self.updated_at),
+            "items_snapshot": [
+                {"product_id": product_id, "name": name, "price": unit_cents / 100, "quantity": quantity}
+                for product_id, name, unit_cents, quantity in self.items_snapshot
+            ],
+            "order_id": self.order_id,
+        }
+
+    # Fila compacta (lista JSON posicional) para el archivo en disco
+    def to_row(self) -> list:
+        return [
+            self.id, self.client_username, self.stripe_session_id, self.stripe_payment_intent_id,
+            self.amount_total, self.currency, self.status, self.created_at, self.updated_at,
+            self.items_snapshot, self.order_id,
+        ]
+
+    @classmethod
+    def from_row(cls, row: list) -> "StoredPayment":
+        (id, client_username, session_id, payment_intent_id, amount_total, currency,
+         status, created_at, updated_at, items, order_id) = row
+        return cls(
+            id=id, client_username=client_username, stripe_session_id=session_id,
+            amount_total=amount_total, currency=currency, status=status,
+            created_at=created_at, updated_at=updated_at,
+            items_snapshot=tuple(tuple(item) for item in items),
+            order_id=order_id, stripe_payment_intent_id=payment_intent_id,
+        )
+
+
+class PaymentStore:
+    """
+    Colección de registros de pago indexada por ID de sesión de Stripe.
+    Los registros liquidados y antiguos se archivan en un log de solo-agregado (una fila JSON por línea);
+    en memoria sólo queda su offset en el archivo y se cargan de forma perezosa al buscarlos.
+    Con `journal`, cada alta o cambio de un registro en memoria se registra como "payment.put"
+    (fila completa), así que los pagos pendientes sobreviven a un reinicio.
+    """
+
+    def __init__(self, archive_path: str = PAYMENT_ARCHIVE_PATH, archive_after_seconds: float = PAYMENT_ARCHIVE_AFTER_SECONDS, journal=None):
+        self.archive_path = archive_path
+        self.archive_after_seconds = archive_after_seconds
+        self.journal = journal
+        self._records: Dict[str, StoredPayment] = {}
+        self._archive_index: Dict[str, int] = {}
+        self._max_archived_id = 0
+        self._lock = threading.Lock()
+        # Identifica esta instancia: los IDs de los registros en memoria se reinician al reiniciar el proceso
+        self.instance_id = os.urandom(4).hex()
+        self._load_archive_index()
+        self._ids = itertools.count(self._max_archived_id + 1) # Los IDs continúan después de los archivados
+
+    def _load_archive_index(self):
+        if not os.path.exists(self.archive_path):
+            return
+        with open(self.archive_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.endswith(b"\n"): # Una línea incompleta al final (caída a mitad de escritura) se ignora
+                    row = json.loads(line)
+                    self._archive_index[row[2]] = offset
+                    self._max_archived_id = max(self._max_archived_id, row[0])
+                offset += len(line)
+
+    def _journal(self, record: StoredPayment) -> int:
+        # Se llama con el lock tomado, para que el orden en el journal coincida con el orden en memoria
+        if self.journal is None:
+            return 0
+        return self.journal.append("payment.put", record.to_row(), wait=False)
+
+    # --- ACCESO ---
+
+    def add(self, record: StoredPayment) -> int:
+        with self._lock:
+            self._records[record.stripe_session_id] = record
+            return self._journal(record)
+
+    def save(self, record: StoredPayment) -> int:
+        """
+        Registra en el journal un cambio hecho en el lugar sobre un registro en memoria (estado, montos).
+        Devuelve el LSN (0 sin journal).
+        """
+        with self._lock:
+            return self._journal(record)
+
+    def get(self, session_id: str) -> Optional[StoredPayment]:
+        record = self._records.get(session_id)
+        if record is not None:
+            return record
+        offset = self._archive_index.get(session_id)
+        if offset is None:
+            return None
+        with open(self.archive_path, "rb") as f:
+            f.seek(offset)
+            return StoredPayment.from_row(json.loads(f.readline()))
+
+    def __iter__(self) -> Iterator[StoredPayment]:
+        # Copia de los valores para poder iterar mientras otros hilos agregan registros
+        return iter(list(self._records.values()))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def archived_count(self) -> int:
+        return len(self._archive_index)
+
+    @property
+    def max_id(self) -> int:
+        """
+        Mayor ID entre los registros archivados y los que están en memoria (0 si no hay ninguno).
+        """
+        with self._lock:
+            return max([self._max_archived_id] + [record.id for record in self._records.values()])
+
+    def next_id(self) -> int:
+        """
+        Reserva el siguiente ID de pago. Se toma bajo el lock: los checkouts corren en varios hilos (http_executor).
+        """
+        with self._lock:
+            return next(self._ids)
+
+    def resume_ids(self):
+        """
+        Hace que los próximos IDs continúen después del mayor ya usado (tras recuperar los registros del journal).
+        """
+        with self._lock:
+            used = max([self._max_archived_id] + [record.id for record in self._records.values()])
+            self._ids = itertools.count(max(used + 1, next(self._ids)))
+
+    def iter_archived(self) -> Iterator[StoredPayment]:
+        if not os.path.exists(self.archive_path):
+            return
+        with open(self.archive_path, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    yield StoredPayment.from_row(json.loads(line))
+
+    # --- PERSISTENCIA (JOURNAL Y SNAPSHOTS) ---
+
+    def dump(self) -> List[list]:
+        with self._lock:
+            return [record.to_row() for record in self._records.values()]
+
+    def load(self, rows: List[list]):
+        with self._lock:
+            self._records = {
+                row[2]: StoredPayment.from_row(row) for row in rows
+                if row[2] not in self._archive_index
+            }
+
+    def replay_put(self, row: list):
+        # Un registro que se archivó después de este cambio ya está completo en el archivo
+        if row[2] in self._archive_index:
+            return
+        with self._lock:
+            self._records[row[2]] = StoredPayment.from_row(row)
+
+    # --- EXPORTACIÓN ---
+
+    def export_snapshot(self) -> Tuple[int, List[StoredPayment]]:
+        """
+        Tamaño actual del archivo y registros en memoria ordenados por ID, tomados juntos bajo el lock:
+        un registro que se archive después queda en el archivo más allá de ese tamaño.
+        """
+        with self._lock:
+            size = os.path.getsize(self.archive_path) if os.path.exists(self.archive_path) else 0
+            return size, sorted(self._records.values(), key=lambda record: record.id)
+
+    def is_archive_boundary(self, offset: int) -> bool:
+        """
+        Indica si `offset` es el inicio de una línea del archivo (o su final).
+        """
+        if offset == 0:
+            return True
+        if not os.path.exists(self.archive_path) or offset > os.path.getsize(self.archive_path):
+            return False
+        with open(self.archive_path, "rb") as f:
+            f.seek(offset - 1)
+            return f.read(1) == b"\n"
+
+    def iter_archived_range(self, start: int, end: int) -> Iterator[Tuple[int, StoredPayment]]:
+        """
+        Registros archivados entre los offsets `start` y `end`, junto al offset de la línea siguiente.
+        """
+        if start >= end:
+            return
+        with open(self.archive_path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while offset < end:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    return
+                offset += len(line)
+                yield offset, StoredPayment.from_row(json.loads(line))
+
+    # --- ARCHIVADO ---
+
+    def archive_settled(self, now: Optional[int] = None) -> int:
+        """
+        Mueve al archivo en disco los registros liquidados cuya última actualización supera
+        archive_after_seconds. Devuelve cuántos registros se archivaron.
+        """
+        cutoff = (now if now is not None else now_epoch()) - self.archive_after_seconds
+        with self._lock:
+            to_archive = [
+                record for record in self._records.values()
+                if record.status in SETTLED_STATUSES and record.updated_at <= cutoff
+            ]
+            if not to_archive:
+                return 0
+
+            directory = os.path.dirname(self.archive_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            offsets: List[Tuple[str, int]] = []
+            with open(self.archive_path, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                for record in to_archive:
+                    offsets.append((record.stripe_session_id, f.tell()))
+                    f.write(json.dumps(record.to_row(), separators=(",", ":")).encode("utf-8") + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Sólo se quitan de memoria después de que el archivo quedó en disco
+            for session_id, offset in offsets:
+                self._archive_index[session_id] = offset
+                del self._records[session_id]
+            self._max_archived_id = max([self._max_archived_id] + [record.id for record in to_archive])
+            return len(offsets)
+
+
+# Medición de memoria: registros dict (formato anterior) vs StoredPayment (opcional)
+# Uso: python -m app.services.payment_store [cantidad]
+if __name__ == "__main__":
+    import tracemalloc
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    items = [{"product_id": 1, "name": "Martillo", "price": 7500.0, "quantity": 2},
+             {"product_id": 4, "name": "Destornillador", "price": 3200.0, "quantity": 1}]
+
+    def measure(build):
+        tracemalloc.start()
+        data = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del data
+        return size
+
+    def build_dicts():
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return [{
+            "id": i, "client_username": "ignacio_tapia", "stripe_session_id": f"cs_test_{i:024d}",
+            "stripe_payment_intent_id": None, "amount_total": 18200.0, "currency": "USD", "status": "pending",
+            "created_at": now.isoformat(), "updated_at": now.isoformat(),
+            "items_snapshot": [dict(item) for item in items], "order_id": None,
+        } for i in range(count)]
+
+    def build_compact():
+        now = now_epoch()
+        snapshot = tuple((i["product_id"], i["name"], int(i["price"] * 100), i["quantity"]) for i in items)
+        store = PaymentStore(archive_path=os.devnull)
+        for i in range(count):
+            store.add(StoredPayment(i, "ignacio_tapia", f"cs_test_{i:024d}", 18200.0, "USD", "pending", now, now, snapshot))
+        return store
+
+    dict_bytes = measure(build_dicts)
+    compact_bytes = measure(build_compact)
+    print(f"{count} pagos")
+    print(f"  dict:          {dict_bytes / 2**20:8.1f} MiB ({dict_bytes / count:.0f} B/pago)")
+    print(f"  StoredPayment: {compact_bytes / 2**20:8.1f} MiB ({compact_bytes / count:.0f} B/pago)")
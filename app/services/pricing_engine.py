@@ -0,0 +1,253 @@
+import os
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.models.product import Product
+from app.models.pricing import PromoRule, CartQuote, QuoteLine
+
+# Moneda en la que están expresados los precios del catálogo (Product.precio)
+BASE_CURRENCY = "CLP"
+# Descuento por defecto para productos marcados con isPromo=True (0 = sin descuento hasta que se defina una regla)
+DEFAULT_PROMO_PERCENT = float(os.getenv("PROMO_DISCOUNT_PERCENT", "0"))
+
+# Fila precomputada de la tabla de precios:
+# (precio unitario de lista, precio unitario promocional, cantidad mínima para la promo, nombre)
+PriceRow = Tuple[int, int, int, str]
+
+
+# Línea cotizada. Se usa una tupla liviana en vez de un modelo pydantic para que
+# cotizar un carrito grande siga costando microsegundos; to_model() construye la respuesta.
+class PricedLine(NamedTuple):
+    product_id: int
+    nombre: str
+    quantity: int
+    list_unit_cents: int
+    unit_price_cents: int
+    discount_cents: int
+    line_total_cents: int
+
+
+class Quote:
+    __slots__ = ("currency", "lines", "subtotal_cents", "discount_cents", "total_cents")
+
+    def __init__(self, currency: str, lines: List[PricedLine], subtotal_cents: int, discount_cents: int):
+        self.currency = currency
+        self.lines = lines
+        self.subtotal_cents = subtotal_cents
+        self.discount_cents = discount_cents
+        self.total_cents = subtotal_cents - discount_cents
+
+    @property
+    def total(self) -> float:
+        return self.total_cents / 100
+
+    def to_model(self) -> CartQuote:
+        return CartQuote(
+            currency=self.currency,
+            lines=[QuoteLine(**line._asdict(), promo_applied=line.discount_cents > 0) for line in self.lines],
+            subtotal_cents=self.subtotal_cents,
+            discount_cents=self.discount_cents,
+            total_cents=self.total_cents,
+        )
+
+
+class UnknownProductError(ValueError):
+    def __init__(self, product_id: int):
+        super().__init__(f"Producto con ID {product_id} no encontrado.")
+        self.product_id = product_id
+
+
+def _to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def _apply_percent(unit_cents: int, percent_off: float) -> int:
+    # Aritmética entera en puntos básicos, redondeando al centavo más cercano
+    basis_points = int(round(percent_off * 100))
+    return (unit_cents * (10000 - basis_points) + 5000) // 10000
+
+
+class PricingEngine:
+    """
+    Motor de precios con una tabla precomputada por producto.
+    Cada fila ya incluye el precio promocional, de modo que cotizar un carrito
+    es una sola pasada de búsquedas en diccionario y multiplicaciones enteras.
+    Las variantes en otras monedas se construyen bajo demanda a partir de las
+    tasas de cambio y se cachean hasta que las tasas cambian.
+    """
+
+    def __init__(self, products: Iterable[Product]):
+        self._products = products
+        self._lock = threading.Lock()
+        self._promo_rules: Dict[int, PromoRule] = {}
+        self._rates: Optional[Dict[str, float]] = None
+        self._tables: Dict[str, Dict[int, PriceRow]] = {}
+        self.rebuild()
+
+    # --- CONSTRUCCIÓN DE LA TABLA ---
+
+    def promo_rule_for(self, product: Product) -> Optional[PromoRule]:
+        rule = self._promo_rules.get(product.id)
+        if rule is None and product.isPromo and DEFAULT_PROMO_PERCENT > 0:
+            rule = PromoRule(percent_off=DEFAULT_PROMO_PERCENT)
+        return rule
+
+    def _base_row(self, product: Product) -> PriceRow:
+        unit = _to_cents(product.precio)
+        rule = self.promo_rule_for(product)
+        if rule is None:
+            return (unit, unit, 1, product.nombre)
+        return (unit, _apply_percent(unit, rule.percent_off), rule.min_quantity, product.nombre)
+
+    def _variant_table(self, currency: str) -> Optional[Dict[int, PriceRow]]:
+        rates = self._rates
+        if not rates or currency not in rates or BASE_CURRENCY not in rates:
+            return None
+        factor = rates[currency] / rates[BASE_CURRENCY]
+        base = self._tables[BASE_CURRENCY]
+        return {
+            pid: (int(round(unit * factor)), int(round(promo * factor)), min_qty, nombre)
+            for pid, (unit, promo, min_qty, nombre) in base.items()
+        }
+
+    def rebuild(self):
+        """
+        Reconstruye la tabla base desde el catálogo y descarta las variantes por moneda.
+        """
+        with self._lock:
+            base = {product.id: self._base_row(product) for product in self._products}
+            self._tables = {BASE_CURRENCY: base}
+
+    def upsert_product(self, product: Product):
+        """
+        Agrega o actualiza la fila de un producto en todas las tablas ya construidas.
+        """
+        with self._lock:
+            row = self._base_row(product)
+            tables = dict(self._tables)
+            tables[BASE_CURRENCY] = {**tables[BASE_CURRENCY], product.id: row}
+            for currency in list(tables):
+                if currency != BASE_CURRENCY:
+                    tables.pop(currency)  # Se reconstruirá bajo demanda
+            self._tables = tables
+
+    def set_promo_rule(self, product: Product, rule: Optional[PromoRule]):
+        """
+        Define (o elimina, si rule es None) una regla de promoción específica para un producto.
+        """
+        self.put_promo_rule(product.id, rule)
+        self.upsert_product(product)
+
+    def put_promo_rule(self, product_id: int, rule: Optional[PromoRule]):
+        """
+        Registra la regla sin tocar las tablas (al reaplicar el journal; luego se llama a rebuild()).
+        """
+        with self._lock:
+            if rule is None:
+                self._promo_rules.pop(product_id, None)
+            else:
+                self._promo_rules[product_id] = rule
+
+    def promo_rule(self, product_id: int) -> Optional[PromoRule]:
+        """
+        Regla específica del producto, sin el descuento por defecto de promoción (ver promo_rule_for).
+        """
+        return self._promo_rules.get(product_id)
+
+    def promo_rules(self) -> Dict[int, PromoRule]:
+        with self._lock:
+            return dict(self._promo_rules)
+
+    def load_promo_rules(self, rules: Dict[int, PromoRule]):
+        with self._lock:
+            self._promo_rules = dict(rules)
+
+    def set_exchange_rates(self, rates: Dict[str, float]):
+        """
+        Registra tasas de cambio con base USD (formato de CurrencyConverter.get_exchange_rates).
+        """
+        with self._lock:
+            self._rates = dict(rates)
+            self._tables = {BASE_CURRENCY: self._tables[BASE_CURRENCY]}
+
+    def supports(self, currency: str) -> bool:
+        currency = currency.upper()
+        return currency in self._tables or bool(self._rates and currency in self._rates)
+
+    def _table_for(self, currency: str) -> Dict[int, PriceRow]:
+        table = self._tables.get(currency)
+        if table is not None:
+            return table
+        with self._lock:
+            table = self._tables.get(currency)
+            if table is None:
+                table = self._variant_table(currency)
+                if table is None:
+                    raise ValueError(f"Moneda '{currency}' no soportada por el motor de precios.")
+                self._tables = {**self._tables, currency: table}
+        return table
+
+    # --- COTIZACIÓN ---
+
+    def quote(self, items: Iterable, currency: str = BASE_CURRENCY) -> Quote:
+        """
+        Cotiza un carrito completo en una sola pasada usando centavos enteros.
+        `items` puede ser cualquier secuencia de objetos con product_id y quantity
+        (OrderItem, CheckoutItem, ...).
+        Lanza UnknownProductError si algún producto no existe y ValueError si la moneda no está soportada.
+        """
+        currency = currency.upper()
+        table = self._table_for(currency)
+        lines = []
+        append = lines.append
+        subtotal = 0
+        discount = 0
+        for item in items:
+            product_id = item.product_id
+            row = table.get(product_id)
+            if row is None:
+                raise UnknownProductError(product_id)
+            unit, promo_unit, min_qty, nombre = row
+            qty = item.quantity
+            effective = promo_unit if qty >= min_qty else unit
+            line_discount = (unit - effective) * qty
+            subtotal += unit * qty
+            discount += line_discount
+            append(PricedLine(product_id, nombre, qty, unit, effective, line_discount, effective * qty))
+        return Quote(currency, lines, subtotal, discount)
+
+
+# Benchmark de cotización de un carrito grande (opcional)
+# Uso: python -m app.services.pricing_engine [líneas] [productos]
+if __name__ == "__main__":
+    import sys
+    import time
+    import random
+    from app.models.order import OrderItem
+
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    rng = random.Random(42)
+    products = [
+        Product(id=i, nombre=f"Producto {i}", precio=float(rng.randint(500, 200_000)), codigo=f"COD{i:07d}", stock=100, isPromo=rng.random() < 0.2)
+        for i in range(1, count + 1)
+    ]
+    engine = PricingEngine(products)
+    for product in rng.sample(products, count // 10):
+        engine.set_promo_rule(product, PromoRule(percent_off=rng.choice([5, 10, 15]), min_quantity=rng.randint(1, 3)))
+    cart = [OrderItem(product_id=rng.randint(1, count), quantity=rng.randint(1, 5)) for _ in range(lines)]
+
+    def timed(fn, repeat=2000):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - started)
+        samples.sort()
+        return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+    quote_p50, quote_p99 = timed(lambda: engine.quote(cart))
+    model_p50, model_p99 = timed(lambda: engine.quote(cart).to_model(), repeat=200)
+    print(f"Carrito de {lines} líneas sobre {count} productos")
+    print(f"  quote():            p50 {quote_p50 * 1e6:8.1f} µs  p99 {quote_p99 * 1e6:8.1f} µs")
+    print(f"  quote().to_model(): p50 {model_p50 * 1e6:8.1f} µs  p99 {model_p99 * 1e6:8.1f} µs (respuesta de /orders/quote)")
@@ -0,0 +1,288 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.auth.auth_settings import get_user_from_token
+
+# Intervalo entre muestras de pila mientras se perfila una solicitud
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# Si es mayor que 0, toda solicitud que supere esta latencia se perfila automáticamente (0 = desactivado)
+PROFILE_SLOW_THRESHOLD_MS = float(os.getenv("PROFILE_SLOW_THRESHOLD_MS", "0"))
+# Cantidad de perfiles que se conservan (los más antiguos se descartan)
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+# Rutas que nunca se perfilan por latencia (conexiones largas por diseño)
+PROFILE_EXCLUDE_PATHS = tuple(p for p in os.getenv("PROFILE_EXCLUDE_PATHS", "/products/stream").split(",") if p)
+
+# Roles que pueden pedir un perfil con la cabecera X-Profile y descargar los perfiles
+PROFILE_ROLES = ["admin", "mantenedor"]
+
+# Funciones donde un hilo está bloqueado esperando trabajo (no aportan a la latencia de la solicitud)
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"), # Hilo de un ThreadPoolExecutor esperando una tarea
+}
+
+Stack = Tuple[str, ...] # Nombres de las funciones, desde la raíz hasta la hoja
+
+
+class _ActiveProfile:
+    __slots__ = ("id", "method", "path", "trigger", "started", "started_at", "samples", "sample_count")
+
+    def __init__(self, profile_id: int, method: str, path: str, trigger: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.trigger = trigger # "header" o "threshold"
+        self.started = time.perf_counter()
+        self.started_at = datetime.utcnow()
+        self.samples: "Counter[Stack]" = Counter()
+        self.sample_count = 0
+
+
+class RequestProfile:
+    """
+    Perfil muestreado de una solicitud terminada, exportable como pilas colapsadas o JSON de speedscope.
+    Las muestras son de todo el proceso mientras la solicitud estaba en curso (sin los hilos inactivos),
+    así que con solicitudes concurrentes también aparecen las pilas de las otras.
+    """
+    __slots__ = ("id", "method", "path", "trigger", "started_at", "duration_ms", "status_code", "interval_ms", "sample_count", "stacks")
+
+    def __init__(self, active: _ActiveProfile, duration_ms: float, status_code: int, interval_ms: float):
+        self.id = active.id
+        self.method = active.method
+        self.path = active.path
+        self.trigger = active.trigger
+        self.started_at = active.started_at
+        self.duration_ms = duration_ms
+        self.status_code = status_code
+        self.interval_ms = interval_ms
+        self.sample_count = active.sample_count
+        self.stacks = active.samples
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "status_code": self.status_code,
+            "sample_count": self.sample_count,
+        }
+
+    def to_collapsed(self) -> str:
+        """
+        Formato de pilas colapsadas ("raíz;...;hoja cantidad"), entrada de flamegraph.pl y similares.
+        """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        frame_index: Dict[str, int] = {}
+        frames: List[Dict[str, Any]] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        for stack, count in self.stacks.items():
+            indexes = []
+            for name in stack:
+                index = frame_index.get(name)
+                if index is None:
+                    index = frame_index[name] = len(frames)
+                    frames.append({"name": name})
+                indexes.append(index)
+            samples.append(indexes)
+            weights.append(count * self.interval_ms)
+        name = f"{self.method} {self.path} (#{self.id})"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ferremas-backend",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class SamplingProfiler:
+    """
+    Perfilador estadístico: un hilo toma sys._current_frames() cada `interval_ms` mientras haya
+    solicitudes que perfilar, y acumula las pilas en cada una. Sin solicitudes activas el hilo
+    queda dormido; las solicitudes que sólo esperan cruzar el umbral de latencia no se muestrean
+    hasta cruzarlo.
+    """
+
+    def __init__(
+        self,
+        interval_ms: float = PROFILE_SAMPLE_INTERVAL_MS,
+        slow_threshold_ms: float = PROFILE_SLOW_THRESHOLD_MS,
+        buffer_size: int = PROFILE_BUFFER_SIZE,
+        max_depth: int = PROFILE_MAX_DEPTH,
+    ):
+        self.interval_ms = interval_ms
+        self.slow_threshold_ms = slow_threshold_ms if slow_threshold_ms > 0 else None
+        self.max_depth = max_depth
+        self.profiles: "deque[RequestProfile]" = deque(maxlen=buffer_size)
+        self._active: Dict[int, _ActiveProfile] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._next_id = 1
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {} # Objeto de código -> nombre del frame
+
+    # --- CICLO DE VIDA DE UN PERFIL ---
+
+    def begin(self, method: str, path: str, trigger: str) -> _ActiveProfile:
+        with self._lock:
+            active = _ActiveProfile(self._next_id, method, path, trigger)
+            self._next_id += 1
+            self._active[active.id] = active
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return active
+
+    def end(self, active: _ActiveProfile, status_code: int) -> Optional[RequestProfile]:
+        duration_ms = (time.perf_counter() - active.started) * 1000
+        with self._lock:
+            self._active.pop(active.id, None)
+            if active.trigger == "threshold" and (active.sample_count == 0 or duration_ms < self.slow_threshold_ms):
+                return None # Solicitud rápida: no se guarda nada
+            profile = RequestProfile(active, duration_ms, status_code, self.interval_ms)
+            self.profiles.append(profile)
+        return profile
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    # --- MUESTREO ---
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample_stacks(self) -> List[Stack]:
+        own_id = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                names.append(self._label(frame.f_code))
+                frame = frame.f_back
+            names.reverse()
+            stacks.append(tuple(names))
+        return stacks
+
+    def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            now = time.perf_counter()
+            threshold = (self.slow_threshold_ms or 0) / 1000
+            collecting = [p for p in active if p.trigger == "header" or now - p.started >= threshold]
+            if not collecting:
+                # Dormir hasta que la primera solicitud cruce el umbral (o llegue una nueva)
+                self._wakeup.wait(min(p.started for p in active) + threshold - now)
+                self._wakeup.clear()
+                continue
+
+            stacks = self._sample_stacks()
+            with self._lock:
+                for profile in collecting:
+                    profile.samples.update(stacks)
+                    profile.sample_count += 1
+            time.sleep(interval)
+
+
+# --- MIDDLEWARE ---
+
+def _authorized_to_profile(headers: Dict[bytes, bytes]) -> bool:
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        user = get_user_from_token(token)
+    except HTTPException:
+        return False
+    return user.role in PROFILE_ROLES
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila una solicitud cuando trae la cabecera X-Profile de un usuario
+    autorizado, o cuando supera el umbral de latencia configurado. Con el umbral desactivado y sin
+    la cabecera, sólo revisa las cabeceras y pasa la solicitud tal cual.
+    La respuesta de una solicitud perfilada con X-Profile incluye X-Profile-Id.
+    """
+
+    def __init__(self, app, profiler: "SamplingProfiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = None
+        if any(name == b"x-profile" for name, _ in scope["headers"]):
+            if _authorized_to_profile(dict(scope["headers"])):
+                trigger = "header"
+        elif self.profiler.slow_threshold_ms is not None and not scope["path"].startswith(PROFILE_EXCLUDE_PATHS):
+            trigger = "threshold"
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        active = self.profiler.begin(scope["method"], scope["path"], trigger)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if trigger == "header":
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(active.id).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            self.profiler.end(active, status_code)
+
+
+profiler = SamplingProfiler()
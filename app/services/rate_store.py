@@ -0,0 +1,190 @@
+import math
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl # Bloqueo entre procesos (sólo POSIX)
+except ImportError:
+    fcntl = None
+
+# Formato del archivo (little-endian, tamaño fijo):
+#   Cabecera: magic(4) | versión(u16) | slots(u16) | monedas usadas(u16) | relleno(6)
+#             + `slots` códigos de moneda de 4 bytes (ASCII, relleno con \0)
+#   Registros (sólo se agregan al final, en orden de timestamp):
+#             timestamp epoch en segundos(i64) + `slots` tasas float64 con base USD (NaN = sin dato)
+MAGIC = b"FXRS"
+VERSION = 1
+SLOTS = 256
+_HEADER = struct.Struct("<4sHHH6x")
+_CODE = struct.Struct("<4s")
+_TIMESTAMP = struct.Struct("<q")
+_RATES = struct.Struct(f"<{SLOTS}d")
+HEADER_SIZE = _HEADER.size + SLOTS * _CODE.size
+RECORD_SIZE = _TIMESTAMP.size + _RATES.size
+
+
+class RateStore:
+    """
+    Historial de tablas de tasas de cambio en un archivo binario de solo-agregado.
+    El archivo se mapea en memoria al abrirlo, así que cargarlo es instantáneo sin importar
+    cuántas tablas contenga, y las búsquedas por fecha son una búsqueda binaria sobre el mmap.
+    Varios procesos (workers) pueden compartir el archivo: las escrituras se serializan con flock
+    y cada lectura vuelve a mapear el archivo si otro proceso le agregó tablas.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._codes: List[str] = []
+        self._slot_by_code: Dict[str, int] = {}
+        self._mm: Optional[mmap.mmap] = None
+        self._count = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Se abre sin truncar: otro worker puede estar creando o usando el mismo archivo
+        self._file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        with self._file_lock():
+            if os.fstat(self._file.fileno()).st_size < HEADER_SIZE:
+                self._file.seek(0)
+                self._file.write(_HEADER.pack(MAGIC, VERSION, SLOTS, 0))
+                self._file.write(b"\0" * (SLOTS * _CODE.size))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._remap()
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Bloqueo exclusivo del archivo entre procesos (sin fcntl, sólo hay exclusión entre hilos).
+        """
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    # --- LECTURA DEL ARCHIVO ---
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, slots, used = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or slots != SLOTS:
+            raise ValueError(f"Archivo de tasas de cambio inválido o incompatible: {self.path}")
+        self._codes = [
+            _CODE.unpack_from(self._mm, _HEADER.size + i * _CODE.size)[0].rstrip(b"\0").decode("ascii")
+            for i in range(used)
+        ]
+        self._slot_by_code = {code: i for i, code in enumerate(self._codes)}
+        # Un registro incompleto al final (ej. caída a mitad de escritura) se ignora
+        self._count = (len(self._mm) - HEADER_SIZE) // RECORD_SIZE
+
+    def _remap_if_grown(self):
+        # Otro proceso agregó tablas (y quizás monedas a la cabecera): el mmap actual no las ve
+        if os.fstat(self._file.fileno()).st_size != len(self._mm):
+            self._remap()
+
+    def _timestamp_at(self, index: int) -> int:
+        return _TIMESTAMP.unpack_from(self._mm, HEADER_SIZE + index * RECORD_SIZE)[0]
+
+    def _record_at(self, index: int) -> Tuple[int, Dict[str, float]]:
+        offset = HEADER_SIZE + index * RECORD_SIZE
+        timestamp = _TIMESTAMP.unpack_from(self._mm, offset)[0]
+        values = _RATES.unpack_from(self._mm, offset + _TIMESTAMP.size)
+        rates = {code: values[i] for i, code in enumerate(self._codes) if not math.isnan(values[i])}
+        return timestamp, rates
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._remap_if_grown()
+            return self._count
+
+    def latest_timestamp(self) -> Optional[int]:
+        with self._lock:
+            self._remap_if_grown()
+            return self._timestamp_at(self._count - 1) if self._count else None
+
+    def latest(self) -> Optional[Tuple[int, Dict[str, float]]]:
+        """
+        Devuelve (timestamp, tasas) de la tabla más reciente, o None si el archivo está vacío.
+        """
+        with self._lock:
+            self._remap_if_grown()
+            return self._record_at(self._count - 1) if self._count else None
+
+    def rates_at(self, timestamp: float) -> Optional[Tuple[int, Dict[str, float]]]:
+        """
+        Devuelve la tabla vigente en `timestamp` (la última con timestamp <= dado).
+        Si `timestamp` es anterior a toda la historia, devuelve la tabla más antigua.
+        """
+        with self._lock:
+            self._remap_if_grown()
+            if not self._count:
+                return None
+            lo, hi = 0, self._count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._timestamp_at(mid) <= timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return self._record_at(max(lo - 1, 0))
+
+    # --- ESCRITURA ---
+
+    def append(self, timestamp: int, rates: Dict[str, float]) -> bool:
+        """
+        Agrega una tabla al final del archivo. Se ignora si no es más nueva que la última guardada.
+        Devuelve True si se escribió.
+        """
+        with self._lock, self._file_lock():
+            # Bajo el bloqueo se relee el archivo: cabecera y cantidad de registros pueden venir de otro proceso
+            self._remap()
+            if self._count and timestamp <= self._timestamp_at(self._count - 1):
+                return False
+
+            # Asignar slots a monedas nuevas (la cabecera es lo único que se modifica en su lugar)
+            new_codes = [code for code in rates if code not in self._slot_by_code and len(code) <= _CODE.size]
+            used = len(self._codes)
+            new_codes = new_codes[:SLOTS - used]
+            if new_codes:
+                for i, code in enumerate(new_codes):
+                    self._file.seek(_HEADER.size + (used + i) * _CODE.size)
+                    self._file.write(_CODE.pack(code.encode("ascii")))
+                self._file.seek(0)
+                self._file.write(_HEADER.pack(MAGIC, VERSION, SLOTS, used + len(new_codes)))
+                slot_by_code = {**self._slot_by_code, **{code: used + i for i, code in enumerate(new_codes)}}
+            else:
+                slot_by_code = self._slot_by_code
+
+            values = [math.nan] * SLOTS
+            for code, rate in rates.items():
+                slot = slot_by_code.get(code)
+                if slot is not None:
+                    values[slot] = float(rate)
+
+            # Truncar un posible registro incompleto antes de agregar (_count se acaba de leer bajo el bloqueo)
+            self._file.truncate(HEADER_SIZE + self._count * RECORD_SIZE)
+            self._file.seek(HEADER_SIZE + self._count * RECORD_SIZE)
+            self._file.write(_TIMESTAMP.pack(int(timestamp)) + _RATES.pack(*values))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._remap()
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            self._file.close()
@@ -0,0 +1,177 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.models.order import Order
+
+
+class SalesAnalytics:
+    """
+    Agregados de ventas mantenidos de forma incremental: cada pedido nuevo actualiza
+    en O(ítems) las unidades e ingresos por producto, los totales por día y el valor
+    de vida (lifetime value) por cliente. Las consultas son búsquedas en diccionario, O(1).
+    Los montos se guardan en centavos enteros, igual que en el motor de precios.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_product: Dict[int, List[int]] = {}  # product_id -> [unidades, ingresos]
+        self.by_day: Dict[str, List[int]] = {}      # "YYYY-MM-DD" -> [pedidos, unidades, ingresos]
+        self.by_client: Dict[str, List[int]] = {}   # username -> [pedidos, ingresos]
+        self.totals: List[int] = [0, 0, 0]          # [pedidos, unidades, ingresos]
+
+    def record_order(self, order: Order):
+        """
+        Suma un pedido a los agregados, con los precios unitarios guardados en sus líneas
+        (los que se cobraron al crearlo, no los precios actuales).
+        """
+        day = order.order_date.date().isoformat()
+        with self._lock:
+            order_units = 0
+            order_revenue = 0
+            for item in order.items:
+                line_total = (item.unit_price_cents or 0) * item.quantity
+                product = self.by_product.get(item.product_id)
+                if product is None:
+                    product = self.by_product[item.product_id] = [0, 0]
+                product[0] += item.quantity
+                product[1] += line_total
+                order_units += item.quantity
+                order_revenue += line_total
+
+            day_totals = self.by_day.get(day)
+            if day_totals is None:
+                day_totals = self.by_day[day] = [0, 0, 0]
+            day_totals[0] += 1
+            day_totals[1] += order_units
+            day_totals[2] += order_revenue
+
+            client = self.by_client.get(order.user_id)
+            if client is None:
+                client = self.by_client[order.user_id] = [0, 0]
+            client[0] += 1
+            client[1] += order_revenue
+
+            self.totals[0] += 1
+            self.totals[1] += order_units
+            self.totals[2] += order_revenue
+
+    # --- RECONSTRUCCIÓN COMPLETA (VERIFICACIÓN) ---
+
+    @classmethod
+    def from_orders(cls, orders: Iterable[Order]) -> "SalesAnalytics":
+        """
+        Recalcula todos los agregados recorriendo los pedidos guardados.
+        """
+        analytics = cls()
+        for order in orders:
+            analytics.record_order(order)
+        return analytics
+
+    def rebuild(self, orders: Iterable[Order]):
+        """
+        Reemplaza los agregados por los de una reconstrucción completa.
+        """
+        self.replace_with(SalesAnalytics.from_orders(orders))
+
+    def replace_with(self, other: "SalesAnalytics"):
+        with self._lock:
+            self.by_product = other.by_product
+            self.by_day = other.by_day
+            self.by_client = other.by_client
+            self.totals = other.totals
+
+    def _copy(self) -> Dict[str, Any]:
+        # Copia consistente bajo el lock: record_order muta los diccionarios desde el event loop
+        with self._lock:
+            copy = {name: {key: list(value) for key, value in getattr(self, name).items()} for name in ("by_product", "by_day", "by_client")}
+            copy["totals"] = list(self.totals)
+        return copy
+
+    def diff(self, other: "SalesAnalytics", mine: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Diferencias entre estos agregados y otros (vacío si coinciden).
+        `mine` es una copia de estos agregados (_copy()) tomada antes, para comparar contra un instante fijo.
+        """
+        mine_all, theirs_all = mine if mine is not None else self._copy(), other._copy()
+        differences = {}
+        for name in ("by_product", "by_day", "by_client"):
+            mine, theirs = mine_all[name], theirs_all[name]
+            keys = [key for key in mine.keys() | theirs.keys() if mine.get(key) != theirs.get(key)]
+            if keys:
+                differences[name] = {str(key): {"incremental": mine.get(key), "rebuilt": theirs.get(key)} for key in keys}
+        if mine_all["totals"] != theirs_all["totals"]:
+            differences["totals"] = {"incremental": mine_all["totals"], "rebuilt": theirs_all["totals"]}
+        return differences
+
+    # --- CONSULTAS ---
+
+    def product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        totals = self.by_product.get(product_id)
+        if totals is None:
+            return None
+        units, revenue = totals
+        return {"product_id": product_id, "units": units, "revenue_cents": revenue}
+
+    def day(self, day: str) -> Optional[Dict[str, Any]]:
+        totals = self.by_day.get(day)
+        if totals is None:
+            return None
+        orders, units, revenue = totals
+        return {"day": day, "orders": orders, "units": units, "revenue_cents": revenue}
+
+    def client(self, username: str) -> Optional[Dict[str, Any]]:
+        totals = self.by_client.get(username)
+        if totals is None:
+            return None
+        orders, revenue = totals
+        return {"client_username": username, "orders": orders, "lifetime_value_cents": revenue}
+
+    def summary(self) -> Dict[str, Any]:
+        orders, units, revenue = self.totals
+        return {"orders": orders, "units": units, "revenue_cents": revenue}
+
+
+# Benchmark: consulta sobre agregados incrementales vs. recorrido completo de los pedidos (opcional)
+# Uso: python -m app.services.sales_analytics [pedidos]
+if __name__ == "__main__":
+    import sys
+    import time
+    import random
+    import datetime
+    from app.models.order import OrderItem
+    from app.models.product import Product
+    from app.services.pricing_engine import PricingEngine
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    products = [Product(id=i, nombre=f"Producto {i}", precio=1000 + i, codigo=f"P{i}", stock=10**9, isPromo=i % 3 == 0) for i in range(1, 501)]
+    engine = PricingEngine(products)
+    start = datetime.datetime(2025, 1, 1)
+    orders = []
+    for i in range(count):
+        items = [OrderItem(product_id=random.randint(1, 500), quantity=random.randint(1, 5)) for _ in range(random.randint(1, 4))]
+        quote = engine.quote(items)
+        for item, line in zip(items, quote.lines):
+            item.unit_price_cents = line.unit_price_cents # Como en _place_order
+        orders.append(Order(id=i, user_id=f"cliente_{i % 5000}", items=items, total_amount=quote.total, order_date=start + datetime.timedelta(minutes=i)))
+
+    analytics = SalesAnalytics()
+    started = time.perf_counter()
+    for order in orders:
+        analytics.record_order(order)
+    per_order = (time.perf_counter() - started) / count
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        analytics.product(42)
+        analytics.client("cliente_7")
+    incremental_query = (time.perf_counter() - started) / 1000
+
+    started = time.perf_counter()
+    rebuilt = SalesAnalytics.from_orders(orders)
+    full_scan = time.perf_counter() - started
+
+    print(f"{count} pedidos")
+    print(f"  actualización incremental: {per_order * 1e6:.1f} µs por pedido")
+    print(f"  consulta incremental:      {incremental_query * 1e6:.2f} µs")
+    print(f"  recorrido completo:        {full_scan * 1e3:.0f} ms")
+    print(f"  coinciden: {not analytics.diff(rebuilt)}")
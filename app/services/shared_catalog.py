@@ -0,0 +1,788 @@
+import os
+import math
+import mmap
+import time
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl # Bloqueo entre procesos (sólo POSIX)
+except ImportError:
+    fcntl = None
+
+from app.models.product import Product
+from app.models.pricing import PromoRule
+from app.services.columnar_catalog import ColumnarCatalog
+
+# Directorio compartido por todos los workers; vacío desactiva el catálogo compartido (cada worker usa su índice local)
+CATALOG_SHARED_DIR = os.getenv("CATALOG_SHARED_DIR", "")
+# Los cambios se agrupan y se publican como una sola generación a lo más cada este intervalo
+CATALOG_PUBLISH_INTERVAL_MS = float(os.getenv("CATALOG_PUBLISH_INTERVAL_MS", "20"))
+# Generaciones anteriores que se conservan en disco (un lector puede seguir usando una ya reemplazada)
+CATALOG_KEEP_GENERATIONS = int(os.getenv("CATALOG_KEEP_GENERATIONS", "2"))
+# Entradas del registro de cambios antes de volver a publicar una generación completa
+CATALOG_MAX_CHANGES = int(os.getenv("CATALOG_MAX_CHANGES", "10000"))
+
+# Una generación son dos archivos (little-endian), con secciones alineadas a 8 bytes. Son inmutables una vez publicados,
+# salvo la columna de stock, que se actualiza en su lugar (ver SharedCatalog.adjust_stocks):
+#   catalog-<generación>.bin, columnas numéricas:
+#     magic(4) | versión(u32) | generación(u64) | productos(u64) | bloque de texto que usa(u64)
+#     | última generación completa(u64) | cambios(u64)
+#     ids i64[n] (ordenados) | precio f64[n] | stock i64[n] | marca i32[n] | isPromo bool[n] | isNew bool[n]
+#     | % de la regla de promoción f64[n] (NaN = sin regla específica) | cantidad mínima de la regla i64[n]
+#     | registro de cambios i64[k*2]: (generación, product_id) de cada alta o cambio desde la última generación completa
+#   catalog-text-<generación que lo escribió>.bin, bloque de texto:
+#     magic(4) | versión(u32) | productos(u64) | marcas(u64) | bytes de texto(u64) | bytes de marcas(u64)
+#     inicio/fin i64[n*4] de (nombre, descripcion, modelo, codigo) en el texto (-1 = None) | texto UTF-8
+#     inicio/fin i64[m] de cada marca | marcas UTF-8
+# Los cambios de stock no crean generaciones; una generación con cambios de productos reutiliza el bloque de texto
+# de la anterior si ninguno toca el texto.
+# Archivo de control: magic(4) | relleno(4) | generación vigente(u64) | próximo ID de producto(u64)
+MAGIC = b"FCAT"
+TEXT_MAGIC = b"FCTX"
+VERSION = 3
+_HEADER = struct.Struct("<4sIQQQQQ")
+_TEXT_HEADER = struct.Struct("<4sIQQQQ")
+_CONTROL_MAGIC = b"FCTL"
+_CONTROL = struct.Struct("<4s4xQQ")
+_GENERATION = struct.Struct("<Q")
+_NEXT_ID_OFFSET = 16
+_TEXT_FIELDS = 4
+
+_CONTROL_FILE = "catalog.ctl"
+_LOCK_FILE = "catalog.lock"
+# Cada proceso que usa el catálogo mantiene un bloqueo compartido sobre este archivo mientras vive
+_USERS_FILE = "catalog.users"
+_GENERATION_PREFIX = "catalog-"
+_TEXT_PREFIX = "catalog-text-"
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _generation_path(directory: str, generation: int) -> str:
+    return os.path.join(directory, f"{_GENERATION_PREFIX}{generation:012d}.bin")
+
+
+def _text_path(directory: str, text_generation: int) -> str:
+    return os.path.join(directory, f"{_TEXT_PREFIX}{text_generation:012d}.bin")
+
+
+def _map(path: str, writable: bool = False) -> mmap.mmap:
+    with open(path, "r+b" if writable else "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+
+class _Sections:
+    """
+    Lee secciones consecutivas de un archivo mapeado: arreglos alineados a 8 bytes o bytes tal cual.
+    """
+
+    def __init__(self, mm: mmap.mmap, offset: int):
+        self._buffer = memoryview(mm)
+        self._offset = offset
+
+    def array(self, dtype, length: int) -> np.ndarray:
+        self._offset = _align(self._offset)
+        array = np.frombuffer(self._buffer, dtype=dtype, count=length, offset=self._offset)
+        self._offset += array.nbytes
+        return array
+
+    def raw(self, length: int) -> memoryview:
+        data = self._buffer[self._offset:self._offset + length]
+        self._offset += length
+        return data
+
+
+class _TextColumns(Sequence):
+    """
+    Columnas de texto sobre el mmap: sólo se decodifica la fila que se pide (al materializar una página).
+    """
+
+    def __init__(self, blob: memoryview, starts: np.ndarray, ends: np.ndarray):
+        self._blob = blob
+        self._starts = starts
+        self._ends = ends
+
+    def __len__(self) -> int:
+        return len(self._starts) // _TEXT_FIELDS
+
+    def __getitem__(self, row: int) -> Tuple[Optional[str], ...]:
+        base = row * _TEXT_FIELDS
+        fields = []
+        for start, end in zip(self._starts[base:base + _TEXT_FIELDS].tolist(), self._ends[base:base + _TEXT_FIELDS].tolist()):
+            fields.append(None if start < 0 else str(self._blob[start:end], "utf-8"))
+        return tuple(fields)
+
+
+class CatalogSnapshot(ColumnarCatalog):
+    """
+    Una generación publicada del catálogo, mapeada en memoria sin copiar: las columnas son vistas
+    NumPy sobre el archivo, así que todos los workers comparten las mismas páginas (y ven de inmediato
+    los cambios de stock que otro worker escribe en su lugar). Sólo la columna de stock es modificable,
+    y únicamente a través de SharedCatalog. Reutiliza los filtros y el orden de ColumnarCatalog.
+    """
+
+    def __init__(self, directory: str, generation: int):
+        self._lock = threading.Lock()
+        path = _generation_path(directory, generation)
+        self._mm = _map(path, writable=True)
+        magic, version, generation, count, text_generation, base_generation, change_count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Generación de catálogo inválida o incompatible: {path}")
+        self.generation = generation
+        self.text_generation = text_generation
+        self.base_generation = base_generation
+        self._size = count
+
+        columns = _Sections(self._mm, _HEADER.size)
+        self._ids = columns.array(np.int64, count)
+        self._precio = columns.array(np.float64, count)
+        self._stock = columns.array(np.int64, count)
+        self._marca = columns.array(np.int32, count)
+        self._is_promo = columns.array(np.bool_, count)
+        self._is_new = columns.array(np.bool_, count)
+        self._promo_percent = columns.array(np.float64, count)
+        self._promo_min = columns.array(np.int64, count)
+        self._changes = columns.array(np.int64, change_count * 2)
+        for column in (self._ids, self._precio, self._marca, self._is_promo, self._is_new, self._promo_percent, self._promo_min, self._changes):
+            column.flags.writeable = False
+
+        text_path = _text_path(directory, text_generation)
+        self._text_mm = _map(text_path)
+        magic, version, text_count, marca_count, text_bytes, marca_bytes = _TEXT_HEADER.unpack_from(self._text_mm, 0)
+        if magic != TEXT_MAGIC or version != VERSION or text_count != count:
+            raise ValueError(f"Bloque de texto del catálogo inválido o incompatible: {text_path}")
+        sections = _Sections(self._text_mm, _TEXT_HEADER.size)
+        text_starts = sections.array(np.int64, count * _TEXT_FIELDS)
+        text_ends = sections.array(np.int64, count * _TEXT_FIELDS)
+        text = sections.raw(text_bytes)
+        marca_starts = sections.array(np.int64, marca_count)
+        marca_ends = sections.array(np.int64, marca_count)
+        marcas = sections.raw(marca_bytes)
+
+        self._text = _TextColumns(text, text_starts, text_ends)
+        self._marcas: List[str] = [str(marcas[start:end], "utf-8") for start, end in zip(marca_starts.tolist(), marca_ends.tolist())]
+        self._marca_codes: Dict[str, int] = {marca: code for code, marca in enumerate(self._marcas)}
+        self._marca_lookup: Dict[str, List[int]] = {}
+        for code, marca in enumerate(self._marcas):
+            self._marca_lookup.setdefault(marca.casefold(), []).append(code)
+
+    def _row_for(self, product_id: int) -> Optional[int]:
+        row = int(np.searchsorted(self._ids, product_id))
+        if row < self._size and self._ids[row] == product_id:
+            return row
+        return None
+
+    def promo_rule(self, product_id: int) -> Optional[PromoRule]:
+        """
+        Regla de promoción específica publicada para el producto (None si usa el descuento por defecto).
+        """
+        row = self._row_for(product_id)
+        if row is None or np.isnan(self._promo_percent[row]):
+            return None
+        return PromoRule(percent_off=float(self._promo_percent[row]), min_quantity=int(self._promo_min[row]))
+
+    def product_ids(self) -> List[int]:
+        return self._ids.tolist()
+
+    def changed_since(self, generation: int) -> Optional[List[int]]:
+        """
+        IDs de los productos dados de alta o modificados después de `generation`, o None si `generation` es
+        anterior a la última publicación completa (hay que comparar el catálogo entero).
+        """
+        if generation < self.base_generation:
+            return None
+        generations, ids = self._changes[0::2], self._changes[1::2]
+        return sorted(set(ids[generations > generation].tolist()))
+
+    def rebuild(self, products):
+        raise TypeError("Una generación publicada es inmutable; use SharedCatalog para publicar cambios.")
+
+    upsert = adjust_stock = rebuild
+
+
+# --- ESCRITURA DE GENERACIONES ---
+
+def _encode_text(value: Optional[str], parts: List[bytes], position: int) -> Tuple[int, int, int]:
+    if value is None:
+        return -1, -1, position
+    data = value.encode("utf-8")
+    parts.append(data)
+    return position, position + len(data), position + len(data)
+
+
+def _write_sections(path: str, header: bytes, sections: Iterable):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        for section in sections:
+            if isinstance(section, np.ndarray):
+                f.write(b"\0" * (_align(f.tell()) - f.tell()))
+                f.write(np.ascontiguousarray(section).tobytes())
+            else:
+                f.write(section)
+    # Un lector nunca ve un archivo a medio escribir: aparece completo con su nombre final
+    os.replace(temp_path, path)
+
+
+def _write_columns(
+    path: str, generation: int, text_generation: int, base_generation: int, changes,
+    ids, precio, stock, marca, is_promo, is_new, promo_percent, promo_min,
+):
+    changes = np.asarray(changes, dtype=np.int64).reshape(-1)
+    _write_sections(
+        path, _HEADER.pack(MAGIC, VERSION, generation, len(ids), text_generation, base_generation, len(changes) // 2),
+        [
+            np.asarray(array, dtype=dtype) for array, dtype in (
+                (ids, np.int64), (precio, np.float64), (stock, np.int64), (marca, np.int32), (is_promo, np.bool_), (is_new, np.bool_),
+                (promo_percent, np.float64), (promo_min, np.int64), (changes, np.int64),
+            )
+        ],
+    )
+
+
+def _promo_columns(rule: Optional[PromoRule]) -> Tuple[float, int]:
+    return (math.nan, 1) if rule is None else (rule.percent_off, rule.min_quantity)
+
+
+def _write_text(path: str, text_starts, text_ends, text: bytes, marcas: List[str]):
+    marca_parts: List[bytes] = []
+    marca_starts, marca_ends, position = [], [], 0
+    for name in marcas:
+        start, end, position = _encode_text(name, marca_parts, position)
+        marca_starts.append(start)
+        marca_ends.append(end)
+    marca_blob = b"".join(marca_parts)
+    _write_sections(
+        path, _TEXT_HEADER.pack(TEXT_MAGIC, VERSION, len(text_starts) // _TEXT_FIELDS, len(marcas), len(text), len(marca_blob)),
+        [
+            np.asarray(text_starts, dtype=np.int64), np.asarray(text_ends, dtype=np.int64), text,
+            np.asarray(marca_starts, dtype=np.int64), np.asarray(marca_ends, dtype=np.int64), marca_blob,
+        ],
+    )
+
+
+class SharedCatalog:
+    """
+    Catálogo compartido entre los workers como generaciones en archivos mapeados en memoria.
+    - Lectura: current() revisa la generación vigente en el archivo de control (una lectura de 8 bytes
+      sobre un mmap) y, si cambió, mapea la nueva y cambia la referencia de forma atómica. Las
+      solicitudes que ya tenían la generación anterior terminan con ella.
+    - Stock: adjust_stocks() escribe el valor nuevo en su lugar en la columna de la generación vigente
+      (un entero de 8 bytes alineado por fila), bajo el bloqueo de archivo, así que la verificación y el
+      descuento son atómicos entre workers y una venta no reescribe el catálogo.
+    - Productos: las altas y cambios se acumulan y un hilo los publica como una nueva generación, bajo el
+      mismo bloqueo, a partir de la vigente (que puede venir de otro worker). El stock de las filas que ya
+      existen se copia de la vigente: el stock del producto encolado sólo se usa para las altas.
+    Expone la misma interfaz que ColumnarCatalog (query, get, upsert, adjust_stock, rebuild).
+    """
+
+    def __init__(self, directory: str, publish_interval_ms: float = CATALOG_PUBLISH_INTERVAL_MS, keep_generations: int = CATALOG_KEEP_GENERATIONS):
+        if fcntl is None:
+            raise RuntimeError("El catálogo compartido requiere un sistema POSIX (fcntl).")
+        self.directory = directory
+        self.publish_interval = publish_interval_ms / 1000
+        self.keep_generations = keep_generations
+        os.makedirs(directory, exist_ok=True)
+
+        control_path = os.path.join(directory, _CONTROL_FILE)
+        self._thread_lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, _LOCK_FILE), "a+b")
+        with self._file_lock():
+            if not os.path.exists(control_path) or os.path.getsize(control_path) < _CONTROL.size:
+                with open(control_path, "wb") as f:
+                    f.write(_CONTROL.pack(_CONTROL_MAGIC, 0, 1))
+        with open(control_path, "r+b") as f:
+            self._control = mmap.mmap(f.fileno(), _CONTROL.size)
+        # El bloqueo compartido (que el sistema libera al terminar el proceso) marca a este proceso como
+        # usuario del catálogo: rebuild() distingue así un arranque nuevo de un worker que se suma a los vivos
+        self._users_file = open(os.path.join(directory, _USERS_FILE), "a+b")
+        fcntl.flock(self._users_file.fileno(), fcntl.LOCK_SH)
+
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._pending_lock = threading.Lock()
+        # product_id -> (copia tomada al encolar, no el objeto vivo; su regla de promoción específica)
+        self._pending_products: Dict[int, Tuple[Product, Optional[PromoRule]]] = {}
+        self._wakeup = threading.Event()
+        self._publisher: Optional[threading.Thread] = None
+
+    # --- LECTURA ---
+
+    def _current_generation(self) -> int:
+        return _GENERATION.unpack_from(self._control, 8)[0]
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        while True:
+            snapshot = self._snapshot
+            generation = self._current_generation()
+            if generation == 0:
+                return None
+            if snapshot is not None and snapshot.generation == generation:
+                return snapshot
+            try:
+                snapshot = CatalogSnapshot(self.directory, generation)
+            except FileNotFoundError:
+                # Otro worker publicó y borró esta generación entre leer el control y abrir sus archivos:
+                # se vuelve a leer el control. Si la generación vigente no cambió, el archivo falta de verdad.
+                if self._current_generation() == generation:
+                    raise
+                continue
+            self._snapshot = snapshot # Asignar una referencia es atómico: los lectores ven la vieja o la nueva
+            return snapshot
+
+    @property
+    def generation(self) -> int:
+        return self._current_generation()
+
+    def query(self, **filters):
+        snapshot = self.current()
+        return snapshot.query(**filters) if snapshot is not None else (0, [])
+
+    def get(self, product_id: int) -> Optional[Product]:
+        snapshot = self.current()
+        return snapshot.get(product_id) if snapshot is not None else None
+
+    def __len__(self) -> int:
+        snapshot = self.current()
+        return len(snapshot) if snapshot is not None else 0
+
+    # --- ESCRITURA ---
+
+    def _file_lock(self):
+        # flock excluye a otros procesos pero no a otros hilos de este (comparten el archivo abierto):
+        # el lock de hilos serializa el publicador con las solicitudes del mismo worker
+        lock_file = self._lock_file
+        thread_lock = self._thread_lock
+
+        class _Locked:
+            def __enter__(self):
+                thread_lock.acquire()
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                except BaseException:
+                    thread_lock.release()
+                    raise
+
+            def __exit__(self, *exc):
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                finally:
+                    thread_lock.release()
+
+        return _Locked()
+
+    def _commit(self, generation: int):
+        _GENERATION.pack_into(self._control, 8, generation)
+        # La generación ya quedó publicada: un error al limpiar no debe hacer que flush() la reintente
+        try:
+            self._remove_old(generation)
+        except OSError as e:
+            print(f"Advertencia: no se pudieron borrar generaciones viejas del catálogo compartido: {e}")
+
+    def _remove_old(self, generation: int):
+        # Borrar generaciones viejas: en POSIX un archivo borrado sigue válido para quien ya lo mapeó
+        oldest_kept = max(generation - max(self.keep_generations, 1) + 1, 1)
+        for old in range(oldest_kept - 1, 0, -1):
+            path = _generation_path(self.directory, old)
+            if not os.path.exists(path):
+                break
+            os.remove(path)
+        # Bloques de texto anteriores al que usa la generación más antigua conservada (no crecen hacia atrás)
+        with open(_generation_path(self.directory, oldest_kept), "rb") as f:
+            magic, version, _, _, text_generation, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith(_TEXT_PREFIX) and name.endswith(".bin") and int(name[len(_TEXT_PREFIX):-4]) < text_generation:
+                os.remove(os.path.join(self.directory, name))
+
+    def _reserve_ids_locked(self, minimum: int) -> int:
+        product_id = max(_GENERATION.unpack_from(self._control, _NEXT_ID_OFFSET)[0], minimum)
+        _GENERATION.pack_into(self._control, _NEXT_ID_OFFSET, product_id + 1)
+        return product_id
+
+    def allocate_product_id(self, minimum: int = 1) -> int:
+        """
+        Reserva el próximo ID de producto para todos los workers (nunca menor que `minimum`).
+        """
+        with self._file_lock():
+            return self._reserve_ids_locked(minimum)
+
+    def rebuild(self, products: Iterable[Product], promo_rules: Optional[Dict[int, PromoRule]] = None) -> bool:
+        """
+        Publica una generación completa desde `products` si ningún otro proceso está usando el catálogo
+        (arranque nuevo, aunque venga de la misma shell). Cuando los workers arrancan juntos, el primero
+        la publica y los demás, que lo encuentran vivo, reutilizan la vigente.
+        Devuelve True si publicó, False si reutilizó la de otro worker.
+        """
+        products = list(products)
+        users = self._users_file.fileno()
+        with self._file_lock():
+            if self._current_generation():
+                try:
+                    # Sólo se obtiene en exclusiva si no queda ningún otro proceso con el bloqueo compartido
+                    fcntl.flock(users, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+            try:
+                generation = self._current_generation() + 1
+                self._write_full(generation, products, promo_rules or {})
+                self._reserve_ids_locked(max((p.id for p in products), default=0))
+                self._commit(generation)
+            finally:
+                fcntl.flock(users, fcntl.LOCK_SH)
+        return True
+
+    def _write_full(self, generation: int, products: Iterable[Product], promo_rules: Dict[int, PromoRule]):
+        products = sorted(products, key=lambda p: p.id)
+        marcas: List[str] = []
+        marca_codes: Dict[str, int] = {}
+        marca_column = []
+        text_parts: List[bytes] = []
+        starts, ends, position = [], [], 0
+        for product in products:
+            if product.marca is None:
+                marca_column.append(-1)
+            else:
+                code = marca_codes.get(product.marca)
+                if code is None:
+                    code = marca_codes[product.marca] = len(marcas)
+                    marcas.append(product.marca)
+                marca_column.append(code)
+            for value in (product.nombre, product.descripcion, product.modelo, product.codigo):
+                start, end, position = _encode_text(value, text_parts, position)
+                starts.append(start)
+                ends.append(end)
+        _write_text(_text_path(self.directory, generation), starts, ends, b"".join(text_parts), marcas)
+        promo_columns = [_promo_columns(promo_rules.get(p.id)) for p in products]
+        _write_columns(
+            _generation_path(self.directory, generation), generation, generation, generation, [],
+            [p.id for p in products], [p.precio for p in products], [p.stock for p in products], marca_column,
+            [p.isPromo for p in products], [p.isNew for p in products],
+            [percent for percent, _ in promo_columns], [min_quantity for _, min_quantity in promo_columns],
+        )
+
+    def upsert(self, product: Product, promo_rule: Optional[PromoRule] = None):
+        """
+        Encola el alta o el cambio de `product` (con su regla de promoción específica, si tiene) para la
+        próxima generación. Los demás workers lo ven en changed_since() una vez publicada.
+        """
+        with self._pending_lock:
+            self._pending_products[product.id] = (product.model_copy(), promo_rule)
+        self._schedule()
+
+    def is_pending(self, product_id: int) -> bool:
+        """
+        True si este worker tiene un cambio del producto que todavía no se publica.
+        """
+        with self._pending_lock:
+            return product_id in self._pending_products
+
+    def stock(self, product_id: int) -> Optional[int]:
+        """
+        Stock vigente del producto para todos los workers (None si no existe).
+        """
+        snapshot = self.current()
+        row = snapshot._row_for(product_id) if snapshot is not None else None
+        if row is not None:
+            return int(snapshot._stock[row])
+        with self._pending_lock:
+            entry = self._pending_products.get(product_id)
+            return entry[0].stock if entry is not None else None
+
+    def adjust_stocks(self, changes: Dict[int, int]) -> Optional[Dict[int, int]]:
+        """
+        Aplica los cambios de stock {product_id: delta} todos o ninguno, y devuelve el stock resultante de cada
+        producto. Devuelve None sin cambiar nada si algún producto no existe o quedaría con stock negativo.
+        """
+        with self._file_lock():
+            snapshot = self.current()
+            with self._pending_lock:
+                targets = []
+                for product_id, delta in changes.items():
+                    row = snapshot._row_for(product_id) if snapshot is not None else None
+                    if row is not None:
+                        stock = int(snapshot._stock[row])
+                    else:
+                        # Alta de este worker que todavía no se publica
+                        pending = self._pending_products.get(product_id)
+                        if pending is None:
+                            return None
+                        stock = pending[0].stock
+                    if stock + delta < 0:
+                        return None
+                    targets.append((product_id, row, stock + delta))
+                for product_id, row, stock in targets:
+                    if row is not None:
+                        snapshot._stock[row] = stock # Escritura alineada de 8 bytes: los lectores ven el valor viejo o el nuevo
+                    else:
+                        self._pending_products[product_id][0].stock = stock
+        return {product_id: stock for product_id, _, stock in targets}
+
+    def adjust_stock(self, product_id: int, quantity_change: int) -> Optional[int]:
+        result = self.adjust_stocks({product_id: quantity_change})
+        return result[product_id] if result is not None else None
+
+    def _schedule(self):
+        if self._publisher is None:
+            with self._pending_lock:
+                if self._publisher is None:
+                    self._publisher = threading.Thread(target=self._publish_loop, name="catalog-publisher", daemon=True)
+                    self._publisher.start()
+        self._wakeup.set()
+
+    def _publish_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error al publicar una generación del catálogo compartido: {e}")
+                self._wakeup.set() # Los cambios volvieron a quedar pendientes: reintentar tras el intervalo
+            time.sleep(self.publish_interval) # Agrupa los cambios que lleguen mientras tanto
+
+    def flush(self) -> int:
+        """
+        Publica ahora los cambios pendientes como una nueva generación y devuelve la generación vigente.
+        """
+        if not self._pending_products:
+            return self._current_generation()
+        # Se toman los pendientes bajo el bloqueo de archivo: adjust_stocks() no puede quedar entre
+        # que un alta sale de la cola y aparece en la generación nueva
+        with self._file_lock():
+            with self._pending_lock:
+                products, self._pending_products = self._pending_products, {}
+            if not products:
+                return self._current_generation()
+            try:
+                base = self.current()
+                generation = self._current_generation() + 1
+                if base is None:
+                    self._write_full(
+                        generation, [product for product, _ in products.values()],
+                        {product_id: rule for product_id, (_, rule) in products.items() if rule is not None},
+                    )
+                else:
+                    self._write_merged(generation, base, products)
+                self._commit(generation)
+            except BaseException:
+                # Devolver los cambios para el próximo intento, sin pisar los que llegaron mientras tanto
+                with self._pending_lock:
+                    for product_id, entry in products.items():
+                        self._pending_products.setdefault(product_id, entry)
+                raise
+        return generation
+
+    def _write_merged(self, generation: int, base: CatalogSnapshot, entries: Dict[int, Tuple[Product, Optional[PromoRule]]]):
+        products = {product_id: product for product_id, (product, _) in entries.items()}
+        ids = base._ids.copy()
+        precio = base._precio.copy()
+        stock = base._stock.copy()
+        marca = base._marca.copy()
+        is_promo = base._is_promo.copy()
+        is_new = base._is_new.copy()
+        promo_percent = base._promo_percent.copy()
+        promo_min = base._promo_min.copy()
+        # Registro de cambios para que los demás workers sincronicen sólo lo que cambió; si crece demasiado,
+        # la generación pasa a ser la base y los lectores atrasados comparan el catálogo completo
+        changes = np.concatenate([base._changes, np.array([(generation, product_id) for product_id in products], dtype=np.int64).ravel()])
+        base_generation = base.base_generation
+        if len(changes) // 2 > CATALOG_MAX_CHANGES:
+            changes, base_generation = changes[:0], generation
+        # El texto se reescribe sólo si alguna alta o cambio lo toca; si no, se reutiliza el bloque de la base
+        text_changed = False
+        for product in products.values():
+            row = base._row_for(product.id)
+            new_marca = product.marca is not None and product.marca not in base._marca_codes # Las marcas viven en el bloque de texto
+            if row is None or new_marca or base._text[row] != (product.nombre, product.descripcion, product.modelo, product.codigo):
+                text_changed = True
+                break
+        text_generation = base.text_generation
+        text_starts, text_ends = base._text._starts, base._text._ends
+        marcas = list(base._marcas)
+        marca_codes = dict(base._marca_codes)
+        if text_changed:
+            text_generation = generation
+            text_starts = text_starts.copy()
+            text_ends = text_ends.copy()
+            text_parts = [bytes(base._text._blob)]
+            position = len(text_parts[0])
+
+        new_rows: List[Tuple] = []
+        for product in products.values():
+            # El texto del producto se agrega al final del bloque; el texto reemplazado queda sin referencias
+            fields = []
+            if text_changed:
+                for value in (product.nombre, product.descripcion, product.modelo, product.codigo):
+                    start, end, position = _encode_text(value, text_parts, position)
+                    fields.append((start, end))
+            if product.marca is None:
+                code = -1
+            else:
+                code = marca_codes.get(product.marca)
+                if code is None:
+                    code = marca_codes[product.marca] = len(marcas)
+                    marcas.append(product.marca)
+            row = base._row_for(product.id)
+            if row is None:
+                new_rows.append((product, code, fields))
+                continue
+            # El stock de una fila existente es el de la generación vigente (se actualiza en su lugar);
+            # el del producto encolado puede estar desactualizado o incluir ventas ya descontadas ahí
+            precio[row], marca[row] = product.precio, code
+            is_promo[row], is_new[row] = product.isPromo, product.isNew
+            promo_percent[row], promo_min[row] = _promo_columns(entries[product.id][1])
+            base_index = row * _TEXT_FIELDS
+            for i, (start, end) in enumerate(fields):
+                text_starts[base_index + i], text_ends[base_index + i] = start, end
+
+        if new_rows:
+            ids = np.concatenate([ids, [p.id for p, _, _ in new_rows]])
+            precio = np.concatenate([precio, [p.precio for p, _, _ in new_rows]])
+            stock = np.concatenate([stock, np.array([p.stock for p, _, _ in new_rows], dtype=np.int64)])
+            marca = np.concatenate([marca, np.array([code for _, code, _ in new_rows], dtype=np.int32)])
+            is_promo = np.concatenate([is_promo, [p.isPromo for p, _, _ in new_rows]])
+            is_new = np.concatenate([is_new, [p.isNew for p, _, _ in new_rows]])
+            new_promo = [_promo_columns(entries[p.id][1]) for p, _, _ in new_rows]
+            promo_percent = np.concatenate([promo_percent, np.array([percent for percent, _ in new_promo], dtype=np.float64)])
+            promo_min = np.concatenate([promo_min, np.array([min_quantity for _, min_quantity in new_promo], dtype=np.int64)])
+            text_starts = np.concatenate([text_starts, [start for _, _, fields in new_rows for start, _ in fields]])
+            text_ends = np.concatenate([text_ends, [end for _, _, fields in new_rows for _, end in fields]])
+            if len(ids) > 1 and np.any(ids[:-1] > ids[1:]):
+                order = np.argsort(ids, kind="stable")
+                ids, precio, stock, marca, is_promo, is_new, promo_percent, promo_min = (
+                    column[order] for column in (ids, precio, stock, marca, is_promo, is_new, promo_percent, promo_min)
+                )
+                text_order = (order[:, None] * _TEXT_FIELDS + np.arange(_TEXT_FIELDS)).ravel()
+                text_starts, text_ends = text_starts[text_order], text_ends[text_order]
+
+        if text_changed:
+            _write_text(_text_path(self.directory, generation), text_starts, text_ends, b"".join(text_parts), marcas)
+        _write_columns(
+            _generation_path(self.directory, generation), generation, text_generation, base_generation, changes,
+            ids, precio, stock, marca, is_promo, is_new, promo_percent, promo_min,
+        )
+
+
+def shared_catalog_from_env() -> Optional[SharedCatalog]:
+    if not CATALOG_SHARED_DIR:
+        return None
+    return SharedCatalog(CATALOG_SHARED_DIR)
+
+
+# Benchmark de memoria por worker real de main:app y latencia de lectura: índice local por proceso frente a
+# catálogo compartido. Cada worker importa la app y carga el catálogo como al recuperar el journal
+# Uso: python -m app.services.shared_catalog [productos] [workers]
+if __name__ == "__main__":
+    import sys
+    import random
+    import tempfile
+    import multiprocessing
+
+    def make_products(count: int) -> List[Product]:
+        rng = random.Random(42)
+        return [
+            Product(
+                id=i, nombre=f"Producto {i}", descripcion="Herramienta de uso general.", precio=float(rng.randint(500, 200_000)),
+                modelo=f"M-{i % 1000}", marca=f"Marca{rng.randint(0, 199)}", codigo=f"COD{i:07d}", stock=rng.randint(0, 500),
+                isPromo=rng.random() < 0.1, isNew=rng.random() < 0.05,
+            )
+            for i in range(1, count + 1)
+        ]
+
+    def memory_kib() -> Tuple[int, int]:
+        # RSS cuenta completas las páginas compartidas; PSS las reparte entre los procesos que las mapean
+        values = {}
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key] = int(rest.split()[0])
+        return values["Rss"], values["Pss"]
+
+    def worker(mode: str, directory: str, count: int, barrier, results):
+        # El módulo de la app lee CATALOG_SHARED_DIR al importarse: cada worker la importa ya con su modo
+        os.environ["CATALOG_SHARED_DIR"] = directory if mode == "shared" else ""
+        os.environ["JOURNAL_DIR"] = ""
+        import gc
+        import main # noqa: F401 (la app completa, como la carga uvicorn)
+        from app.routes import products as products_routes
+        gc.collect()
+        base_rss, base_pss = memory_kib()
+        started = time.perf_counter()
+        # Lo que hace cada worker al arrancar: products_db recuperado, motor de precios, monitor de stock
+        # y el índice local o el catálogo compartido (que los demás workers ya publicaron)
+        products_routes.products_db[:] = make_products(count)
+        products_routes._after_products_recovered()
+        products_routes.start_shared_catalog()
+        startup = time.perf_counter() - started
+        catalog = products_routes.catalog_index
+        rng = random.Random()
+        latencies = []
+        for i in range(400):
+            started = time.perf_counter()
+            if i % 2:
+                catalog.get(rng.randint(1, count))
+            else:
+                catalog.query(promo=True, min_price=10_000, max_price=50_000, in_stock=True, sort_by="precio", limit=50)
+            latencies.append(time.perf_counter() - started)
+        gc.collect()
+        barrier.wait() # Todos los workers vivos a la vez, como en producción
+        rss, pss = memory_kib()
+        latencies.sort()
+        results.put((rss - base_rss, pss - base_pss, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], startup))
+        barrier.wait()
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    context = multiprocessing.get_context("fork") # Cada worker mide su memoria relativa a su propio inicio
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = SharedCatalog(directory)
+        started = time.perf_counter()
+        publisher.rebuild(make_products(count))
+        print(f"{count} productos, {workers} workers de main:app (generación publicada en {time.perf_counter() - started:.1f} s)")
+
+        for mode in ("local", "shared"):
+            barrier = context.Barrier(workers)
+            results = context.Queue()
+            processes = [context.Process(target=worker, args=(mode, directory, count, barrier, results)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            rows = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            rss = sum(r[0] for r in rows) / len(rows) / 1024
+            pss = sum(r[1] for r in rows) / len(rows) / 1024
+            p50 = sum(r[2] for r in rows) / len(rows) * 1e3
+            p99 = max(r[3] for r in rows) * 1e3
+            startup = max(r[4] for r in rows)
+            print(f"  {mode:<7} por worker: RSS +{rss:7.1f} MiB  PSS +{pss:7.1f} MiB  (total PSS {pss * workers:7.1f} MiB)  "
+                  f"arranque {startup:.1f} s  lectura p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+        print("  (en ambos modos cada worker mantiene su products_db, la tabla del motor de precios y el monitor de stock;"
+              " el catálogo compartido sólo reemplaza el índice columnar local)")
+
+        # Venta (stock en su lugar) y cambio de precio (generación nueva) vistos por un lector
+        reader = SharedCatalog(directory)
+        before = reader.get(1).stock
+        started = time.perf_counter()
+        for _ in range(1000):
+            publisher.adjust_stock(1, 0)
+        stock_us = (time.perf_counter() - started) / 1000 * 1e6
+        publisher.adjust_stock(1, -1 if before else 1)
+        assert reader.get(1).stock != before
+        product = publisher.get(1)
+        product.precio += 1
+        publisher.upsert(product)
+        started = time.perf_counter()
+        generation = publisher.flush()
+        publish_ms = (time.perf_counter() - started) * 1e3
+        started = time.perf_counter()
+        assert reader.current().generation == generation
+        print(f"  cambio de stock en su lugar: {stock_us:.1f} µs; publicar un cambio de precio: {publish_ms:.1f} ms; "
+              f"cambio de generación en el lector: {(time.perf_counter() - started) * 1e3:.3f} ms")
@@ -0,0 +1,181 @@
+import os
+import heapq
+import queue
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from app.models.product import Product
+from app.models.stock import StockAlert
+
+# Umbral de reposición para productos sin uno específico
+LOW_STOCK_DEFAULT_THRESHOLD = int(os.getenv("LOW_STOCK_DEFAULT_THRESHOLD", "10"))
+# Si se define, las alertas se envían por POST a esta URL además de registrarse en el log
+LOW_STOCK_WEBHOOK_URL = os.getenv("LOW_STOCK_WEBHOOK_URL")
+LOW_STOCK_ALERT_QUEUE_SIZE = int(os.getenv("LOW_STOCK_ALERT_QUEUE_SIZE", "1000"))
+
+AlertSink = Callable[[StockAlert], None]
+
+
+# --- DESTINOS DE ALERTAS ---
+
+def log_alert_sink(alert: StockAlert):
+    print(f"ALERTA de stock bajo: '{alert.nombre}' (ID {alert.product_id}) tiene {alert.stock} unidades (umbral {alert.reorder_threshold})")
+
+
+class WebhookAlertSink:
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, alert: StockAlert):
+        try:
+            requests.post(self.url, data=alert.model_dump_json(), headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Error al enviar alerta de stock al webhook: {e}")
+
+
+class AlertDispatcher:
+    """
+    Entrega las alertas a los destinos desde un hilo propio, para no bloquear el flujo de pedidos.
+    Si la cola se llena (destino lento o caído), las alertas nuevas se descartan y se cuentan.
+    """
+
+    def __init__(self, sinks: List[AlertSink], maxsize: int = LOW_STOCK_ALERT_QUEUE_SIZE):
+        self.sinks = sinks
+        self.dropped = 0
+        self._queue: "queue.Queue[StockAlert]" = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="stock-alerts", daemon=True)
+        self._thread.start()
+
+    def publish(self, alert: StockAlert):
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            for sink in self.sinks:
+                try:
+                    sink(alert)
+                except Exception as e:
+                    print(f"Error en el destino de alertas de stock: {e}")
+
+
+# --- ÍNDICE DE STOCK BAJO ---
+
+class StockMonitor:
+    """
+    Índice de stock bajo mantenido como un min-heap de (stock, product_id) que se actualiza en cada
+    cambio de stock. Las entradas viejas no se borran del heap: se descartan al salir (invalidación
+    perezosa), así que actualizar es O(log n) y obtener los k productos con menos stock es O(k log n).
+    También emite una alerta cuando el stock de un producto baja de su umbral de reposición.
+    """
+
+    def __init__(self, products: Iterable[Product], dispatcher: Optional[AlertDispatcher] = None, default_threshold: int = LOW_STOCK_DEFAULT_THRESHOLD):
+        self.default_threshold = default_threshold
+        self.dispatcher = dispatcher
+        self.recent_alerts: "deque[StockAlert]" = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._thresholds: Dict[int, int] = {}
+        self._stock: Dict[int, int] = {}
+        self._names: Dict[int, str] = {}
+        self._heap: List[Tuple[int, int]] = []
+        self.rebuild(products)
+
+    def rebuild(self, products: Iterable[Product]):
+        with self._lock:
+            self._stock = {p.id: p.stock for p in products}
+            self._names = {p.id: p.nombre for p in products}
+            self._heap = [(stock, product_id) for product_id, stock in self._stock.items()]
+            heapq.heapify(self._heap)
+
+    def threshold_for(self, product_id: int) -> int:
+        return self._thresholds.get(product_id, self.default_threshold)
+
+    def set_threshold(self, product_id: int, threshold: int):
+        """
+        Define el umbral de reposición de un producto y lo evalúa de inmediato: si el nuevo umbral
+        deja el stock actual por debajo (y el anterior no), se emite la alerta sin esperar otra venta.
+        """
+        alert = None
+        with self._lock:
+            previous = self.threshold_for(product_id)
+            self._thresholds[product_id] = threshold
+            stock = self._stock.get(product_id)
+            if stock is not None and previous < stock <= threshold:
+                alert = StockAlert(product_id=product_id, nombre=self._names[product_id], stock=stock, reorder_threshold=threshold)
+                self.recent_alerts.append(alert)
+
+        if alert is not None and self.dispatcher is not None:
+            self.dispatcher.publish(alert)
+
+    def put_threshold(self, product_id: int, threshold: int):
+        """
+        Registra el umbral sin evaluarlo (al reaplicar el journal).
+        """
+        with self._lock:
+            self._thresholds[product_id] = threshold
+
+    def thresholds(self) -> Dict[int, int]:
+        with self._lock:
+            return dict(self._thresholds)
+
+    def load_thresholds(self, thresholds: Dict[int, int]):
+        with self._lock:
+            self._thresholds = dict(thresholds)
+
+    def record(self, product: Product):
+        """
+        Registra el stock actual de un producto (llamar después de cada cambio de stock o alta).
+        """
+        alert = None
+        with self._lock:
+            previous = self._stock.get(product.id)
+            if previous == product.stock:
+                return
+            self._stock[product.id] = product.stock
+            self._names[product.id] = product.nombre
+            heapq.heappush(self._heap, (product.stock, product.id))
+            # Compactar si las entradas viejas superan a las vigentes
+            if len(self._heap) > 2 * len(self._stock) + 64:
+                self._heap = [(stock, product_id) for product_id, stock in self._stock.items()]
+                heapq.heapify(self._heap)
+
+            # La alerta se emite sólo al cruzar el umbral, no en cada venta por debajo de él
+            threshold = self.threshold_for(product.id)
+            if product.stock <= threshold and (previous is None or previous > threshold):
+                alert = StockAlert(product_id=product.id, nombre=product.nombre, stock=product.stock, reorder_threshold=threshold)
+                self.recent_alerts.append(alert)
+
+        if alert is not None and self.dispatcher is not None:
+            self.dispatcher.publish(alert)
+
+    def lowest(self, k: int) -> List[Tuple[int, str, int, int]]:
+        """
+        Devuelve los k productos con menos stock como (product_id, nombre, stock, umbral).
+        """
+        with self._lock:
+            heap = self._heap
+            found: List[Tuple[int, int]] = []
+            seen = set()
+            while heap and len(found) < k:
+                stock, product_id = heapq.heappop(heap)
+                if self._stock.get(product_id) != stock or product_id in seen:
+                    continue # Entrada obsoleta o duplicada: se descarta definitivamente
+                seen.add(product_id)
+                found.append((stock, product_id))
+            for entry in found:
+                heapq.heappush(heap, entry)
+            return [(product_id, self._names[product_id], stock, self.threshold_for(product_id)) for stock, product_id in found]
+
+
+def default_alert_dispatcher() -> AlertDispatcher:
+    sinks: List[AlertSink] = [log_alert_sink]
+    if LOW_STOCK_WEBHOOK_URL:
+        sinks.append(WebhookAlertSink(LOW_STOCK_WEBHOOK_URL))
+    return AlertDispatcher(sinks)
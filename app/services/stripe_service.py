@@ -2,16 +2,52 @@ import os
 import stripe
 from dotenv import load_dotenv
 from typing import List, Dict, Any, Optional
-import datetime
 
-# Importamos el modelo de productos de tu aplicación para obtener el precio real
-# Y la base de datos simulada de productos
-from app.routes.products import products_db # ¡AJUSTADO AQUÍ! Importamos directamente products_db
+# Importamos el motor de precios de tu aplicación para obtener el precio real
+from app.routes.products import pricing_engine, sync_shared_catalog # Motor de precios con la tabla precomputada del catálogo
 from app.models.payment import CheckoutItem # Importamos el modelo de los ítems de checkout
+from app.services.pricing_engine import UnknownProductError
+from app.services.payment_store import PaymentStore, StoredPayment, now_epoch
+from app.services.circuit_breaker import CircuitOpenError, breaker_from_env
+from app.services.journal import store_journal
 
 # Cargar variables de entorno del archivo .env
 load_dotenv()
 
+# Tiempo máximo de espera por llamada a la API de Stripe (el SDK usa 80 s por defecto)
+STRIPE_TIMEOUT_SECONDS = float(os.getenv("STRIPE_TIMEOUT_SECONDS", "10"))
+
+# Moneda del checkout: la del catálogo (CLP). Stripe trata el CLP como moneda sin decimales:
+# unit_amount y amount_total van en pesos enteros, no en centavos.
+CHECKOUT_CURRENCY = "clp"
+ZERO_DECIMAL_CURRENCIES = frozenset({"bif", "clp", "djf", "gnf", "jpy", "kmf", "krw", "mga", "pyg", "rwf", "ugx", "vnd", "vuv", "xaf", "xof", "xpf"})
+
+
+def to_stripe_amount(cents: int, currency: str) -> int:
+    """
+    Convierte centavos (como los entrega el motor de precios) a la unidad mínima que Stripe espera.
+    """
+    if currency.lower() in ZERO_DECIMAL_CURRENCIES:
+        return (cents + 50) // 100 # Redondeo al peso más cercano
+    return cents
+
+
+def from_stripe_amount(amount: int, currency: str) -> float:
+    """
+    Monto de Stripe (en su unidad mínima) expresado en la moneda.
+    """
+    if currency.lower() in ZERO_DECIMAL_CURRENCIES:
+        return float(amount)
+    return amount / 100.0
+
+
+def _is_stripe_outage(error: BaseException) -> bool:
+    """
+    Sólo los errores del lado de Stripe (conexión, límite de tasa, 5xx) abren el circuito;
+    un error de validación de la solicitud no dice nada sobre la salud del servicio.
+    """
+    return isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError))
+
 class StripeService:
     def __init__(self):
         # Configurar la clave secreta de Stripe
@@ -25,61 +61,57 @@ class StripeService:
             raise ValueError("Las claves STRIPE_SECRET_KEY y STRIPE_WEBHOOK_SECRET deben estar configuradas en .env")
 
         stripe.api_key = self.secret_key
+        stripe.default_http_client = stripe.new_default_http_client(timeout=STRIPE_TIMEOUT_SECONDS)
+        # Si Stripe falla o responde lento de forma sostenida, los checkouts fallan de inmediato (CircuitOpenError)
+        self.breaker = breaker_from_env("STRIPE_BREAKER", "stripe", is_failure=_is_stripe_outage)
 
-        # Para simular una "base de datos" de registros de pago locales
-        self.payment_records: List[Dict[str, Any]] = []
-        self._next_payment_id = 1
-
-    def _get_product_price_from_db(self, product_id: int) -> Optional[float]:
-        """
-        Función auxiliar para obtener el precio de un producto de tu base de datos simulada.
-        """
-        # Ahora usamos products_db directamente, que ya es una lista de objetos Product
-        for product_data in products_db:
-            if product_data.id == product_id:
-                return product_data.price
-        return None
+        # Para simular una "base de datos" de registros de pago locales (compacta, con archivado en disco)
+        self.payment_records = PaymentStore(journal=store_journal)
+        store_journal.register_store("payments", self.payment_records.dump, self.payment_records.load)
+        store_journal.register_op("payment.put", self.payment_records.replay_put)
+        # Los IDs continúan después del mayor ya usado (archivado o recuperado del journal)
+        store_journal.on_recovered(self.payment_records.resume_ids)
 
     def create_checkout_session(self, items: List[CheckoutItem], client_username: str, order_id: Optional[int] = None) -> Optional[str]:
         """
         Crea una sesión de checkout de Stripe.
         Devuelve la URL de la sesión de checkout.
+        Lanza CircuitOpenError sin llamar a Stripe si su circuit breaker está abierto.
         """
+        # Los precios salen del motor de precios (no del cliente), ya con promociones y en centavos enteros
+        sync_shared_catalog()
+        try:
+            quote = pricing_engine.quote(items)
+        except UnknownProductError as e:
+            print(f"Error: {e}")
+            return None # O lanzar una HTTPException
+
+        # Lo que se cobra por línea en la unidad de Stripe; el snapshot y el total reflejan exactamente eso
+        charged = [(line, to_stripe_amount(line.unit_price_cents, CHECKOUT_CURRENCY)) for line in quote.lines]
         line_items = []
-        total_amount = 0.0
-
-        for item in items:
-            # Obtener el precio real de tu "base de datos" de productos
-            product_price = self._get_product_price_from_db(item.product_id)
-            if product_price is None:
-                print(f"Error: Producto con ID {item.product_id} no encontrado en la base de datos de productos.")
-                return None # O lanzar una HTTPException
-
-            # Stripe espera el precio en centavos (o la unidad más pequeña de la moneda)
-            # Y debe ser un entero. Multiplicamos por 100 y convertimos a int.
-            unit_amount_cents = int(product_price * 100)
-            
+        for line, unit_amount in charged:
             line_items.append({
                 'price_data': {
-                    'currency': 'usd', # ¡Importante! Stripe Checkout solo soporta un conjunto limitado de monedas directamente. USD es muy común.
+                    'currency': CHECKOUT_CURRENCY, # Misma moneda en que cotiza el motor de precios
                     'product_data': {
-                        'name': item.name,
+                        'name': line.nombre,
                         'metadata': { # Puedes añadir metadata a Stripe para tu referencia
-                            'product_id': str(item.product_id),
+                            'product_id': str(line.product_id),
                         },
                     },
-                    'unit_amount': unit_amount_cents,
+                    'unit_amount': unit_amount,
                 },
-                'quantity': item.quantity,
+                'quantity': line.quantity,
             })
-            total_amount += (product_price * item.quantity)
+        total_amount = from_stripe_amount(sum(unit_amount * line.quantity for line, unit_amount in charged), CHECKOUT_CURRENCY)
 
         if not line_items:
             print("Error: No hay ítems válidos para crear la sesión de checkout.")
             return None
 
         try:
-            checkout_session = stripe.checkout.Session.create(
+            checkout_session = self.breaker.call(
+                stripe.checkout.Session.create,
                 line_items=line_items,
                 mode='payment', # Para pagos únicos
                 success_url=self.success_url + "?session_id={CHECKOUT_SESSION_ID}", # Stripe reemplaza {CHECKOUT_SESSION_ID}
@@ -87,31 +119,35 @@ class StripeService:
                 metadata={ # Puedes añadir metadata a la sesión de Stripe
                     'client_username': client_username,
                     'order_id': str(order_id) if order_id is not None else 'N/A',
-                    'total_amount_clp': str(round(total_amount, 2)) # Opcional: registrar el monto original en CLP si se usó conversión
+                    'total_amount_clp': str(round(total_amount, 2))
                 },
                 # Aquí puedes especificar un customer_email si ya lo tienes para precargar
                 # customer_email='cliente@ejemplo.com',
             )
             
             # Registrar el intento de pago localmente (puedes adaptarlo a tu PaymentRecord model)
-            payment_record_data = {
-                "id": self._next_payment_id,
-                "client_username": client_username,
-                "stripe_session_id": checkout_session.id,
-                "stripe_payment_intent_id": None, # Aún no disponible
-                "amount_total": total_amount, # Esto es el monto en tu moneda local si no se hizo conversión antes de enviar a Stripe
-                "currency": "USD", # La moneda que usó Stripe para el checkout
-                "status": "pending",
-                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "items_snapshot": [item.model_dump() for item in items], # Guarda un snapshot de los items
-                "order_id": order_id,
-            }
-            self.payment_records.append(payment_record_data)
-            self._next_payment_id += 1
+            now = now_epoch()
+            self.payment_records.add(StoredPayment(
+                id=self.payment_records.next_id(),
+                client_username=client_username,
+                stripe_session_id=checkout_session.id,
+                amount_total=total_amount,
+                currency=CHECKOUT_CURRENCY.upper(), # La moneda que usó Stripe para el checkout
+                status="pending",
+                created_at=now,
+                updated_at=now,
+                # Snapshot de los items con el precio realmente cobrado
+                items_snapshot=tuple(
+                    (line.product_id, line.nombre, int(round(from_stripe_amount(unit_amount, CHECKOUT_CURRENCY) * 100)), line.quantity)
+                    for line, unit_amount in charged
+                ),
+                order_id=order_id,
+            ))
             print(f"Sesión de checkout creada: {checkout_session.url}")
             return checkout_session.url
 
+        except CircuitOpenError:
+            raise # Falla rápida: la ruta responde 503 con Retry-After
         except stripe.error.StripeError as e:
             print(f"Error al crear sesión de checkout de Stripe: {e}")
             return None
@@ -150,15 +186,16 @@ class StripeService:
             # print(session) # Descomenta para ver la sesión completa
             
             # Actualizar tu registro de pago local
-            for record in self.payment_records:
-                if record["stripe_session_id"] == session.id:
-                    record["status"] = "paid"
-                    record["stripe_payment_intent_id"] = session.payment_intent # El Payment Intent ID real
-                    record["amount_total"] = session.amount_total / 100.0 # Convertir de centavos a la moneda
-                    record["currency"] = session.currency.upper()
-                    record["updated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-                    print(f"Pago registrado en base de datos local para sesión {session.id}. Status: {record['status']}")
-                    return record
+            record = self.payment_records.get(session.id)
+            if record is not None:
+                record.status = "paid"
+                record.stripe_payment_intent_id = session.payment_intent # El Payment Intent ID real
+                record.amount_total = from_stripe_amount(session.amount_total, session.currency) # De la unidad mínima de Stripe a la moneda
+                record.currency = session.currency.upper()
+                record.updated_at = now_epoch()
+                self.payment_records.save(record)
+                print(f"Pago registrado en base de datos local para sesión {session.id}. Status: {record.status}")
+                return record.to_dict()
             print(f"Advertencia: Sesión {session.id} completada, pero no encontrada en registros de pagos locales.")
 
 
@@ -181,11 +218,8 @@ class StripeService:
 
         return {"status": "success", "event_type": event['type']}
 
-    def get_payment_record_by_session_id(self, session_id: str) -> Optional[Dict[str, Any]]:
+    def get_payment_record_by_session_id(self, session_id: str) -> Optional[StoredPayment]:
         """
-        Obtiene un registro de pago local por su ID de sesión de Stripe.
+        Obtiene un registro de pago local por su ID de sesión de Stripe (incluye los archivados).
         """
-        for record in self.payment_records:
-            if record["stripe_session_id"] == session_id:
-                return record
-        return None
\ No newline at end of file
+        return self.payment_records.get(session_id)
\ No newline at end of file
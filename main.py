@@ -1,13 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes.products import router as products_router
+from fastapi.responses import JSONResponse
+from app.routes.products import router as products_router, shared_catalog, start_shared_catalog
 from app.routes.branches import router as branches_router
 from app.routes.sellers import router as sellers_router
 from app.routes.auth import router as auth_router
 from app.routes.orders import router as orders_router
 from app.routes.contact import router as contact_router
 from app.routes.currency import router as currency_router
-from app.routes.payments import router as payments_router 
+from app.routes.payments import router as payments_router, payment_reconciler
+from app.routes.analytics import router as analytics_router
+from app.routes.profiles import router as profiles_router
+from app.routes.circuit_breakers import router as circuit_breakers_router
+from app.routes.executors import router as executors_router
+from app.routes.exports import router as exports_router
+from app.services.journal import store_journal, JournalWriteError
+from app.services.profiler import ProfilingMiddleware, profiler
+from app.services.executors import all_executors
 
 app = FastAPI(title="FERREMAS API")
 
@@ -19,6 +28,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado por muestreo de solicitudes lentas o marcadas con X-Profile (ver /profiles)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Si el journal ya no puede escribir en disco, las mutaciones no son durables: se rechazan en lugar de colgarse
+@app.exception_handler(JournalWriteError)
+async def journal_write_error_handler(request: Request, exc: JournalWriteError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "El almacenamiento no está disponible. Intente nuevamente más tarde."}
+    )
+
+@app.on_event("startup")
+def start_background_jobs():
+    # Los executors se cierran al apagar: se recrean si la app vuelve a iniciar en el mismo proceso
+    for executor in all_executors():
+        executor.start()
+    # Restaurar los stores en memoria (último snapshot + cola del journal) antes de atender solicitudes
+    recovery = store_journal.recover()
+    print(f"Journal recuperado: {recovery}")
+    store_journal.start()
+    # Primera generación del catálogo compartido entre workers (o, si otro worker ya la publicó en este arranque, traerla)
+    start_shared_catalog()
+    if payment_reconciler:
+        payment_reconciler.start()
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    if payment_reconciler:
+        payment_reconciler.stop()
+    # Un snapshot al apagar deja la próxima recuperación sin cola que reaplicar
+    store_journal.snapshot()
+    store_journal.close()
+    if shared_catalog is not None:
+        shared_catalog.flush()
+    for executor in all_executors():
+        executor.shutdown()
+
 @app.get("/")
 def root():
     return {"message": "FERREMAS backend funcionando 🎉"}
@@ -30,4 +76,9 @@ app.include_router(sellers_router, prefix="", tags=["Vendedores"])
 app.include_router(orders_router, prefix="/orders", tags=["Pedidos"])
 app.include_router(contact_router, prefix="/contact", tags=["Contacto"])
 app.include_router(currency_router, prefix="/currency", tags=["Divisas"])
-app.include_router(payments_router, prefix="/payments", tags=["Pagos"]) 
\ No newline at end of file
+app.include_router(payments_router, prefix="/payments", tags=["Pagos"])
+app.include_router(analytics_router, prefix="/analytics", tags=["Analítica"])
+app.include_router(profiles_router, prefix="/profiles", tags=["Perfilado"])
+app.include_router(circuit_breakers_router, prefix="/circuit-breakers", tags=["Monitoreo"])
+app.include_router(executors_router, prefix="/executors", tags=["Monitoreo"])
+app.include_router(exports_router, prefix="/exports", tags=["Exportaciones"])
@@ -0,0 +1,29 @@
+import asyncio
+
+from app.services.catalog_events import CatalogBroadcaster
+
+
+def subscribe_and_drain(broadcaster, last_event_id):
+    async def run():
+        subscriber = broadcaster._subscribe(last_event_id)
+        return [(broadcaster.event_id(number), event_type) for number, event_type, _, _ in broadcaster._drain(subscriber)]
+    return asyncio.run(run())
+
+
+def test_resume_from_own_event_id():
+    broadcaster = CatalogBroadcaster()
+    for product_id in (1, 2, 3):
+        broadcaster.publish("stock", product_id, {"product_id": product_id})
+    assert subscribe_and_drain(broadcaster, broadcaster.event_id(1)) == [
+        (broadcaster.event_id(2), "stock"), (broadcaster.event_id(3), "stock"),
+    ]
+
+
+def test_event_id_from_another_worker_gets_a_reset():
+    this_worker, other_worker = CatalogBroadcaster(), CatalogBroadcaster()
+    for broadcaster in (this_worker, other_worker):
+        broadcaster.publish("stock", 1, {"product_id": 1})
+        broadcaster.publish("stock", 2, {"product_id": 2})
+    # El mismo número de evento en otro worker (o en otro arranque) no dice nada de lo que se perdió
+    assert subscribe_and_drain(this_worker, other_worker.event_id(1)) == [(this_worker.event_id(2), "reset")]
+    assert subscribe_and_drain(this_worker, "42") == [(this_worker.event_id(2), "reset")]
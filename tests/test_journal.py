@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from app.services import journal as journal_module
+from app.services.journal import Journal, JournalWriteError
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path / "journal"), fsync_policy="always", snapshot_interval_seconds=1e9, snapshot_every_records=10**12)
+    journal.recover()
+    journal.start()
+    yield journal
+    journal.close()
+
+
+def fail(fd):
+    raise OSError("disco lleno")
+
+
+def test_failing_fsync_fails_waiters_instead_of_hanging(journal, monkeypatch):
+    assert journal.append("order.put", [1]) == 1
+    monkeypatch.setattr(journal_module.os, "fsync", fail)
+    with pytest.raises(JournalWriteError):
+        journal.append("order.put", [2]) # Con "always" espera su fsync: falla en lugar de quedar bloqueado
+    monkeypatch.undo()
+    # El escritor ya no está: las mutaciones siguientes se rechazan de inmediato
+    with pytest.raises(JournalWriteError):
+        journal.append("order.put", [3], wait=False)
+    with pytest.raises(JournalWriteError):
+        asyncio.run(journal.sync_async(2))
+
+
+def test_restart_after_failure_writes_again(journal, monkeypatch):
+    monkeypatch.setattr(journal_module.os, "fsync", fail)
+    with pytest.raises(JournalWriteError):
+        journal.append("order.put", [1])
+    monkeypatch.undo()
+    journal.close()
+    journal.recover() # Como al reiniciar la app en el mismo proceso
+    journal.start()
+    lsn = journal.append("order.put", [2])
+    assert journal._durable_lsn == lsn
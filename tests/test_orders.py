@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from app.auth.auth_settings import create_access_token
+from app.routes.products import get_product_by_id_from_db
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def client_headers():
+    return {"Authorization": "Bearer " + create_access_token({"sub": "ignacio_tapia"})}
+
+
+def test_short_line_leaves_earlier_lines_untouched(client):
+    hammer, drill = get_product_by_id_from_db(1), get_product_by_id_from_db(2)
+    before = (hammer.stock, drill.stock)
+    response = client.post("/orders/", headers=client_headers(), json={"items": [
+        {"product_id": 1, "quantity": 1},
+        {"product_id": 2, "quantity": drill.stock + 1},
+    ]})
+    assert response.status_code == 400
+    assert (hammer.stock, drill.stock) == before
+
+
+def test_repeated_product_is_checked_against_its_total_quantity(client):
+    hammer = get_product_by_id_from_db(1)
+    before = hammer.stock
+    response = client.post("/orders/", headers=client_headers(), json={"items": [
+        {"product_id": 1, "quantity": before},
+        {"product_id": 1, "quantity": 1},
+    ]})
+    assert response.status_code == 400
+    assert hammer.stock == before
@@ -0,0 +1,147 @@
+import stripe
+import pytest
+
+from app.services import payment_reconciler as reconciler_module
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.payment_reconciler import PaymentReconciler
+from app.services.payment_store import PaymentStore, StoredPayment, now_epoch
+
+
+class StubStripe:
+    """
+    Stub local de Stripe: sesiones por ID y errores programados por sesión.
+    Hace las veces de StripeService (payment_records y breaker) y de fetch_session.
+    """
+
+    def __init__(self, tmp_path):
+        self.payment_records = PaymentStore(archive_path=str(tmp_path / "archive.ndjson"))
+        self.breaker = CircuitBreaker("stripe-test")
+        self.sessions = {}
+        self.errors = {} # session_id -> lista de excepciones a lanzar antes de responder
+        self.calls = []
+
+    def get_payment_record_by_session_id(self, session_id):
+        return self.payment_records.get(session_id)
+
+    def add_pending(self, session_id, age_seconds=3600, **session):
+        created = now_epoch() - age_seconds
+        self.payment_records.add(StoredPayment(
+            id=len(self.payment_records) + 1, client_username="ignacio_tapia", stripe_session_id=session_id,
+            amount_total=45200.0, currency="CLP", status="pending", created_at=created, updated_at=created,
+        ))
+        self.sessions[session_id] = {
+            "payment_status": "unpaid", "status": "open", "payment_intent": None,
+            "amount_total": None, "currency": None, **session,
+        }
+
+    def fetch_session(self, session_id):
+        self.calls.append(session_id)
+        pending_errors = self.errors.get(session_id)
+        if pending_errors:
+            raise pending_errors.pop(0)
+        return self.sessions[session_id]
+
+
+@pytest.fixture
+def stub(tmp_path):
+    return StubStripe(tmp_path)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(reconciler_module.time, "sleep", slept.append)
+    return slept
+
+
+def make_reconciler(stub, **kwargs):
+    return PaymentReconciler(stub, fetch_session=stub.fetch_session, stale_after_seconds=60, **kwargs)
+
+
+def test_pending_to_paid(stub):
+    stub.add_pending("cs_paid", payment_status="paid", status="complete", payment_intent="pi_1", amount_total=45200, currency="clp")
+    stats = make_reconciler(stub).run_once()
+
+    record = stub.payment_records.get("cs_paid")
+    assert record.status == "paid"
+    assert record.stripe_payment_intent_id == "pi_1"
+    assert record.amount_total == 45200.0 # CLP no tiene decimales en Stripe
+    assert record.currency == "CLP"
+    assert stats["last_checked"] == 1 and stats["last_updated"] == 1
+
+
+def test_pending_to_expired(stub):
+    stub.add_pending("cs_expired", status="expired")
+    make_reconciler(stub).run_once()
+
+    assert stub.payment_records.get("cs_expired").status == "expired"
+
+
+def test_open_and_recent_sessions_stay_pending(stub):
+    stub.add_pending("cs_open")
+    stub.add_pending("cs_recent", age_seconds=0, payment_status="paid")
+    stats = make_reconciler(stub).run_once()
+
+    assert stub.payment_records.get("cs_open").status == "pending"
+    assert stub.payment_records.get("cs_recent").status == "pending"
+    assert stub.calls == ["cs_open"] # El registro reciente no se consulta
+    assert stats["last_updated"] == 0
+
+
+def test_backoff_after_transient_errors(stub, sleeps):
+    stub.add_pending("cs_flaky", payment_status="paid", payment_intent="pi_2", amount_total=45200, currency="clp")
+    stub.errors["cs_flaky"] = [stripe.error.RateLimitError("lento"), stripe.error.APIConnectionError("caído")]
+    stats = make_reconciler(stub, max_retries=3, backoff_base_seconds=1.0).run_once()
+
+    assert stub.calls == ["cs_flaky"] * 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0 # Jitter completo sobre base * 2^intento
+    assert stub.payment_records.get("cs_flaky").status == "paid"
+    assert stats["last_failed"] == 0
+
+
+def test_gives_up_after_max_retries(stub, sleeps):
+    stub.add_pending("cs_down")
+    stub.errors["cs_down"] = [stripe.error.APIConnectionError("caído") for _ in range(5)]
+    stats = make_reconciler(stub, max_retries=2).run_once()
+
+    assert stub.calls == ["cs_down"] * 3
+    assert len(sleeps) == 2
+    assert stub.payment_records.get("cs_down").status == "pending"
+    assert stats["last_failed"] == 1
+
+
+def test_non_retryable_error_is_not_retried(stub, sleeps):
+    stub.add_pending("cs_invalid")
+    stub.errors["cs_invalid"] = [stripe.error.InvalidRequestError("no existe", "id")]
+    stats = make_reconciler(stub).run_once()
+
+    assert stub.calls == ["cs_invalid"]
+    assert sleeps == []
+    assert stats["last_failed"] == 1
+
+
+def test_reconcile_session_makes_a_single_attempt(stub, sleeps):
+    stub.add_pending("cs_success", payment_status="paid", payment_intent="pi_3", amount_total=45200, currency="clp")
+    stub.errors["cs_success"] = [stripe.error.APIConnectionError("caído")]
+    reconciler = make_reconciler(stub)
+
+    assert reconciler.reconcile_session("cs_success").status == "pending"
+    assert stub.calls == ["cs_success"] and sleeps == [] # Sin backoff en la ruta del usuario
+    assert reconciler.reconcile_session("cs_success").status == "paid"
+
+
+def test_open_breaker_skips_stripe(stub, sleeps):
+    stub.add_pending("cs_a")
+    stub.add_pending("cs_b")
+    stub.errors["cs_a"] = [stripe.error.APIConnectionError("caído") for _ in range(5)]
+    stub.breaker = CircuitBreaker("stripe-test", min_calls=2, window_size=2, jitter=0)
+    reconciler = make_reconciler(stub, max_retries=1, max_concurrency=1) # En orden: cs_a abre el circuito antes de cs_b
+
+    stats = reconciler.run_once() # Dos fallas abren el circuito; cs_b ya no llega a Stripe
+    assert stats["last_failed"] == 2
+    assert stub.calls == ["cs_a", "cs_a"] and stub.breaker.state == "open"
+    calls = len(stub.calls)
+    with pytest.raises(CircuitOpenError):
+        reconciler.reconcile_session("cs_b") # /payments/success responde 503 con Retry-After
+    assert len(stub.calls) == calls
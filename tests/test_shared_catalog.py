@@ -0,0 +1,102 @@
+import pytest
+
+from app.models.product import Product
+from app.models.pricing import PromoRule
+from app.services import shared_catalog as shared_catalog_module
+from app.services.shared_catalog import SharedCatalog
+
+
+def make_product(product_id, stock=10, **fields):
+    data = {"nombre": f"Producto {product_id}", "precio": 1000.0, "codigo": f"COD{product_id}", "marca": "MarcaX", **fields}
+    return Product(id=product_id, stock=stock, **data)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = SharedCatalog(str(tmp_path / "catalog"))
+    catalog.rebuild([make_product(1), make_product(2)])
+    return catalog
+
+
+def test_upsert_then_sale_before_flush_counts_the_sale_once(catalog):
+    # Cambio de precio de un producto vivo y una venta antes de que se publique la generación nueva
+    product = make_product(1)
+    product.precio = 900.0
+    catalog.upsert(product)
+    assert catalog.adjust_stock(1, -3) == 7
+    product.stock = 7 # products_db refleja la venta en el mismo objeto
+    catalog.flush()
+    assert catalog.get(1).stock == 7
+    assert catalog.get(1).precio == 900.0
+
+
+def test_sale_of_unpublished_product_is_kept(catalog):
+    catalog.upsert(make_product(3, stock=5))
+    assert catalog.adjust_stock(3, -2) == 3
+    catalog.flush()
+    assert catalog.get(3).stock == 3
+
+
+def test_stock_changes_are_in_place_and_visible_to_other_workers(catalog, tmp_path):
+    other = SharedCatalog(str(tmp_path / "catalog"))
+    generation = catalog.generation
+    assert catalog.adjust_stock(2, -4) == 6
+    assert catalog.generation == generation # Una venta no crea una generación nueva
+    assert other.get(2).stock == 6
+    assert other.adjust_stock(2, -6) == 0
+    assert catalog.get(2).stock == 0
+
+
+def test_adjust_stocks_is_all_or_nothing(catalog):
+    assert catalog.adjust_stocks({1: -5, 2: -11}) is None
+    assert catalog.adjust_stocks({1: -5, 99: -1}) is None
+    assert (catalog.get(1).stock, catalog.get(2).stock) == (10, 10)
+    assert catalog.adjust_stocks({1: -5, 2: -10}) == {1: 5, 2: 0}
+
+
+def test_price_change_reuses_text_block(catalog):
+    text_generation = catalog.current().text_generation
+    catalog.upsert(make_product(1, precio=500.0))
+    catalog.flush()
+    assert catalog.current().text_generation == text_generation
+    catalog.upsert(make_product(1, nombre="Martillo nuevo"))
+    catalog.flush()
+    assert catalog.current().text_generation == catalog.generation
+    assert catalog.get(1).nombre == "Martillo nuevo"
+
+
+def test_failed_publish_keeps_pending_changes(catalog, monkeypatch):
+    catalog.upsert(make_product(1, precio=800.0))
+
+    def fail(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(shared_catalog_module, "_write_columns", fail)
+    with pytest.raises(OSError):
+        catalog.flush()
+    monkeypatch.undo()
+    catalog.flush()
+    assert catalog.get(1).precio == 800.0
+
+
+def test_product_ids_are_unique_across_workers(catalog, tmp_path):
+    other = SharedCatalog(str(tmp_path / "catalog"))
+    # El ID local de cada worker puede estar atrasado: la reserva compartida nunca repite uno
+    ids = [catalog.allocate_product_id(3), other.allocate_product_id(3), catalog.allocate_product_id(3)]
+    assert ids == [3, 4, 5]
+    assert other.allocate_product_id(10) == 10
+
+
+def test_changes_and_promo_rules_reach_other_workers(catalog, tmp_path):
+    other = SharedCatalog(str(tmp_path / "catalog"))
+    synced = other.current().generation
+    rule = PromoRule(percent_off=15, min_quantity=2)
+    catalog.upsert(make_product(3), rule)
+    catalog.upsert(make_product(1, precio=700.0))
+    catalog.flush()
+    snapshot = other.current()
+    assert snapshot.changed_since(synced) == [1, 3]
+    assert snapshot.changed_since(snapshot.generation) == []
+    assert snapshot.changed_since(synced - 1) is None # Anterior a la última publicación completa
+    assert snapshot.promo_rule(3) == rule
+    assert snapshot.promo_rule(1) is None
@@ -0,0 +1,15 @@
+from app.models.product import Product
+from app.services.stock_monitor import StockMonitor
+
+
+def make_product(product_id, stock):
+    return Product(id=product_id, nombre=f"Producto {product_id}", precio=1000.0, codigo=f"COD{product_id}", stock=stock)
+
+
+def test_raising_threshold_above_stock_alerts_once():
+    monitor = StockMonitor([make_product(1, 50)], default_threshold=10)
+    monitor.set_threshold(1, 60)
+    assert [(a.product_id, a.stock, a.reorder_threshold) for a in monitor.recent_alerts] == [(1, 50, 60)]
+    monitor.set_threshold(1, 70) # Ya estaba por debajo del umbral anterior: no se repite
+    monitor.set_threshold(1, 20)
+    assert len(monitor.recent_alerts) == 1